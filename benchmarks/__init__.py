@@ -0,0 +1,22 @@
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Benchmarks for fsTimer. They do not need Gtk, and are run from the
+   top of the source tree, e.g. python3 -m benchmarks.bench_time_ops
+   bench_race times the main steps of a race on synthetic projects of
+   growing size, made by generate.'''
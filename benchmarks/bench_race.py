@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''End-to-end benchmark of fsTimer on synthetic races of growing size.
+   Each step is timed for every size, and the report shows how its time
+   grows with the number of runners. A step whose time is expected to go
+   over the budget is skipped.
+   Usage: python3 -m benchmarks.bench_race [--budget seconds] [sizes...]'''
+
+import argparse
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+import types
+from collections import defaultdict
+from benchmarks.generate import write_project, PASSID, TIMEBTN
+from fstimer.printer import formatter
+from fstimer.printer.divindex import DivisionIndex
+from fstimer.reg_ops import (read_csv, import_prereg, load_registrations,
+                             compile_registrations, build_timing_dict)
+from fstimer.timingengine import TimingEngine
+from fstimer.timinglog import TimingLog
+
+SIZES = [1000, 10000, 100000]
+
+def make_pytimer(files):
+    '''Returns an object with the attributes of a PyTimer used by the
+       printouts, for a generated project'''
+    pytimer = types.SimpleNamespace(**files['settings'])
+    pytimer.path = os.path.dirname(files['reg'])
+    pytimer.passid = PASSID
+    # The timing dictionary of all of the registrations with an ID
+    regs = [reg for reg in load_registrations(files['registrations'])
+            if reg['ID']]
+    timedict = build_timing_dict(regs)[0]
+    pytimer.timedict = timedict
+    pytimer.timing = defaultdict(lambda: defaultdict(str))
+    pytimer.timing.update(timedict)
+    with open(files['times'], 'r', encoding='utf-8') as fin:
+        pytimer.rawtimes = TimingLog.from_dict(json.load(fin)['rawtimes'])
+    pytimer.timewin = types.SimpleNamespace(timestr='bench')
+    pytimer.standings = None
+    return pytimer
+
+def reset_standings(pytimer):
+    '''Drops the live standings, so the next printout starts from scratch'''
+    if pytimer.standings is not None:
+        pytimer.standings.close()
+    pytimer.standings = None
+
+def step_merge_compreg(ctx):
+    compile_registrations(ctx['files']['registrations'],
+                          ctx['files']['settings']['fields'])
+
+def step_import(ctx):
+    fields = ctx['files']['settings']['fields']
+    csvreg = read_csv(ctx['files']['prereg'])
+    fields_mapping = {field: (lambda reg, field=field: reg.get(field, ''))
+                      for field in fields}
+    import_prereg(csvreg, fields, ctx['files']['settings']['fieldsdic'],
+                  fields_mapping)
+
+def step_resume_times(ctx):
+    pytimer = ctx['pytimer']
+    engine = TimingEngine(pytimer.path, TimingLog(), pytimer.timing,
+                          pytimer.numlaps, TIMEBTN, pytimer.projecttype,
+                          timestr='bench', journal=False)
+    engine.load(ctx['files']['times'], False)
+
+def timing_dict_file(ctx):
+    '''Returns the name of the timing dictionary file of the race, written
+       on first use'''
+    if 'timedict' not in ctx['files']:
+        pytimer = ctx['pytimer']
+        filename = os.path.join(pytimer.path, 'bench_timing_dict.json')
+        with open(filename, 'w', encoding='utf-8') as fout:
+            json.dump(pytimer.timedict, fout)
+        ctx['files']['timedict'] = filename
+    return ctx['files']['timedict']
+
+def step_load_json(ctx):
+    with open(timing_dict_file(ctx), 'r', encoding='utf-8') as fin:
+        json.load(fin)
+
+def get_divisions(timing, tag, divisions, fieldsdic):
+    '''the former formatter.get_divisions, which checks every division.
+       It is the reference for the divisions DivisionIndex finds.'''
+    mydivs = []
+    # go through the divisions
+    for div in divisions:
+        # check all fields
+        for field in div[1]:
+            if fieldsdic[field]['type'] == 'entrybox_int':
+                try:
+                    val = int(timing[tag][field])
+                    if val < div[1][field][0] or val > div[1][field][1]:
+                        break
+                except ValueError:
+                    break
+            else:
+                if timing[tag][field] != div[1][field]:
+                    break
+        else:
+            mydivs.append(div[0])
+    return mydivs
+
+def step_get_divisions(ctx):
+    pytimer = ctx['pytimer']
+    for tag in pytimer.timedict:
+        get_divisions(pytimer.timing, tag, pytimer.divisions,
+                      pytimer.fieldsdic)
+
+def step_division_index(ctx):
+    pytimer = ctx['pytimer']
+    divindex = DivisionIndex(pytimer.divisions, pytimer.fieldsdic)
+    for tag in pytimer.timedict:
+        divindex.get_divisions(pytimer.timing[tag])
+
+def step_print_startsheets(ctx):
+    formatter.print_startsheets(ctx['pytimer'], False)
+
+def step_print_times(ctx):
+    reset_standings(ctx['pytimer'])
+    formatter.print_times(ctx['pytimer'], False)
+
+def step_print_times_live(ctx):
+    pytimer = ctx['pytimer']
+    if pytimer.standings is None:
+        formatter.print_times(pytimer, False)
+    # One more finisher, then the printout
+    pytimer.rawtimes.add_id(next(iter(pytimer.timedict)))
+    pytimer.rawtimes.add_time('9:59:59.9')
+    formatter.print_times(pytimer, False)
+
+def step_print_awards(ctx):
+    formatter.print_awards(ctx['pytimer'], False)
+
+def step_print_times_laps(ctx):
+    reset_standings(ctx['laps'])
+    formatter.print_times(ctx['laps'], False)
+
+STEPS = [('merge_compreg', step_merge_compreg),
+         ('import csv', step_import),
+         ('resume_times', step_resume_times),
+         ('timing dict, json', step_load_json),
+         ('get_divisions', step_get_divisions),
+         ('division index', step_division_index),
+         ('print_startsheets', step_print_startsheets),
+         ('print_times', step_print_times),
+         ('print_times, live', step_print_times_live),
+         ('print_awards', step_print_awards),
+         ('print_times, 3 laps hcp', step_print_times_laps)]
+
+def timeit(fn, ctx, repeat=3):
+    '''Returns the best duration of fn(ctx) over a few runs, in seconds.
+       Slow steps are only run once.'''
+    best = None
+    for i_unused in range(repeat):
+        start = time.perf_counter()
+        fn(ctx)
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+        if duration > 1.:
+            break
+    return best
+
+def estimate(durations, sizes, size):
+    '''Estimates the duration of a step for size from the previous
+       measures, assuming it grows as a power of the size (at least
+       linearly)'''
+    measured = [(s, d) for s, d in zip(sizes, durations) if d is not None]
+    if not measured:
+        return 0.
+    s2, d2 = measured[-1]
+    power = 1.
+    if len(measured) > 1:
+        s1, d1 = measured[-2]
+        if d1 > 0 and d2 > 0 and s2 != s1:
+            power = max(1., math.log(d2 / d1) / math.log(s2 / s1))
+    return d2 * (size / s2) ** power
+
+def run(sizes=SIZES, budget=60.):
+    '''Runs the benchmark for each size and prints a report'''
+    results = {name: [] for name, fn_unused in STEPS}
+    tmpdir = tempfile.mkdtemp(prefix='fstimer_bench_')
+    try:
+        for size in sizes:
+            ctx = {}
+            ctx['files'] = write_project(
+                os.path.join(tmpdir, 'race%d' % size), size)
+            ctx['pytimer'] = make_pytimer(ctx['files'])
+            ctx['laps'] = make_pytimer(write_project(
+                os.path.join(tmpdir, 'laps%d' % size), size, numlaps=3,
+                handicap=True))
+            for name, fn in STEPS:
+                durations = results[name]
+                if estimate(durations, sizes, size) > budget:
+                    durations.append(None)
+                else:
+                    durations.append(timeit(fn, ctx))
+            print('%d runners done' % size, flush=True)
+    finally:
+        shutil.rmtree(tmpdir)
+    report(sizes, results)
+
+def report(sizes, results):
+    '''Prints the durations of the steps for each size, and the growth
+       factor between the last two sizes'''
+    print()
+    header = '%-24s' % 'step' + ''.join('%12s' % ('%d (s)' % s) for s in sizes)
+    if len(sizes) > 1:
+        header += '%10s' % 'growth'
+    print(header)
+    for name, durations in results.items():
+        line = '%-24s' % name
+        for d in durations:
+            line += '%12s' % ('skipped' if d is None else '%.4f' % d)
+        if len(sizes) > 1:
+            d1, d2 = durations[-2:]
+            if d1 and d2:
+                line += '%9.1fx' % (d2 / d1)
+            else:
+                line += '%10s' % '-'
+        print(line)
+    if len(sizes) > 1:
+        print('growth: ratio of the last two durations, for %.0fx more runners'
+              % (sizes[-1] / sizes[-2]))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='fsTimer end-to-end benchmark')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES,
+                        help='numbers of runners')
+    parser.add_argument('--budget', type=float, default=60.,
+                        help='skip a step expected to take longer (seconds)')
+    args = parser.parse_args()
+    run(args.sizes, args.budget)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Micro-benchmark of fstimer.time_ops against the former regex and
+   timedelta based implementation.
+   Usage: python3 -m benchmarks.bench_time_ops [number of times]'''
+
+import datetime
+import random
+import re
+import sys
+import time
+from fstimer.time_ops import parse_ms, parse_many, format_many, time_diff
+
+def regex_time_parse(dt):
+    '''the former time_ops.time_parse'''
+    if dt and dt[0] == '-':
+        return datetime.timedelta(0)
+    d = re.match(r'((?P<hours>\d+):)?(?P<minutes>\d+):(?P<seconds>\d+)(\.(?P<milliseconds>\d+))?', dt).groupdict(0)
+    d['milliseconds'] = int(d['milliseconds'])*100
+    return datetime.timedelta(**dict(((key, int(value)) for key, value in d.items())))
+
+def float_time_format(t):
+    '''the former time_ops.time_format'''
+    milli = int((t - int(t)) * 10)
+    hours, rem = divmod(int(t), 3600)
+    minutes, seconds = divmod(rem, 60)
+    if hours > 0:
+        return '%d:%02d:%02d.%01d' % (hours, minutes, seconds, milli)
+    return '%d:%02d.%01d' % (minutes, seconds, milli)
+
+def regex_time_diff(t1, t2):
+    '''the former time_ops.time_diff'''
+    delta_t = regex_time_parse(t1) - regex_time_parse(t2)
+    if delta_t < datetime.timedelta(0):
+        return '0:00.0'
+    return float_time_format(delta_t.total_seconds())
+
+def gen_times(n, seed=0):
+    '''Generates n random time strings between 10 minutes and 5 hours'''
+    rnd = random.Random(seed)
+    times = []
+    for i_unused in range(n):
+        t = rnd.uniform(600, 18000)
+        times.append(float_time_format(t))
+    return times
+
+def timeit(fn, *args, repeat=3):
+    '''Returns the best duration of fn(*args) over a few runs, in seconds'''
+    best = None
+    for i_unused in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return best
+
+def run(n=100000):
+    '''Runs the benchmark on n times and prints a report'''
+    times = gen_times(n)
+    handicaps = gen_times(n, seed=1)
+    results = []
+    results.append(('parse',
+                    timeit(lambda: [regex_time_parse(t) for t in times]),
+                    timeit(lambda: [parse_ms(t) for t in times])))
+    results.append(('batch parse',
+                    timeit(lambda: [regex_time_parse(t) for t in times]),
+                    timeit(parse_many, times)))
+    seconds = [regex_time_parse(t).total_seconds() for t in times]
+    times_ms = parse_many(times)
+    results.append(('batch format',
+                    timeit(lambda: [float_time_format(t) for t in seconds]),
+                    timeit(format_many, times_ms)))
+    results.append(('diff',
+                    timeit(lambda: [regex_time_diff(t, h) for t, h in zip(times, handicaps)]),
+                    timeit(lambda: [time_diff(t, h) for t, h in zip(times, handicaps)])))
+    print('%d times' % n)
+    print('%-14s %10s %10s %8s' % ('', 'regex (s)', 'int (s)', 'speedup'))
+    for name, old, new in results:
+        print('%-14s %10.3f %10.3f %7.1fx' % (name, old, new, old / new))
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
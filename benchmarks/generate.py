@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Generator of synthetic race projects.
+   A project has a .reg file with divisions, printfields and rankings, a
+   pre-registration csv file, the registration json files of a few
+   registration stations, and a saved timing session.
+   Usage: python3 -m benchmarks.generate <directory> [number of runners]
+          [number of laps] [handicap]'''
+
+import csv
+import json
+import os
+import random
+import sys
+from fstimer.time_ops import format_ms
+
+FIRST_NAMES = ['Ann', 'Bob', 'Chloe', 'David', 'Emma', 'Farid', 'Grace',
+               'Hugo', 'Ines', 'Jack', 'Kenji', 'Lea', 'Mohamed', 'Nora',
+               'Oscar', 'Paula', 'Quentin', 'Rosa', 'Sven', 'Tomoko']
+LAST_NAMES = ['Smith', 'Garcia', 'Nguyen', 'Muller', "O'Neil", 'Rossi',
+              'Kowalski', 'Dubois', 'Silva', 'Tanaka', 'Ivanov', 'Cohen',
+              'Larsen', 'Okafor', 'Novak', 'Martin', 'Lee', 'Brown']
+# ID used for passes in the timing sessions
+PASSID = '0'
+# Key used to mark times
+TIMEBTN = '*'
+
+def project_settings(numlaps=1, handicap=False):
+    '''Returns the content of the .reg file of a project'''
+    fields = ['Last name', 'First name', 'ID', 'Age', 'Gender', 'Email', 'Club']
+    fieldsdic = {'Last name': {'type': 'entrybox', 'max': 30},
+                 'First name': {'type': 'entrybox', 'max': 30},
+                 'ID': {'type': 'entrybox', 'max': 6},
+                 'Age': {'type': 'entrybox_int', 'max': 3},
+                 'Gender': {'type': 'combobox', 'options': ['male', 'female']},
+                 'Email': {'type': 'entrybox', 'max': 40},
+                 'Club': {'type': 'entrybox', 'max': 30}}
+    if handicap:
+        fields.append('Handicap')
+        fieldsdic['Handicap'] = {'type': 'entrybox', 'max': 20}
+    divisions = [['All females', {'Gender': 'female'}],
+                 ['All males', {'Gender': 'male'}]]
+    for gender in ['female', 'male']:
+        for low, high in [(0, 19), (20, 29), (30, 39), (40, 49), (50, 59),
+                          (60, 69), (70, 120)]:
+            divisions.append(['%s, %d-%d' % (gender.capitalize(), low, high),
+                              {'Gender': gender, 'Age': [low, high]}])
+    divisions.append(['Club runners', {'Club': 'Harriers'}])
+    printfields = {'Time': '{Time}', 'Pace': '{Time}/10', 'ID': '{ID}',
+                   'Age': '{Age}', 'Gender': '{Gender}', 'Club': '{Club}',
+                   'Name': "{First name} + ' ' + {Last name}"}
+    if handicap:
+        printfields['Handicap'] = '{Handicap}'
+    rankings = {'Overall': 'Time'}
+    for div in divisions:
+        rankings[div[0]] = 'Time'
+    rankings['Club runners'] = 'Pace'
+    return {'fields': fields, 'fieldsdic': fieldsdic, 'divisions': divisions,
+            'projecttype': 'handicap' if handicap else 'standard',
+            'numlaps': numlaps, 'variablelaps': False,
+            'printfields': printfields, 'rankings': rankings}
+
+def gen_runners(nrunners, handicap, rnd):
+    '''Returns the registrations of nrunners runners, with their IDs'''
+    runners = []
+    for i in range(nrunners):
+        first = rnd.choice(FIRST_NAMES)
+        last = rnd.choice(LAST_NAMES)
+        runner = {'Last name': last, 'First name': first, 'ID': str(i + 1),
+                  'Age': str(rnd.randint(8, 85)),
+                  'Gender': rnd.choice(['male', 'female']),
+                  'Email': '%s.%s%d@example.org' % (first, last, i),
+                  'Club': rnd.choice(['', '', '', 'Harriers', 'Striders'])}
+        if handicap:
+            runner['Handicap'] = format_ms(rnd.randint(0, 600) * 1000)
+        runners.append(runner)
+    return runners
+
+def gen_registrations(runners, fields, nstations, rnd):
+    '''Returns the pre-registration, and the registration list saved by
+       each station.
+       Three runners out of four pre-registered. Each station starts from
+       the pre-registration and gives their IDs to the runners that come to
+       it, and registers the others from scratch. Some pre-registered
+       runners don't show up, and a few IDs are given twice.'''
+    prereg = []
+    stations = [[] for i_unused in range(nstations)]
+    for runner in runners:
+        station = rnd.randrange(nstations)
+        if rnd.random() < 0.75:
+            prereg.append(dict(runner, ID=''))
+            if rnd.random() < 0.05:
+                # No show
+                continue
+        reg = dict(runner)
+        if rnd.random() < 0.001:
+            # The same bib given twice
+            reg['ID'] = rnd.choice(runners)['ID']
+        stations[station].append(reg)
+    registered = [set(reg['Email'] for reg in regs) for regs in stations]
+    for regs, emails in zip(stations, registered):
+        regs.extend(reg for reg in prereg if reg['Email'] not in emails)
+        rnd.shuffle(regs)
+    prereg = [{field: reg[field] for field in fields if field != 'ID'}
+              for reg in prereg]
+    return prereg, stations
+
+def gen_rawtimes(runners, numlaps, rnd):
+    '''Returns a saved timing session of the runners, newest first.
+       Most runners finish all of the laps, there are passes and blank IDs,
+       and the IDs and the times are misaligned: some IDs are missed and
+       some times are marked twice.'''
+    events = []
+    for runner in runners:
+        if rnd.random() < 0.03:
+            continue  # did not start
+        lap_ms = rnd.randint(900, 3600) * 1000 // numlaps
+        t = 0
+        laps = numlaps if rnd.random() > 0.02 else rnd.randint(1, numlaps)
+        for i_unused in range(laps):
+            t += int(lap_ms * rnd.uniform(0.9, 1.1))
+            events.append((t, runner['ID']))
+    events.sort()
+    ids = []
+    times = []
+    for t, bibid in events:
+        r = rnd.random()
+        if r < 0.005:
+            ids.append(PASSID)
+        elif r < 0.01:
+            ids.append('')
+        elif r < 0.015:
+            continue  # the ID was missed, but the time was marked
+        else:
+            ids.append(bibid)
+        times.append(format_ms(t))
+        if rnd.random() < 0.005:
+            times.append(format_ms(t + rnd.randint(0, 900)))  # double press
+    return {'ids': ids[::-1], 'times': times[::-1]}
+
+def write_project(path, nrunners, numlaps=1, handicap=False, nstations=3,
+                  seed=0):
+    '''Writes a synthetic project to the directory path, which is created.
+       Returns a dictionary with the settings and the names of the files.'''
+    rnd = random.Random(seed)
+    name = os.path.basename(path)
+    os.makedirs(path, exist_ok=True)
+    settings = project_settings(numlaps, handicap)
+    fields = settings['fields']
+    runners = gen_runners(nrunners, handicap, rnd)
+    prereg, stations = gen_registrations(runners, fields, nstations, rnd)
+    files = {'reg': os.path.join(path, name + '.reg'),
+             'prereg': os.path.join(path, name + '_prereg.csv'),
+             'registrations': [],
+             'times': os.path.join(path, name + '_bench_times.json')}
+    with open(files['reg'], 'w', encoding='utf-8') as fout:
+        json.dump(settings, fout)
+    with open(files['prereg'], 'w', encoding='utf-8') as fout:
+        dict_writer = csv.DictWriter(fout, [f for f in fields if f != 'ID'])
+        dict_writer.writeheader()
+        dict_writer.writerows(prereg)
+    for i, regs in enumerate(stations):
+        filename = os.path.join(path, name + '_registration_%d.json' % (i + 1))
+        with open(filename, 'w', encoding='utf-8') as fout:
+            json.dump(regs, fout)
+        files['registrations'].append(filename)
+    saveresults = {'rawtimes': gen_rawtimes(runners, numlaps, rnd),
+                   'timestr': 'bench', 't0': 0.}
+    with open(files['times'], 'w', encoding='utf-8') as fout:
+        json.dump(saveresults, fout)
+    files['settings'] = settings
+    return files
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    write_project(os.path.abspath(sys.argv[1]),
+                  int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+                  int(sys.argv[3]) if len(sys.argv) > 3 else 1,
+                  len(sys.argv) > 4 and sys.argv[4] == 'handicap')
@@ -24,10 +24,7 @@ import fstimer.gui
 import os, csv, json
 import datetime
 from fstimer.gui.util_classes import GtkStockButton
-
-class ComboValueError(Exception):
-    '''Exception launched when decoding reveals an invalid value for a combo field'''
-    pass
+from fstimer.reg_ops import read_csv, import_prereg, ComboValueError
 
 class ImportPreRegWin(Gtk.Window):
     '''Handling of the window dedicated to importation of pre-registration'''
@@ -253,10 +250,7 @@ class ImportPreRegWin(Gtk.Window):
             textbuffer.delete(textbuffer.get_start_iter(), textbuffer.get_end_iter())
             textbuffer.set_text('Loading '+os.path.basename(filename)+'...\n')
             try:
-                fin = csv.DictReader(open(filename, 'r', encoding='utf-8'))
-                self.csvreg = []
-                for row in fin:
-                    self.csvreg.append(row)
+                self.csvreg = read_csv(filename)
                 csv_fields = self.csvreg[0].keys()
                 iter_end = textbuffer.get_end_iter()
                 textbuffer.insert_with_tags_by_name(iter_end, 'Found csv fields: ', 'blue')
@@ -270,24 +264,11 @@ class ImportPreRegWin(Gtk.Window):
     def import_data(self, textbuffer):
         '''Implements the actual import of the csv data'''
         textbuffer.insert(textbuffer.get_end_iter(), 'Importing registration data...\n')
-        preregdata = []
-        row = 1
-        for reg in self.csvreg:
-            tmpdict = {}
-            for field in self.fields:
-                value = self.fields_mapping[field](reg)
-                if value and self.fieldsdic[field]['type'] == 'combobox':
-                    if value not in self.fieldsdic[field]['options']:
-                        optstr = '"' + '", "'.join(self.fieldsdic[field]['options']) + '", and blank'
-                        errstr = """Error in csv row %d!
-Found value "%s" in field "%s". Not a valid value!
-Valid values (case sensitive) are: %s.
-Correct the error and try again.""" % (row+1, value, field, optstr)
-                        textbuffer.insert_with_tags_by_name(textbuffer.get_end_iter(), errstr, 'red')
-                        return
-                tmpdict[field] = value
-            preregdata.append(tmpdict.copy())
-            row += 1
+        try:
+            preregdata = import_prereg(self.csvreg, self.fields, self.fieldsdic, self.fields_mapping)
+        except ComboValueError as e:
+            textbuffer.insert_with_tags_by_name(textbuffer.get_end_iter(), str(e), 'red')
+            return
         with open(os.path.join(self.path, os.path.basename(self.path)+'_registration_prereg.json'), 'w', encoding='utf-8') as fout:
             json.dump(preregdata, fout)
         textbuffer.insert_with_tags_by_name(textbuffer.get_end_iter(), 'Success! Imported pre-registration saved to '+os.path.basename(self.path)+'_registration_prereg.json\nFinished!', 'blue')
@@ -22,16 +22,20 @@ gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
 import fstimer.gui
 import os, json
+from collections import defaultdict
+from fstimer.reg_ops import file_hash
+from fstimer.regstore import TIMING
 from fstimer.gui.util_classes import GtkStockButton
 
 class PreTimeWin(Gtk.Window):
     '''Handling of the window dedicated to selecting the timing dictionnary to be used'''
 
-    def __init__(self, path, timing, okclicked_cb):
+    def __init__(self, path, timing, okclicked_cb, store=None):
         '''Builds and display the compilation error window'''
         super(PreTimeWin, self).__init__(Gtk.WindowType.TOPLEVEL)
         self.path = path
         self.timing = timing
+        self.store = store
         self.okclicked_cb = okclicked_cb
         self.modify_bg(Gtk.StateType.NORMAL, fstimer.gui.bgcolor)
         fname = os.path.abspath(
@@ -97,12 +101,17 @@ class PreTimeWin(Gtk.Window):
         response = chooser.run()
         if response == Gtk.ResponseType.OK:
             filename = chooser.get_filename()
-            self.timing.clear() # reset
+            self.timing = defaultdict(lambda: defaultdict(str)) # reset
             try:
-                with open(filename, 'r', encoding='utf-8') as fin:
-                  a = json.load(fin)
-                for reg in a.keys():
-                  self.timing[reg].update(a[reg])
+                if self.store is not None and self.store.in_sync(
+                        TIMING, file_hash(filename)):
+                    # The registrations are looked up in the store when needed
+                    self.timing = self.store.mapping(TIMING)
+                else:
+                    with open(filename, 'r', encoding='utf-8') as fin:
+                      a = json.load(fin)
+                    for reg in a.keys():
+                      self.timing[reg].update(a[reg])
                 self.pretimefilelabel.set_markup('<span color="blue">'+os.path.basename(filename)+' loaded.</span>')
             except (IOError, ValueError):
                 self.pretimefilelabel.set_markup('<span color="red">ERROR! '+os.path.basename(filename)+' not valid.</span>')
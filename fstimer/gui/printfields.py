@@ -19,12 +19,12 @@
    fields'''
 
 import gi
-import re
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
 import fstimer.gui
 from fstimer.gui.util_classes import GtkStockButton
 from fstimer.gui.util_classes import MsgDialog
+from fstimer.printer.expressions import compile_printfield
 
 class PrintFieldsWin(Gtk.Window):
     '''Handling of the window dedicated to the definition of the field
@@ -197,25 +197,19 @@ class PrintFieldsWin(Gtk.Window):
         '''handles a change of the ranking code'''
         # Validate the code
         try:
-            # First make sure all of the variables are Time or a registration field
-            vars_ = re.findall("\{[^}]+\}", text)
-            for var in vars_:
-                name = var[1:-1]
-                if not (name in self.fields or name == 'Time'):
-                    raise KeyError('Cannot find variable {}'.format(name))
+            # First compile it, which checks that all of the variables are Time or a registration field
+            col_fn = compile_printfield(text, self.fields, self.fieldsdic)
             # Now check that the operations work, by plugging in a float for Time, and a string
             # for everything else.
-            text_test = str(text)
-            for var in vars_:
-                if var == '{Time}':
-                    text_test = text_test.replace(var, "3.14159")
-                elif self.fieldsdic[var[1:-1]]['type'] == 'entrybox_int':
-                    text_test = text_test.replace(var, "20")
+            userdata = {}
+            for field in self.fields:
+                if self.fieldsdic[field]['type'] == 'entrybox_int':
+                    userdata[field] = '20'
                 else:
                     # Use a string of a number so that int() works
                     # In the future we will have typed fields.
-                    text_test = text_test.replace(var, "'1000000001'")
-            eval(text_test)
+                    userdata[field] = '1000000001'
+            col_fn('1000000001', 3141.59, 0, userdata)
         except Exception as e:
             md = MsgDialog(self, 'error', ['ok'], 'Error!', 'Invalid code:\n\n{}\n\nSee documentation.'.format(e))
             md.run()
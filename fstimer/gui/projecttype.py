@@ -27,7 +27,7 @@ class ProjectTypeWin(Gtk.Window):
     '''Handles setting project settings'''
 
     def __init__(self, project_types, projecttype, numlaps, variablelaps,
-                 back_clicked_cb, next_clicked_cb, parent):
+                 regstore, back_clicked_cb, next_clicked_cb, parent):
         '''Creates project type window'''
         super(ProjectTypeWin, self).__init__(Gtk.WindowType.TOPLEVEL)
         self.modify_bg(Gtk.StateType.NORMAL, fstimer.gui.bgcolor)
@@ -80,6 +80,13 @@ class ProjectTypeWin(Gtk.Window):
         # The next button
         hbox_05 = Gtk.HBox(False, 0)
         hbox_05.pack_start(check_button2, False, False, 8)
+        ##Third is where registrations are kept
+        label_2 = Gtk.Label(label='Large races:')
+        check_button3 = Gtk.CheckButton(
+            label='Also keep registrations in an indexed database')
+        check_button3.set_active(regstore)
+        hbox_06 = Gtk.HBox(False, 0)
+        hbox_06.pack_start(check_button3, False, False, 8)
         # And an hbox with 2 buttons
         hbox_1 = Gtk.HBox(False, 0)
         btnCANCEL = GtkStockButton('close',"Close")
@@ -90,7 +97,7 @@ class ProjectTypeWin(Gtk.Window):
         btnBACK.connect('clicked', back_clicked_cb)
         btnNEXT = GtkStockButton('forward',"Next")
         btnNEXT.connect('clicked', next_clicked_cb, rbs, check_button,
-                        check_button2, numlapsbtn)
+                        check_button2, numlapsbtn, check_button3)
         alignNEXT = Gtk.Alignment.new(1, 0, 1, 0)
         alignNEXT.add(btnNEXT)
         alignBACK = Gtk.Alignment.new(1, 0, 1, 0)
@@ -107,6 +114,8 @@ class ProjectTypeWin(Gtk.Window):
         vbox2.pack_start(label_1, False, False, 0)
         vbox2.pack_start(hbox_0, False, False, 0)
         vbox2.pack_start(hbox_05, False, False, 0)
+        vbox2.pack_start(label_2, False, False, 0)
+        vbox2.pack_start(hbox_06, False, False, 0)
         vbox2.pack_start(hbox_1, False, False, 0)
         vbox.pack_start(vbox1, False, False, 0)
         vbox.pack_start(vbox2, False, False, 0)
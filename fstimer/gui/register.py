@@ -25,12 +25,13 @@ import os
 import re
 from fstimer.gui.util_classes import MsgDialog
 from fstimer.gui.util_classes import GtkStockButton
+from fstimer.searchindex import SearchIndex
 
 class RegistrationWin(Gtk.Window):
     '''Handling of the window dedicated to registration'''
 
     def __init__(self, path, fields, fieldsdic, prereg, projecttype, save_registration_cb, parent_win=None,
-                 autosave=True, save_label=''):
+                 autosave=True, save_label='', close_registration_cb=None):
         '''Builds and display the registration window'''
         super(RegistrationWin, self).__init__(Gtk.WindowType.TOPLEVEL)
         if parent_win:
@@ -43,13 +44,18 @@ class RegistrationWin(Gtk.Window):
         self.projecttype = projecttype
         self.save_registration_cb = save_registration_cb
         self.autosave = autosave
+        self.close_registration_cb = close_registration_cb
         self.editreg_win = None
         self.editregfields = None
         # First we define the registration model.
         # We will setup a liststore that is wrapped in a treemodelfilter
         # that is wrapped in a treemodelsort that is put in a treeview
         # that is put in a scrolled window. Eesh.
-        self.regmodel = Gtk.ListStore(*[str for field in self.fields])
+        # After the fields, a row has its key in the search index, and
+        # whether it matches the filter.
+        self.keycol = len(self.fields)
+        self.viscol = len(self.fields) + 1
+        self.regmodel = Gtk.ListStore(*([str for field in self.fields] + [int, bool]))
         self.modelfilter = self.regmodel.filter_new()
         self.modelfiltersorted = Gtk.TreeModelSort(self.modelfilter)
         self.treeview = Gtk.TreeView()
@@ -58,14 +64,20 @@ class RegistrationWin(Gtk.Window):
             column = Gtk.TreeViewColumn(field, Gtk.CellRendererText(), text=colid)
             column.set_sort_column_id(colid)
             self.treeview.append_column(column)
+        # This is the string that we filter based on.
+        self.searchstr = ''
+        # The search index of the rows, with the iter and the key of the
+        # rows that are visible
+        self.index = SearchIndex(self.fields)
+        self.rowiters = {}
+        self.visible = set()
+        self.nextkey = 0
         # Now we populate the model with the pre-registration info, if any
         for reg in prereg:
-            self.regmodel.append([reg[field] for field in fields])
+            self.append_row(reg)
             if reg['ID']:
                 self.ids.add(reg['ID'])
-        # This is the string that we filter based on.
-        self.searchstr = ''
-        self.modelfilter.set_visible_func(self.visible_filter)
+        self.modelfilter.set_visible_column(self.viscol)
         self.treeview.set_model(self.modelfiltersorted)
         self.treeview.set_enable_search(False)
         # Now let us actually build the window
@@ -84,9 +96,11 @@ class RegistrationWin(Gtk.Window):
         filterbox = Gtk.HBox(False, 8)
         filterbox.pack_start(Gtk.Label('Filter by ', True, True, 0), False, False, 0)
         self.filter_combo = Gtk.ComboBoxText()
+        self.filter_combo.append_text('All fields')
         for field in self.fields:
             self.filter_combo.append_text(field)
         self.filter_combo.set_active(0)
+        self.filter_combo.connect('changed', self.filter_apply)
         filterbox.pack_start(self.filter_combo, False, False, 0)
         filterbox.pack_start(Gtk.Label(':'), False, False, 0)
         self.filterentry = Gtk.Entry()
@@ -152,32 +166,50 @@ class RegistrationWin(Gtk.Window):
         # And show.
         self.show_all()
 
-    def visible_filter(self, model, titer, data):
-        '''This is the filter function.
-           It checks if self.searchstr is contained in column matching self.filter_combo
-           case insensitive'''
-        if self.searchstr:
-            col_idx = self.filter_combo.get_active()
-            if not model.get_value(titer, col_idx):
-                return False
-            else:
-                return self.searchstr.lower() in model.get_value(titer, col_idx).lower()
-        else:
-            return True
+    def filter_field(self):
+        '''Returns the field chosen in self.filter_combo, or None for all of
+           them'''
+        col_idx = self.filter_combo.get_active()
+        if col_idx <= 0:
+            return None
+        return self.fields[col_idx-1]
+
+    def append_row(self, reg):
+        '''Appends a registration to the model and to the search index'''
+        key = self.nextkey
+        self.nextkey += 1
+        self.index.add(key, reg)
+        visible = (not self.searchstr.strip() or
+                   self.index.matches(key, self.searchstr, self.filter_field()))
+        self.rowiters[key] = self.regmodel.append(
+            [reg[field] for field in self.fields] + [key, visible])
+        if visible:
+            self.visible.add(key)
+
+    def refilter(self):
+        '''Shows the rows matching self.searchstr, in the field chosen in
+           self.filter_combo or in all of them, and hides the others.
+           Only the rows that change are updated.'''
+        matches = self.index.search(self.searchstr, self.filter_field())
+        for key in self.visible - matches:
+            self.regmodel.set_value(self.rowiters[key], self.viscol, False)
+        for key in matches - self.visible:
+            self.regmodel.set_value(self.rowiters[key], self.viscol, True)
+        self.visible = matches
 
     def filter_apply(self, jnk_unused):
         ''' handles modification of the content of the filter box
             sets self.searchstr to the current entrybox contents and refilter'''
         self.searchstr = self.filterentry.get_text()
         self.filterbtnCLEAR.set_sensitive(True)
-        self.modelfilter.refilter()
+        self.refilter()
 
     def filter_clear(self, jnk_unused):
         '''handles clearing of the filter box. Clears self.searchstr and refilter'''
         self.searchstr = ''
         self.filterentry.set_text('')
         self.filterbtnCLEAR.set_sensitive(False)
-        self.modelfilter.refilter()
+        self.refilter()
 
     def edit_clicked(self, jnk_unused):
         '''handles click on the 'edit' button on the registration window'''
@@ -213,7 +245,12 @@ class RegistrationWin(Gtk.Window):
                 # Find where this is in self.prereg
                 preregiter = self.prereg.index(current_info)
                 # converts the treeiter from sorted to filter to model, and remove
-                self.regmodel.remove(self.modelfilter.convert_iter_to_child_iter(self.modelfiltersorted.convert_iter_to_child_iter(treeiter)))
+                modeliter = self.modelfilter.convert_iter_to_child_iter(self.modelfiltersorted.convert_iter_to_child_iter(treeiter))
+                key = self.regmodel.get_value(modeliter, self.keycol)
+                self.index.remove(key)
+                del self.rowiters[key]
+                self.visible.discard(key)
+                self.regmodel.remove(modeliter)
                 try:
                     self.ids.remove(current_info['ID'])
                 except:
@@ -227,10 +264,11 @@ class RegistrationWin(Gtk.Window):
            Creates the editreg window with a None treeiter and clear initial values.'''
         self.edit_registration(None, None, None)
 
-    def save_clicked(self, jnk_unused):
+    def save_clicked(self, jnk_unused, full=True):
         '''Handles click on the 'save' button on the registration window.
-           We do a json dump of self.prereg'''
-        filename, success = self.save_registration_cb()
+           We do a json dump of self.prereg. Autosaves are not full: they
+           may only write the changes since the last save.'''
+        filename, success = self.save_registration_cb(full)
         if success:
             self.regstatus.set_markup('<span color="blue">Registration saved to %s</span>' % filename)
             return True
@@ -251,6 +289,8 @@ class RegistrationWin(Gtk.Window):
             if not save_res:
                 return
         self.hide()
+        if self.close_registration_cb is not None:
+            self.close_registration_cb()
         # Clear the file setting from pre-reg, in case pre-reg is
         # re-run without selecting a file
         del self.prereg[:]
@@ -361,22 +401,32 @@ class RegistrationWin(Gtk.Window):
             # Remove the old ID from the id store, and add the new value
             if self.prereg[preregiter]['ID']:
                 self.ids.remove(self.prereg[preregiter]['ID'])
-            # Update the tree and prereg
+            # Update the tree, the search index and prereg
             for (colid, field) in enumerate(self.fields):
                 self.regmodel.set_value(treeiter, colid, new_vals[field])
+            key = self.regmodel.get_value(treeiter, self.keycol)
+            self.index.update(key, new_vals)
             self.prereg[preregiter] = new_vals
         else:
-            self.regmodel.append([new_vals[field] for field in self.fields])
+            self.append_row(new_vals)
             self.prereg.append(new_vals)
         # Add the new ID to the id store
         if new_vals['ID']:
             self.ids.add(new_vals['ID'])
         # The saved status is unsaved
         self.regstatus.set_markup('')
-        # Filter results by the current filter field, for this value
-        self.filterentry.set_text(new_vals[self.filter_combo.get_active_text()])
+        # Filter results by the current filter field, for this value, or by
+        # the ID when filtering on all fields
+        field = self.filter_field()
+        if field is None:
+            field = 'ID' if new_vals['ID'] else self.fields[0]
+        if self.filterentry.get_text() == new_vals[field]:
+            # The text does not change, but the entry may now match
+            self.refilter()
+        else:
+            self.filterentry.set_text(new_vals[field])
         # Save
         if self.autosave:
-            self.save_clicked(None)
+            self.save_clicked(None, full=False)
         # we're done
         self.editreg_win.hide()
@@ -25,24 +25,23 @@ import fstimer.gui.editt0
 import fstimer.gui.edittime
 import fstimer.gui.editblocktimes
 from fstimer.gui.register import RegistrationWin
-import time
 import os
-import re
 import json
+import logging
 from gi.repository import Pango
-from collections import defaultdict, Counter
+from collections import defaultdict
 from fstimer.gui.util_classes import MsgDialog
 from fstimer.gui.util_classes import GtkStockButton
-from fstimer.printer.formatter import print_times
-from fstimer.time_ops import time_format, time_sum, time_diff
-
-class MergeError(Exception):
-    '''Exception used in case of merging error'''
-    pass
-
+from fstimer.reg_ops import file_hash
+from fstimer.regstore import COMPILED
+from fstimer.printer.formatter import print_times, print_awards, print_json
+from fstimer.time_ops import format_ms
+from fstimer.timinglog import EventClock
+from fstimer.timingengine import TimingEngine, MergeError
 
 class TimingWin(Gtk.Window):
-    '''Handling of the timing window'''
+    '''Handling of the timing window.
+       The timing itself is done by a TimingEngine, this is only a view.'''
 
     def __init__(self, pytimer, timebtn):
         '''Builds and display the compilation error window'''
@@ -52,10 +51,13 @@ class TimingWin(Gtk.Window):
         self.fields = pytimer.fields
         self.fieldsdic = pytimer.fieldsdic
         self.write_timing_cb = pytimer.write_updated_timing
+        self.store = pytimer.open_store()
         self.timebtn = timebtn
-        self.rawtimes = pytimer.rawtimes
-        self.timing = pytimer.timing
         self.numlaps = pytimer.numlaps
+        self.engine = TimingEngine(self.path, pytimer.rawtimes, pytimer.timing,
+                                   self.numlaps, timebtn, self.projecttype)
+        self.rawtimes = self.engine.rawtimes
+        self.timestr = self.engine.timestr
         self.wineditblocktime = None
         self.winedittime = None
         self.t0win = None
@@ -101,22 +103,29 @@ class TimingWin(Gtk.Window):
         timealgn.add(self.timesw)
         self.entrybox = Gtk.Entry()
         self.entrybox.set_max_length(40)
-        self.offset = 0 #this is len(times) - len(ids)
+        self.entrybox.connect('key-press-event', self.key_pressed)
+        self.entrybox.connect('key-release-event', self.key_released)
         self.entrybox.connect('activate', self.record_time)
         self.entrybox.connect('changed', self.check_for_newtime)
-        # And we will save our file
-        self.timestr = re.sub(' +', '_', time.ctime()).replace(':', '')
-        #we save with the current time in the filename so no chance of being overwritten accidentally
+        # Times are marked when the key was pressed, not when the main loop
+        # gets to handle it. See key_pressed and key_time.
+        self.eventclock = EventClock()
+        # Seed it with the event that opened the window, if there is one
+        event_ms = Gtk.get_current_event_time()
+        if event_ms != Gdk.CURRENT_TIME:
+            self.eventclock.seed(event_ms)
+        self.key_event_ms = None
         # Now lets go on to boxes
         tophbox = Gtk.HBox()
-        # our default t0, and the stuff on top for setting/edit t0
-        self.t0 = 0.
+        # the stuff on top for setting/edit t0
+        journal = self.engine.journal
+        GLib.timeout_add(int(journal.fsync_interval*1000), journal.sync)
         btn_t0 = Gtk.Button('Start!')
         btn_t0.connect('clicked', self.set_t0)
         # time display
         self.clocklabel = Gtk.Label()
         self.clocklabel.modify_font(Pango.FontDescription("sans 20"))
-        self.clocklabel.set_markup(time_format(0))
+        self.clocklabel.set_markup(format_ms(0))
         tophbox.pack_start(btn_t0, False, False, 10)
         tophbox.pack_start(self.clocklabel, False, False, 10)
         timevbox1 = Gtk.VBox(False, 8)
@@ -125,12 +134,6 @@ class TimingWin(Gtk.Window):
         timevbox1.pack_start(Gtk.Label('Select box below in order to mark times:'), False, False, 0)
         timevbox1.pack_start(self.entrybox, False, False, 0)
         # we will keep track of how many racers are still out.
-        self.racers_reg = []
-        for i_unused in range(self.numlaps):
-            self.racers_reg.append(set([k for k in self.timing.keys()]))
-        self.racers_total = len(self.racers_reg[0])
-        self.racers_in = [0] * self.numlaps
-        self.lapcounter = defaultdict(int)
         self.racerslabel = Gtk.Label()
         self.update_racers_label()
         timevbox1.pack_start(self.racerslabel, False, False, 0)
@@ -155,6 +158,14 @@ class TimingWin(Gtk.Window):
         menu_savecsv.connect_object("activate", self.print_csv, pytimer)
         menu_savecsv.show()
         options_menu.append(menu_savecsv)
+        menu_awards = Gtk.MenuItem('Save award sheets')
+        menu_awards.connect_object("activate", self.print_awards, pytimer)
+        menu_awards.show()
+        options_menu.append(menu_awards)
+        menu_json = Gtk.MenuItem('Export results to JSON')
+        menu_json.connect_object("activate", self.print_json, pytimer)
+        menu_json.show()
+        options_menu.append(menu_json)
         menu_resume = Gtk.MenuItem('Load saved timing session')
         menu_resume.connect_object("activate", self.resume_times, None, False) #False is for not merging
         menu_resume.show()
@@ -211,36 +222,53 @@ class TimingWin(Gtk.Window):
     def print_corrected_time(self, column, renderer, model, itr, data):
         '''computes a handicap corrected time from en entry in the timing model'''
         bibid, st = model.get(itr, 0, 1)
-        if st and self.timing[bibid]['Handicap']:
-            try:
-                nt = time_diff(st, self.timing[bibid]['Handicap'])
-                renderer.set_property('text', nt)
-            except AttributeError:
-                #Handicap is present but is not formatted correctly.
-                renderer.set_property('text', '')
-        else:
-            renderer.set_property('text', '')
+        renderer.set_property('text', self.engine.corrected_time(bibid, st))
 
     def print_completed_laps(self, column, renderer, model, itr, data):
         '''computes number of laps completed by this (registered) racer'''
         bibid, st = model.get(itr, 0, 1)
         if bibid:
-            renderer.set_property('text', str(self.lapcounter[bibid]))
+            renderer.set_property('text', str(self.engine.lapcounter[bibid]))
         else:
             renderer.set_property('text', '')
 
     def update_racers_label(self):
         '''update values in the racers_label'''
-        s = '%d registrants. Checked in' % self.racers_total
+        s = '%d registrants. Checked in' % self.engine.racers_total
         if self.numlaps > 1:
             s += ' (per lap)'
-        s += ': ' + ' | '.join(str(n) for n in self.racers_in)
+        s += ': ' + ' | '.join(str(n) for n in self.engine.racers_in)
         self.racerslabel.set_markup(s)
 
+    def key_pressed(self, jnk_unused, event):
+        '''Remembers the timestamp of the key event being handled, if it is
+           a key that can enter text or an entry'''
+        if Gdk.keyval_to_unicode(event.keyval) or \
+           event.keyval in (Gdk.KEY_Return, Gdk.KEY_KP_Enter, Gdk.KEY_ISO_Enter):
+            self.key_event_ms = event.time
+        return False
+
+    def key_released(self, jnk_unused, event_unused):
+        '''Forgets the timestamp of a key press that did not change the text'''
+        self.key_event_ms = None
+        return False
+
+    def key_time(self):
+        '''Returns the monotonic reading of the last key press, and how late
+           it is being handled. Text that did not come from a key press
+           (e.g. a paste) is timed now.'''
+        if self.key_event_ms is None:
+            return None, 0
+        mono_ns, skew_ns = self.eventclock.to_monotonic(self.key_event_ms)
+        self.key_event_ms = None
+        return mono_ns, skew_ns
+
     def check_for_newtime(self, jnk_unused):
         '''Handles entering of a new time'''
         if self.entrybox.get_text() == self.timebtn:
-            self.new_blank_time()
+            self.new_blank_time(*self.key_time())
+        else:
+            self.key_event_ms = None
 
     def scroll_times(self, jnk1_unused, jnk2_unused):
         '''handles scrolling of the time window'''
@@ -250,16 +278,16 @@ class TimingWin(Gtk.Window):
     def update_clock(self):
         '''Updates the clock'''
         # compute time
-        t = time.time()-self.t0
+        t = self.engine.elapsed_ms()
         # update label
-        self.clocklabel.set_markup(time_format(t))
+        self.clocklabel.set_markup(format_ms(t))
         # keep updating
         return True
 
     def set_t0(self, btn):
         '''Handles click on Start button
            Sets t0 to the current time'''
-        self.t0 = time.time()
+        self.engine.start_clock()
         GLib.timeout_add(100, self.update_clock) #update clock every 100ms
         btn.set_sensitive(False)
 
@@ -271,16 +299,17 @@ class TimingWin(Gtk.Window):
         response = restart_t0_dialog.run()
         restart_t0_dialog.destroy()
         if response == Gtk.ResponseType.YES:
-            self.t0 = time.time()
+            self.engine.start_clock()
     
     def edit_t0(self, jnk_unused):
         '''Handles click on Edit button for the t0 value.
            Loads up a window and query the new t0'''
-        self.t0win = fstimer.gui.editt0.EditT0Win(self.path, self, self.t0, self.ok_editt0)
+        self.t0win = fstimer.gui.editt0.EditT0Win(self.path, self, self.engine.t0, self.ok_editt0)
 
     def ok_editt0(self, t0):
-        '''Handles click on OK after t0 edition'''
-        self.t0 = t0
+        '''Handles click on OK after t0 edition.
+           Times already marked keep the clock they were marked with.'''
+        self.engine.set_t0(t0)
         self.t0win.hide()
 
     def options_btn(self, menu, event):
@@ -293,13 +322,19 @@ class TimingWin(Gtk.Window):
 
     def edit_reg(self, jnk_unused):
         filename = os.path.join(self.path, os.path.basename(self.path)+'_registration_compiled.json')
-        with open(filename, 'r', encoding='utf-8') as fin:
-            self.reg_file = json.load(fin)
+        if self.store is not None and self.store.in_sync(COMPILED, file_hash(filename)):
+            # No need to parse the json. The registration window still
+            # needs all of the registrations, for its list store.
+            self.reg_file = list(self.store.registrations(COMPILED))
+        else:
+            with open(filename, 'r', encoding='utf-8') as fin:
+                self.reg_file = json.load(fin)
         regwin = RegistrationWin(
             self.path, self.fields, self.fieldsdic, self.reg_file, self.projecttype, self.save_reg, self, False,
             'Loaded '+filename)
     
-    def save_reg(self):
+    def save_reg(self, full_unused=True):
+        # The compiled registration is always written in full
         # Re-create the timing dictionary
         timedict = defaultdict(lambda: defaultdict(str))
         for reg in self.reg_file:
@@ -338,107 +373,27 @@ class TimingWin(Gtk.Window):
     def editsingletimedone(self, treeiter, new_id, new_time):
         '''Handled result of the editing of a given time'''
         row = self.timemodel.get_path(treeiter)[0]
-        if not re.match('^[0-9:.]*$', new_time):
-            md = MsgDialog(self, 'error', ['ok'], 'Error!', 'Time is not valid format.')
+        try:
+            keep = self.engine.edit_row(row, str(new_id), str(new_time))
+        except ValueError as e:
+            md = MsgDialog(self, 'error', ['ok'], 'Error!', str(e))
             md.run()
             md.destroy()
             return
-        if row < self.offset:
-            if new_id:
-                # we are putting an ID in a slot that we hadn't reached yet
-                # Fill in any other missing ones up to this point with ''.
-                ids = [str(new_id)]
-                ids.extend(['' for i_unused in range(self.offset-row-1)])
-                ids.extend(self.rawtimes['ids'])
-                self.rawtimes['ids'] = list(ids)
-                self.offset = row #the new offset
-                self.rawtimes['times'][row] = str(new_time) #the new time
-                self.timemodel.set_value(treeiter, 0, str(new_id))
-                self.timemodel.set_value(treeiter, 1, str(new_time))
-            elif new_time:
-                # we are adjusting the time only.
-                self.rawtimes['times'][row] = str(new_time) #the new time
-                self.timemodel.set_value(treeiter, 1, str(new_time))
-            else:
-                # we are clearing this entry. pop it from time and adjust offset.
-                self.rawtimes['times'].pop(row)
-                self.offset -= 1
-                self.timemodel.remove(treeiter)
-        elif row == self.offset and new_time and not new_id:
-            # then we are clearing the most recent ID.
-            # We pop it and adjust self.offset and adjust the time.
-            self.rawtimes['ids'].pop(0)
-            self.rawtimes['times'][row] = str(new_time)
-            self.offset += 1
+        if keep:
             self.timemodel.set_value(treeiter, 0, str(new_id))
             self.timemodel.set_value(treeiter, 1, str(new_time))
-        elif row < -self.offset:
-            # Here we are making edits to a slot where there is an ID, but no time.
-            if new_time:
-                #we are putting a time in a slot that we hadn't reached yet. Fill in any other missing ones up to this point with blanks.
-                times = [str(new_time)]
-                times.extend(['' for i_unused in range(-self.offset-row-1)])
-                times.extend(self.rawtimes['times'])
-                self.rawtimes['times'] = list(times)
-                self.offset = -row #the new offset
-                self.rawtimes['ids'][row] = str(new_id) #the new time
-                self.timemodel.set_value(treeiter, 0, str(new_id))
-                self.timemodel.set_value(treeiter, 1, str(new_time))
-            elif new_id:
-                #we are adjusting the id only.
-                self.rawtimes['ids'][row] = str(new_id) #the new time
-                self.timemodel.set_value(treeiter, 0, str(new_id))
-            else:
-                #we are clearing this entry. pop it from id and adjust offset.
-                self.rawtimes['ids'].pop(row)
-                self.offset += 1
-                self.timemodel.remove(treeiter)
         else:
-            if not new_time and not new_id:
-                # we are clearing the entry
-                if self.offset > 0:
-                    self.rawtimes['ids'].pop(row-self.offset)
-                    self.rawtimes['times'].pop(row)
-                elif self.offset <= 0:
-                    self.rawtimes['ids'].pop(row)
-                    self.rawtimes['times'].pop(row+self.offset)
-                self.timemodel.remove(treeiter)
-            else:
-                # adjust the entry; no changes to the stack otherwise.
-                if self.offset > 0:
-                    self.rawtimes['ids'][row-self.offset] = str(new_id)
-                    self.rawtimes['times'][row] = str(new_time)
-                elif self.offset <= 0:
-                    self.rawtimes['ids'][row] = str(new_id)
-                    self.rawtimes['times'][row+self.offset] = str(new_time)
-                self.timemodel.set_value(treeiter, 0, str(new_id))
-                self.timemodel.set_value(treeiter, 1, str(new_time))
-        #reset lapcounter, if used..
-        if self.numlaps > 1:
-            self.lapcounter = defaultdict(int)
-            self.lapcounter.update(Counter(self.rawtimes['ids']))
+            self.timemodel.remove(treeiter)
         self.winedittime.hide()
 
     def editblocktimedone(self, pathlist, operation, timestr):
         '''Handled result of the editing of a block of times
            Goes through every time in pathlist and do the requested operation'''
-        for gtkpath in pathlist:
-            # Figure out which row this is, and which treeiter
-            treeiter = self.timemodel.get_iter(gtkpath)
-            row = gtkpath[0]
-            # Now figure out the new time. First get the old time as a string
-            old_time_str = self.timemodel.get_value(treeiter, 1)
-            try:
-                if operation == 'ADD':
-                    new_time = time_sum(old_time_str, timestr)
-                elif operation == 'SUBTRACT':
-                    new_time = time_diff(old_time_str, timestr)
-                # Save them, and write out to the timemodel
-                self.rawtimes['times'][row] = str(new_time)
-                self.timemodel.set_value(treeiter, 1, str(new_time))
-            except AttributeError:
-                # This will happen for instance if the gtkpath has a blank time
-                pass
+        rows = [gtkpath[0] for gtkpath in pathlist]
+        for row, new_time in self.engine.shift_times(rows, operation, timestr):
+            # write it out to the timemodel
+            self.timemodel.set_value(self.timemodel.get_iter((row,)), 1, new_time)
         self.wineditblocktime.hide()
 
     def timing_rm_ID(self, jnk_unused):
@@ -455,9 +410,8 @@ class TimingWin(Gtk.Window):
         elif len(pathlist) == 1:
             # Figure out what row this is in the timeview
             row = pathlist[0][0]
-            # Now figure out what index in self.rawtimes['ids'] it is.
-            ididx = row-max(0, self.offset)
-            if ididx >= 0:
+            # Now figure out what index in the IDs it is.
+            if self.rawtimes.id_index(row) is not None:
                 # Otherwise, there is no ID here so there is nothing to do.
                 # Ask if we are sure.
                 rmID_dialog = MsgDialog(self, 'warning', ['yes', 'no'], 'Are you sure?', 'Are you sure you want to drop this ID and shift all later IDs down earlier in the list?\nThis cannot be undone.')
@@ -465,18 +419,17 @@ class TimingWin(Gtk.Window):
                 response = rmID_dialog.run()
                 rmID_dialog.destroy()
                 if response == Gtk.ResponseType.YES:
-                    # Make the shift in self.rawtimes and self.offset
-                    self.rawtimes['ids'].pop(ididx)
-                    self.offset += 1
+                    # Make the shift in the raw times
+                    ididx = self.engine.drop_id(row)
                     # And now shift everything on the display.
                     rowcounter = int(row)
                     for i in range(ididx-1, -1, -1):
                         # Write rawtimes[i] into row rowcounter
                         treeiter = self.timemodel.get_iter((rowcounter,))
-                        self.timemodel.set_value(treeiter, 0, str(self.rawtimes['ids'][i]))
+                        self.timemodel.set_value(treeiter, 0, str(self.rawtimes.get_id(i)))
                         rowcounter -= 1
                     # Now we tackle the last value - there are two possibilities.
-                    if self.offset > 0:
+                    if self.rawtimes.offset > 0:
                         # There is a buffer of times, and this one should be cleared.
                         treeiter = self.timemodel.get_iter((rowcounter,))
                         self.timemodel.set_value(treeiter, 0, '')
@@ -499,9 +452,8 @@ class TimingWin(Gtk.Window):
         elif len(pathlist) == 1:
             # Figure out what row this is in the timeview
             row = pathlist[0][0]
-            # Now figure out what index in self.rawtimes['times'] it is.
-            timeidx = row-max(0, -self.offset)
-            if timeidx >= 0:
+            # Now figure out what index in the times it is.
+            if self.rawtimes.time_index(row) is not None:
                 # Otherwise, there is no time here so there is nothing to do.
                 # Ask if we are sure.
                 rmtime_dialog = MsgDialog(self, 'warning', ['yes', 'no'], 'Are you sure?', 'Are you sure you want to drop this time and shift all later times down earlier in the list?\nThis cannot be undone.')
@@ -509,18 +461,17 @@ class TimingWin(Gtk.Window):
                 response = rmtime_dialog.run()
                 rmtime_dialog.destroy()
                 if response == Gtk.ResponseType.YES:
-                    # Make the shift in self.rawtimes and self.offset
-                    self.rawtimes['times'].pop(timeidx)
-                    self.offset -= 1
+                    # Make the shift in the raw times
+                    timeidx = self.engine.drop_time(row)
                     # And now shift everything on the display.
                     rowcounter = int(row)
                     for i in range(timeidx-1, -1, -1):
                         # Write rawtimes[i] into row rowcounter
                         treeiter = self.timemodel.get_iter((rowcounter,))
-                        self.timemodel.set_value(treeiter, 1, str(self.rawtimes['times'][i]))
+                        self.timemodel.set_value(treeiter, 1, str(self.rawtimes.get_time(i)))
                         rowcounter -= 1
                     # Now we tackle the last value - there are two possibilities.
-                    if self.offset < 0:
+                    if self.rawtimes.offset < 0:
                         # There is a buffer of IDs, and this one should be cleared.
                         treeiter = self.timemodel.get_iter((rowcounter,))
                         self.timemodel.set_value(treeiter, 1, '')
@@ -536,52 +487,19 @@ class TimingWin(Gtk.Window):
         ffilter = Gtk.FileFilter()
         ffilter.set_name('Timing results')
         ffilter.add_pattern('*_times.json')
+        ffilter.add_pattern('*_times.journal')
         chooser.add_filter(ffilter)
         response = chooser.run()
         if response == Gtk.ResponseType.OK:
             filename = chooser.get_filename()
             try:
-                with open(filename, 'r', encoding='utf-8') as fin:
-                    saveresults = json.load(fin)
-                newrawtimes = saveresults['rawtimes']
-                if isMerge:
-                    if self.rawtimes['ids'] and not self.rawtimes['times']:
-                        if newrawtimes['times'] and not newrawtimes['ids']:
-                            #Merge! We have IDs, merge in times.
-                            self.rawtimes['times'] = list(newrawtimes['times'])
-                        else:
-                            raise MergeError('Must be pure IDs merged into pure times, or vice versa')
-                    elif self.rawtimes['times'] and not self.rawtimes['ids']:
-                        if newrawtimes['ids'] and not newrawtimes['times']:
-                            #Merge! We have times, merge in IDS.
-                            self.rawtimes['ids'] = list(newrawtimes['ids'])
-                        else:
-                            raise MergeError('Must be pure IDs merged into pure times, or vice versa')
-                    else:
-                        raise MergeError('Must be pure IDs merged into pure times, or vice versa')
-                else:
-                    self.rawtimes['ids'] = newrawtimes['ids']
-                    self.rawtimes['times'] = newrawtimes['times']
-                    #self.timestr = saveresults['timestr'] #We will _not_ overwrite when resuming.
-                    self.t0 = saveresults['t0']
+                self.engine.load(filename, isMerge)
+                if not isMerge:
                     GLib.timeout_add(100, self.update_clock) #start the stopwatch
-                # Recompute how many racers have checked in
-                self.racers_in = [0] * self.numlaps
-                for ID in self.rawtimes['ids']:
-                    self.update_racers(ID)
-                self.offset = len(self.rawtimes['times']) - len(self.rawtimes['ids'])
                 # Update racers' label
                 self.update_racers_label()
                 self.timemodel.clear()
-                if self.offset >= 0:
-                    adj_ids = ['' for i_unused in range(self.offset)]
-                    adj_ids.extend(self.rawtimes['ids'])
-                    adj_times = list(self.rawtimes['times'])
-                elif self.offset < 0:
-                    adj_times = ['' for i_unused in range(-self.offset)]
-                    adj_times.extend(self.rawtimes['times'])
-                    adj_ids = list(self.rawtimes['ids'])
-                for entry in zip(adj_ids, adj_times):
+                for entry in self.rawtimes.rows():
                     self.timemodel.append(list(entry))
             except (IOError, ValueError, TypeError, MergeError) as e:
                 error_dialog = MsgDialog(self, 'error', ['ok'], 'Oops...', 'ERROR: Failed to %s : %s.' % ('merge' if isMerge else 'resume', e))
@@ -592,12 +510,7 @@ class TimingWin(Gtk.Window):
     def save_times(self, jnk_unused):
         '''Handles click on the Save button
            jsonn dump to the already specified filename'''
-        saveresults = {}
-        saveresults['rawtimes'] = self.rawtimes
-        saveresults['timestr'] = self.timestr
-        saveresults['t0'] = self.t0
-        with open(os.path.join(self.path, os.path.basename(self.path)+'_'+self.timestr+'_times.json'), 'w', encoding='utf-8') as fout:
-            json.dump(saveresults, fout)
+        self.engine.save()
         md = MsgDialog(self, 'information', ['ok'], 'Saved!', 'Times saved!')
         md.run()
         md.destroy()
@@ -612,17 +525,10 @@ class TimingWin(Gtk.Window):
             return
         elif response2 == Gtk.ResponseType.YES:
             self.save_times(None)
+        logging.getLogger('fstimer').debug('Timing: %s', self.eventclock.summary())
+        self.engine.close()
         self.hide()
 
-    def update_racers(self, ID):
-        '''Updates racers_reg and racers_in after arrival of user ID'''
-        self.lapcounter[ID] += 1
-        for i in range(self.numlaps):
-            if ID in self.racers_reg[i]:
-                self.racers_reg[i].remove(ID)
-                self.racers_in[i] += 1
-                break
-
     def record_time(self, jnk_unused):
         '''Handles a hit on enter in the entry box.
            An ID with times in the buffer gives the oldest (that is, fastest)
@@ -630,45 +536,33 @@ class TimingWin(Gtk.Window):
            An ID with no times in the buffer is added to a buffer of IDs
            An ID with the marktime symbol in it will first apply the ID
            and then mark the time.'''
-        txt = self.entrybox.get_text()
-        timemarks = txt.count(self.timebtn)
-        txt = txt.replace(self.timebtn, '')
-        # it is actually a result. (or a pass, which we treat as a result)
-        # prepend to raw
-        self.rawtimes['ids'].insert(0, txt)
-        # add to the appropriate spot on timemodel.
-        if self.offset > 0:
-            # we have a time in the store to assign it to
-             # put it in the last available time slot
-            self.timemodel.set_value(self.timemodel.get_iter(self.offset-1), 0, txt)
-        else:
-            # It will just be added to the buffer of IDs by prepending to timemodel
-            self.timemodel.prepend([txt, ''])
-        self.offset -= 1
-        for jnk_unused in range(timemarks):
-            self.new_blank_time()
-        # update the racer count.
-        try:
-            self.update_racers(txt)
-            self.update_racers_label()
-        except ValueError:
-            pass
+        mono_ns, skew_ns = self.key_time()
+        timemarks = self.engine.enter(self.entrybox.get_text(), mono_ns, skew_ns)
+        self.show_new_entries(1, timemarks)
+        self.update_racers_label()
         self.entrybox.set_text('')
 
-    def new_blank_time(self):
-        '''Record a new time'''
-        t = time_format(time.time()-self.t0)
-        self.rawtimes['times'].insert(0, t) #we prepend to rawtimes, just as we prepend to timemodel
-        if self.offset >= 0:
-            # No IDs in the buffer, so just prepend it to the liststore.
-            self.timemodel.prepend(['', t])
-        elif self.offset < 0:
-            # IDs in the buffer, so add the time to the oldest ID
-            # put it in the last available ID slot
-            self.timemodel.set_value(self.timemodel.get_iter(-self.offset-1), 1, t)
-        self.offset += 1
+    def new_blank_time(self, mono_ns=None, skew_ns=0):
+        '''Record a new time, taken now or at the given monotonic reading'''
+        self.engine.mark_time(mono_ns, skew_ns)
+        self.show_new_entries(0, 1)
         self.entrybox.set_text('')
 
+    def show_new_entries(self, nids, ntimes):
+        '''Displays the nids most recent IDs and the ntimes most recent times.
+           New rows are added at the top, and a new ID or time goes to the
+           oldest row that is still waiting for one.'''
+        new_rows = len(self.rawtimes) - len(self.timemodel)
+        for i_unused in range(new_rows):
+            self.timemodel.prepend(['', ''])
+        offset = self.rawtimes.offset
+        for i in range(nids):
+            row = i + max(0, offset)
+            self.timemodel.set_value(self.timemodel.get_iter(row), 0, self.rawtimes.get_id(i))
+        for i in range(ntimes):
+            row = i + max(0, -offset)
+            self.timemodel.set_value(self.timemodel.get_iter(row), 1, self.rawtimes.get_time(i))
+
     def print_csv(self, pytimer):
         res = print_times(pytimer, True)  # True is to print csv
         # Display message that was successful
@@ -677,6 +571,22 @@ class TimingWin(Gtk.Window):
         md.run()
         md.destroy()
 
+    def print_awards(self, pytimer):
+        print_awards(pytimer, False)
+        # Display message that was successful
+        md = MsgDialog(pytimer.timewin, 'information', ['ok'], 'Success!',
+                       "Award sheets saved to HTML.")
+        md.run()
+        md.destroy()
+
+    def print_json(self, pytimer):
+        print_json(pytimer)
+        # Display message that was successful
+        md = MsgDialog(pytimer.timewin, 'information', ['ok'], 'Success!',
+                       "Results exported to JSON.")
+        md.run()
+        md.destroy()
+
     def print_html(self, btn_unused, pytimer):
         res = print_times(pytimer, False)
         # Display message that was successful
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Write-ahead journal of a timing session.
+
+   Every change made to the TimingLog of a session is appended as one line
+   of json to a _times.journal file, so that nothing is lost if the timing
+   computer crashes between two clicks on Save. Lines are flushed as they
+   are written, and fsync'ed at most every fsync_interval seconds, when
+   something was written since the last fsync.
+   The journal is regularly compacted into a _times.snapshot file, which
+   has the same content as a saved _times.json file, plus the sequence
+   number of the last event it includes. Changes that replace the whole
+   log (loading or merging a saved session) go straight to a snapshot.'''
+
+import json
+import logging
+import os
+import time
+from fstimer.timinglog import TimingLog, time_from_json
+
+# Default number of seconds between two fsync of the journal
+FSYNC_INTERVAL = 1.0
+# The journal is compacted once it holds at least this many events, and at
+# least as many events as there are entries in the log, which keeps the
+# amortized cost of the snapshots constant per event.
+MIN_COMPACTION = 1000
+
+def snapshot_filename(filename):
+    '''Returns the name of the snapshot file going with a journal'''
+    return os.path.splitext(filename)[0] + '.snapshot'
+
+class TimingJournal(object):
+    '''Journal of the changes made to a TimingLog'''
+
+    def __init__(self, filename, timestr, t0=0., fsync_interval=FSYNC_INTERVAL,
+                 min_compaction=MIN_COMPACTION):
+        '''constructor
+           @type filename: string
+           @param filename: path of the journal file
+           @type timestr: string
+           @param timestr: time string identifying the timing session
+           @type t0: float
+           @param t0: race start time
+           @type fsync_interval: float
+           @param fsync_interval: maximal number of seconds between two fsync
+           @type min_compaction: int
+           @param min_compaction: minimal number of events before compaction'''
+        self.filename = filename
+        self.snapshot_filename = snapshot_filename(filename)
+        self.timestr = timestr
+        self.t0 = t0
+        self.fsync_interval = fsync_interval
+        self.min_compaction = min_compaction
+        self.log = None
+        self.seq = 0
+        self.nevents = 0
+        # Whether something was written since the last fsync
+        self.dirty = False
+        self.last_sync = time.monotonic()
+        self.fout = open(self.filename, 'a', encoding='utf-8')
+
+    def attach(self, log):
+        '''Starts journaling the changes of a TimingLog.
+           Its current content is written to a snapshot first.'''
+        self.log = log
+        log.journal = self
+        self.compact()
+
+    def record(self, op, *args):
+        '''Appends an event to the journal.
+           The log calls this before applying the change, so compaction is
+           done here, when all of the previous events have been applied.'''
+        if self.log is not None and \
+           self.nevents >= max(self.min_compaction,
+                               len(self.log.idlist) + len(self.log.timelist)):
+            self.compact()
+        self.seq += 1
+        self.fout.write(json.dumps([self.seq, op] + list(args)) + '\n')
+        self.fout.flush()
+        self.nevents += 1
+        self.dirty = True
+        if time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def record_t0(self, t0):
+        '''Appends a change of the race start time to the journal'''
+        self.t0 = t0
+        self.record('t0', t0)
+
+    def sync(self):
+        '''Forces the journal to the disk.
+           Returns False once the journal is closed, so it can be used
+           as a GLib timeout callback.'''
+        if self.fout.closed:
+            return False
+        if self.dirty:
+            os.fsync(self.fout.fileno())
+            self.dirty = False
+            self.last_sync = time.monotonic()
+        return True
+
+    def compact(self):
+        '''Writes the current state of the log to the snapshot file,
+           and truncates the journal'''
+        saveresults = {}
+        saveresults['rawtimes'] = self.log.as_dict()
+        saveresults['timestr'] = self.timestr
+        saveresults['t0'] = self.t0
+        saveresults['seq'] = self.seq
+        tmpname = self.snapshot_filename + '.tmp'
+        with open(tmpname, 'w', encoding='utf-8') as fout:
+            json.dump(saveresults, fout)
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(tmpname, self.snapshot_filename)
+        # The events up to self.seq are now in the snapshot. If we crash
+        # before the truncation, replay() skips them.
+        self.fout.truncate(0)
+        self.dirty = True
+        self.sync()
+        self.nevents = 0
+
+    def close(self):
+        '''Flushes and closes the journal'''
+        if not self.fout.closed:
+            self.sync()
+            self.fout.close()
+        if self.log is not None:
+            self.log.journal = None
+
+def apply_event(log, op, args, clocks):
+    '''Applies a journal event to a TimingLog.
+       clocks is used to share RaceClock objects between the time marks.'''
+    if op == 'id':
+        log.add_id(*args)
+    elif op == 'time':
+        log.add_time(time_from_json(args[0], clocks))
+    elif op == 'setid':
+        log.set_id(*args)
+    elif op == 'settime':
+        log.set_time(args[0], time_from_json(args[1], clocks))
+    elif op == 'shift':
+        log.shift_time(*args)
+    elif op == 'popid':
+        log.pop_id(*args)
+    elif op == 'poptime':
+        log.pop_time(*args)
+    elif op == 'edit':
+        log.edit_row(*args)
+    else:
+        raise ValueError('Unknown journal event ' + str(op))
+
+def replay(filename):
+    '''Rebuilds a timing session from a journal and its snapshot.
+       Returns a dictionary with the same content as a _times.json file.'''
+    logger = logging.getLogger('fstimer')
+    saveresults = {'rawtimes': {'times': [], 'ids': []}, 'timestr': '', 't0': 0.}
+    seq = 0
+    snapshot = snapshot_filename(filename)
+    if os.path.exists(snapshot):
+        with open(snapshot, 'r', encoding='utf-8') as fin:
+            saveresults = json.load(fin)
+        seq = saveresults.pop('seq', 0)
+    log = TimingLog.from_dict(saveresults['rawtimes'])
+    clocks = {}
+    with open(filename, 'r', encoding='utf-8') as fin:
+        for line in fin:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # The last line can be cut short by a crash
+                logger.debug('Journal %s: ignoring bad line %r', filename, line)
+                break
+            if event[0] <= seq:
+                continue  # already in the snapshot
+            if event[1] == 't0':
+                saveresults['t0'] = event[2]
+            else:
+                apply_event(log, event[1], event[2:], clocks)
+    saveresults['rawtimes'] = log.as_dict()
+    return saveresults
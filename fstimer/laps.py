@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Lap times of multi lap races, kept as numbers.
+
+   The times at which a racer completed each lap are kept sorted, in
+   milliseconds. Splits and totals are computed from them, and they are
+   only formatted when a printout reads them.'''
+
+from bisect import bisect_left, insort
+from collections import defaultdict
+from fstimer.time_ops import format_ms
+
+class LapTimes(object):
+    '''The lap times of a racer, as printed in the Lap Times column:
+       a read-only sequence of strings like '2 - 10:02.3'. They are formatted
+       the first time they are read, and kept for the other printouts.'''
+    __slots__ = ('marks', 'texts')
+
+    def __init__(self, marks):
+        '''constructor
+           @type marks: list
+           @param marks: sorted times in ms at which each lap was completed'''
+        self.marks = marks
+        self.texts = None
+
+    def __len__(self):
+        return len(self.marks)
+
+    def split(self, i):
+        '''Returns the time in ms of lap i (from 0)'''
+        if i == 0:
+            return self.marks[0]
+        return self.marks[i] - self.marks[i-1]
+
+    def format(self):
+        '''Returns the printed lap times'''
+        if self.texts is None:
+            marks = self.marks
+            self.texts = ['{} - {}'.format(i + 1, format_ms(
+                marks[i] - marks[i-1] if i else marks[0]))
+                          for i in range(len(marks))]
+        return self.texts
+
+    def __getitem__(self, i):
+        return self.format()[i]
+
+    def __iter__(self):
+        return iter(self.format())
+
+    def __eq__(self, other):
+        if isinstance(other, (LapTimes, list)):
+            return self.format() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'LapTimes(%r)' % (self.marks,)
+
+def group_laps(timeslist):
+    '''Groups the (tag, time in ms) items of a race by tag, in one pass.
+       Returns the sorted lap times of each tag, with the tags in the order
+       of their first lap (for ties, the order of timeslist). Times that
+       are None are left out.'''
+    marks = defaultdict(list)
+    # (first lap time, index) of each tag
+    first = {}
+    for i, (tag, time) in enumerate(timeslist):
+        if time is None:
+            continue
+        marks[tag].append(time)
+        if tag not in first or time < first[tag][0]:
+            first[tag] = (time, i)
+    laps = {}
+    for tag in sorted(first, key=first.get):
+        tag_marks = marks[tag]
+        # Mostly in order already, which makes this linear
+        tag_marks.sort()
+        laps[tag] = tag_marks
+    return laps
+
+class LapTracker(object):
+    '''The laps of each tag of a race, kept sorted as times come in,
+       are edited or dropped. Each lap is (time in ms, order), where the
+       order breaks the ties between laps of the same time.'''
+
+    def __init__(self):
+        self.laps = {}
+
+    def add(self, tag, time, order):
+        '''Adds a lap to a tag'''
+        laps = self.laps.setdefault(tag, [])
+        if not laps or laps[-1] < (time, order):
+            # Laps mostly come in order
+            laps.append((time, order))
+        else:
+            insort(laps, (time, order))
+
+    def remove(self, tag, time, order):
+        '''Removes a lap from a tag'''
+        laps = self.laps[tag]
+        del laps[bisect_left(laps, (time, order))]
+        if not laps:
+            del self.laps[tag]
+
+    def get(self, tag):
+        '''Returns the sorted (time, order) laps of a tag'''
+        return self.laps.get(tag, [])
+
+    def lap_times(self, tag):
+        '''Returns the LapTimes of a tag'''
+        return LapTimes([time for time, order_unused in self.get(tag)])
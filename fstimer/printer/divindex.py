@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Index of the divisions of a project, to find the divisions of a
+   registration without checking all of them'''
+
+import math
+from bisect import bisect_right
+from collections import defaultdict
+
+def is_range(value):
+    '''Whether value is a [low, high] range of finite numbers'''
+    return (isinstance(value, (list, tuple)) and len(value) == 2 and
+            all(isinstance(x, (int, float)) and not isinstance(x, bool) and
+                math.isfinite(x) for x in value))
+
+def is_hashable(value):
+    '''Whether value can be a dictionary key'''
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+class IntervalIndex(object):
+    '''The divisions that contain each integer value, for a set of
+       inclusive [low, high] ranges'''
+
+    def __init__(self, ranges):
+        '''constructor
+           @type ranges: list
+           @param ranges: (low, high, division index) items'''
+        # An integer val is in [low, high] iff ceil(low) <= val < floor(high)+1
+        bounds = set()
+        for low, high, idx_unused in ranges:
+            bounds.add(math.ceil(low))
+            bounds.add(math.floor(high) + 1)
+        self.bounds = sorted(bounds)
+        # The divisions of each segment [bounds[i], bounds[i+1])
+        self.segments = [[] for i_unused in self.bounds]
+        for low, high, idx in ranges:
+            start = self.bounds.index(math.ceil(low))
+            stop = self.bounds.index(math.floor(high) + 1)
+            for i in range(start, stop):
+                self.segments[i].append(idx)
+
+    def find(self, val):
+        '''Returns the divisions whose range contains val'''
+        i = bisect_right(self.bounds, val) - 1
+        if i < 0:
+            return []
+        return self.segments[i]
+
+class DivisionIndex(object):
+    '''Compiled form of the divisions of a project.
+       Divisions are grouped by the fields they test for equality and by
+       their first range field. In each group, the equality values are a
+       hash key, and the ranges are in an IntervalIndex, so only the
+       divisions that match are looked at. Divisions that can't be indexed
+       (e.g. malformed ranges) are checked one by one, as in the reference
+       get_divisions of benchmarks/bench_race.py.'''
+
+    def __init__(self, divisions, fieldsdic):
+        '''constructor
+           @type divisions: list
+           @param divisions: the [name, {field: value or [low, high]}] divisions
+           @type fieldsdic: dict
+           @param fieldsdic: description of the fields'''
+        self.names = [div[0] for div in divisions]
+        self.fieldsdic = fieldsdic
+        # The fields read as integers
+        self.int_fields = set()
+        # The divisions checked one by one
+        self.generic = []
+        # (eq fields, range field) -> {eq values: divisions or IntervalIndex}
+        groups = defaultdict(lambda: defaultdict(list))
+        # The range constraints beyond the first one, checked on the matches
+        self.extra_ranges = {}
+        for idx, div in enumerate(divisions):
+            eq_fields = []
+            ranges = []
+            indexable = True
+            for field, value in sorted(div[1].items()):
+                if field not in fieldsdic:
+                    indexable = False
+                elif fieldsdic[field]['type'] == 'entrybox_int':
+                    indexable = is_range(value)
+                    ranges.append((field, value[0], value[1]) if indexable else None)
+                else:
+                    indexable = is_hashable(value)
+                    eq_fields.append((field, value))
+                if not indexable:
+                    break
+            if not indexable:
+                self.generic.append(div)
+                continue
+            key = (tuple(field for field, value_unused in eq_fields),
+                   ranges[0][0] if ranges else None)
+            values = tuple(value for field_unused, value in eq_fields)
+            groups[key][values].append(
+                (ranges[0][1], ranges[0][2], idx) if ranges else idx)
+            self.int_fields.update(field for field, low_unused, high_unused in ranges)
+            if len(ranges) > 1:
+                self.extra_ranges[idx] = ranges[1:]
+        self.groups = []
+        for (eq_fields, range_field), buckets in groups.items():
+            if range_field is not None:
+                buckets = {values: IntervalIndex(ranges)
+                           for values, ranges in buckets.items()}
+            else:
+                buckets = dict(buckets)
+            self.groups.append((eq_fields, range_field, buckets))
+        self.order = {name: i for i, name in enumerate(self.names)}
+
+    def get_divisions(self, reg):
+        '''Returns the names of the divisions of a registration,
+           in the order of the divisions'''
+        ints = {}
+        for field in self.int_fields:
+            try:
+                ints[field] = int(reg[field])
+            except (ValueError, TypeError):
+                ints[field] = None
+        found = []
+        for eq_fields, range_field, buckets in self.groups:
+            bucket = buckets.get(tuple(reg[field] for field in eq_fields))
+            if bucket is None:
+                continue
+            if range_field is None:
+                found.extend(bucket)
+            elif ints[range_field] is not None:
+                for idx in bucket.find(ints[range_field]):
+                    if idx not in self.extra_ranges or all(
+                            ints[field] is not None and low <= ints[field] <= high
+                            for field, low, high in self.extra_ranges[idx]):
+                        found.append(idx)
+        if len(found) > 1:
+            found.sort()
+        mydivs = [self.names[idx] for idx in found]
+        if self.generic:
+            mydivs.extend(self.check_generic(reg))
+            mydivs.sort(key=self.order.get)
+        return mydivs
+
+    def check_generic(self, reg):
+        '''Returns the divisions of a registration among the ones that are
+           not indexed, checking them one by one'''
+        mydivs = []
+        for div in self.generic:
+            for field in div[1]:
+                if self.fieldsdic[field]['type'] == 'entrybox_int':
+                    try:
+                        val = int(reg[field])
+                        if val < div[1][field][0] or val > div[1][field][1]:
+                            break
+                    except ValueError:
+                        break
+                else:
+                    if reg[field] != div[1][field]:
+                        break
+            else:
+                mydivs.append(div[0])
+        return mydivs
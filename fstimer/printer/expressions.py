@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Compilation of the printfields expressions.
+
+   A printfield is a Python expression where {Time} is the time in seconds,
+   {ID} the ID, and {field} the value of a registration field (an integer
+   for number entry fields). It is compiled once into a function
+   fn(tag, time, lap_time, userdata) of the ID, the time in milliseconds,
+   the lap times and the registration, which is then called for each row.'''
+
+import ast
+import builtins
+import functools
+import re
+
+# The arguments of the compiled functions
+ARGS = ('tag', 'time', 'lap_time', 'userdata')
+# Exceptions of a compiled function that just leave its cell empty, e.g.
+# int() of a blank number field
+ROW_ERRORS = (TypeError, AttributeError, ValueError)
+
+class PrintFieldError(Exception):
+    '''Exception launched when a printfield expression is not valid'''
+    pass
+
+class BindFields(ast.NodeTransformer):
+    '''Replaces the placeholder names of the fields by their value'''
+
+    def __init__(self, placeholders):
+        '''constructor
+           @type placeholders: dict
+           @param placeholders: placeholder name -> expression of its value'''
+        self.placeholders = placeholders
+
+    def visit_Name(self, node):
+        if node.id in self.placeholders:
+            value = ast.parse(self.placeholders[node.id], mode='eval').body
+            return ast.copy_location(value, node)
+        return node
+
+def check_names(tree, allowed):
+    '''Raises PrintFieldError if the expression uses a name that is not
+       allowed, or a special attribute'''
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id not in allowed:
+            raise PrintFieldError('Unknown name {}'.format(node.id))
+        if isinstance(node, ast.Attribute) and node.attr.startswith('__'):
+            raise PrintFieldError('Cannot use attribute {}'.format(node.attr))
+
+@functools.lru_cache(maxsize=256)
+def _compile(text, fields, int_fields):
+    placeholders = {}
+    def placeholder(match):
+        name = match.group(1)
+        if name == 'Time':
+            value = '(time / 1000.)'
+        elif name == 'ID':
+            value = 'tag'
+        elif name in fields:
+            if name in int_fields:
+                value = 'int(userdata[{!r}])'.format(name)
+            else:
+                value = 'userdata[{!r}]'.format(name)
+        else:
+            raise PrintFieldError('Cannot find variable {}'.format(name))
+        key = '_field{}_'.format(len(placeholders))
+        placeholders[key] = value
+        return key
+    source = re.sub(r'\{([^}]+)\}', placeholder, text)
+    try:
+        tree = ast.parse(source.strip(), mode='eval')
+    except SyntaxError as e:
+        raise PrintFieldError('Invalid syntax: {}'.format(e.msg))
+    check_names(tree, set(placeholders) | set(ARGS) | set(dir(builtins)))
+    tree = BindFields(placeholders).visit(tree)
+    fn = ast.Expression(ast.Lambda(
+        args=ast.arguments(posonlyargs=[], args=[ast.arg(arg) for arg in ARGS],
+                           kwonlyargs=[], kw_defaults=[], defaults=[]),
+        body=tree.body))
+    ast.fix_missing_locations(fn)
+    return eval(compile(fn, '<printfield>', 'eval'), {'__builtins__': builtins})
+
+def compile_printfield(text, fields, fieldsdic):
+    '''Compiles a printfield expression into a function
+       fn(tag, time, lap_time, userdata).
+       Raises PrintFieldError if it isn't a valid expression or it refers to
+       an unknown field. The same expression on the same fields gives back
+       the same function.'''
+    int_fields = frozenset(field for field in fields
+                           if fieldsdic[field]['type'] == 'entrybox_int')
+    return _compile(text, tuple(fields), int_fields)
+
+def lap_times_fn(tag, time, lap_time, userdata):
+    '''Column function of the Lap Times column'''
+    return lap_time
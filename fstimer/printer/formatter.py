@@ -22,37 +22,232 @@
 Format results for printing
 """
 
+import heapq
+import json
+import logging
 import os
+import shutil
+import tempfile
 from fstimer.printer.printcsv import CSVPrinter
 from fstimer.printer.printcsvlaps import CSVPrinterLaps
 from fstimer.printer.printhtml import HTMLPrinter
 from fstimer.printer.printhtmllaps import HTMLPrinterLaps
+from fstimer.printer.printjson import JSONPrinter
 from collections import defaultdict
-from fstimer.time_ops import time_format, time_parse, time_diff
+from fstimer.time_ops import time_format, parse_many
+from fstimer.timinglog import TimingLog
+from fstimer.standings import Standings
+from fstimer.laps import LapTimes, group_laps
+from fstimer.printer.divindex import DivisionIndex
+from fstimer.printer.expressions import (compile_printfield, lap_times_fn,
+                                         ROW_ERRORS, PrintFieldError)
+
+# Size of the write buffer of the printout files
+PRINTOUT_BUFFER = 1 << 16
 
 def print_times(pytimer, use_csv):
     '''print times to files'''
     # Figure out what the columns will be.
     cols = get_results_columns(pytimer)
     col_fns = get_col_fns(pytimer, cols)
-    # Get the list of different things we will rank by
-    ranking_keys = set(pytimer.rankings.values())
     # Get the printer
     printer = get_printer(pytimer, cols, use_csv, True)
-    # Build the results
-    ranked_results = {}
-    for ranking_key in ranking_keys:
-        ranked_results[ranking_key] = get_sorted_results(
-            pytimer.projecttype, pytimer.passid, pytimer.numlaps,
-            pytimer.variablelaps, pytimer.timing, pytimer.rawtimes,
-            ranking_key, cols, col_fns)
+    # The results are sorted by the live standings
+    standings = get_standings(pytimer, cols, col_fns)
     fname_overall = '_'.join([os.path.basename(pytimer.path),
                               pytimer.timewin.timestr, 'alltimes'])
     fname_cat = '_'.join([os.path.basename(pytimer.path),
                           pytimer.timewin.timestr, 'divtimes'])
-    gen_printouts(
-        pytimer.timing, pytimer.fieldsdic, pytimer.divisions, pytimer.rankings,
-        pytimer.path, printer, ranked_results, fname_overall, fname_cat)
+    with printout_file(pytimer.path, fname_overall, printer) as scratch_out:
+        scratch_out.write(printer.header())
+        write_table(scratch_out, standings, printer, 'Overall')
+        scratch_out.write(printer.footer())
+    with printout_file(pytimer.path, fname_cat, printer) as div_out:
+        div_out.write(printer.header())
+        for div in pytimer.divisions:
+            write_table(div_out, standings, printer, div[0])
+        div_out.write(printer.footer())
+
+def print_json(pytimer):
+    '''export the results to a newline delimited json file, with one object
+       per finisher in overall order, and a json manifest of the divisions'''
+    cols = get_results_columns(pytimer)
+    col_fns = get_col_fns(pytimer, cols)
+    printer = get_printer(pytimer, cols, False, True, use_json=True)
+    standings = get_standings(pytimer, cols, col_fns)
+    printer.places_fn = lambda tag: {
+        div: standings.place(tag, div) for div in standings.tag_lists[tag][1:]}
+    fname = '_'.join([os.path.basename(pytimer.path),
+                      pytimer.timewin.timestr, 'results'])
+    with printout_file(pytimer.path, fname, printer) as results_out:
+        printer.write_scratch_table(results_out, standings.ranked('Overall'))
+    # The manifest goes last, and is replaced at once, so that it never
+    # announces results that are not written yet
+    manifest = {'results': fname + '.' + printer.file_extension(),
+                'timestr': pytimer.timewin.timestr,
+                'fields': cols,
+                'ranking': pytimer.rankings['Overall'],
+                'finishers': standings.count('Overall'),
+                'version': standings.version('Overall'),
+                'divisions': []}
+    for div in pytimer.divisions:
+        manifest['divisions'].append({'name': div[0],
+                                      'definition': div[1],
+                                      'ranking': pytimer.rankings[div[0]],
+                                      'finishers': standings.count(div[0]),
+                                      'version': standings.version(div[0])})
+    manifest_file = os.path.join(pytimer.path, '_'.join([
+        os.path.basename(pytimer.path), pytimer.timewin.timestr,
+        'divisions.json']))
+    with open(manifest_file + '.tmp', 'w', encoding='utf-8') as fout:
+        json.dump(manifest, fout, indent=1)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+class Tee(object):
+    '''File-like object writing to several files at once'''
+
+    def __init__(self, *outs):
+        self.outs = outs
+
+    def write(self, text):
+        for out in self.outs:
+            out.write(text)
+
+class TableCache(object):
+    '''The rendered tables of the printouts, by printer and ranking, with
+       the version of the results they were rendered at. The tables are
+       kept in the files of a temporary directory, not in memory, and are
+       copied from there while their results don't change.'''
+
+    def __init__(self):
+        self.tmpdir = None
+        # key -> (version, file of the table)
+        self.tables = {}
+
+    def write(self, out, key, version, render):
+        '''Writes the table of a key to out. render(out) renders it, if it
+           is not there at this version.'''
+        cached = self.tables.get(key)
+        if cached is not None and cached[0] == version:
+            with open(cached[1], 'r', encoding='utf-8') as fin:
+                shutil.copyfileobj(fin, out)
+            return
+        if self.tmpdir is None:
+            self.tmpdir = tempfile.TemporaryDirectory(prefix='fstimer')
+        if cached is None:
+            filename = os.path.join(self.tmpdir.name, str(len(self.tables)))
+        else:
+            filename = cached[1]
+        # Not valid until it is fully written
+        self.tables.pop(key, None)
+        with open(filename, 'w', encoding='utf-8') as table_out:
+            render(Tee(out, table_out))
+        self.tables[key] = (version, filename)
+
+    def close(self):
+        '''Removes the tables'''
+        if self.tmpdir is not None:
+            self.tmpdir.cleanup()
+            self.tmpdir = None
+        self.tables = {}
+
+def write_table(out, standings, printer, name):
+    '''Writes the table of the results overall or in a division to out.
+       Tables are kept in standings.rendered, and only rendered again when
+       their results changed since the last printout.'''
+    if name == 'Overall':
+        render = lambda table_out: printer.write_scratch_table(
+            table_out, standings.ranked(name))
+    else:
+        render = lambda table_out: printer.write_cat_table(
+            table_out, name, standings.ranked(name))
+    standings.rendered.write(out, (type(printer), name),
+                             standings.version(name), render)
+
+def print_awards(pytimer, use_csv, topn=3):
+    '''print the award sheets, with the top finishers overall and in each
+       division, to a file'''
+    cols = get_results_columns(pytimer)
+    col_fns = get_col_fns(pytimer, cols)
+    printer = get_printer(pytimer, cols, use_csv, True,
+                          ['Overall'] + [div[0] for div in pytimer.divisions])
+    result_rows = get_result_rows(
+        pytimer.projecttype, pytimer.passid, pytimer.numlaps,
+        pytimer.variablelaps, pytimer.timing, pytimer.rawtimes, col_fns)
+    divindex = DivisionIndex(pytimer.divisions, pytimer.fieldsdic)
+    top_results = get_top_results(
+        result_rows, pytimer.rankings, pytimer.divisions,
+        lambda tag: divindex.get_divisions(pytimer.timing[tag]), cols, topn)
+    fname = '_'.join([os.path.basename(pytimer.path),
+                      pytimer.timewin.timestr, 'awards'])
+    with printout_file(pytimer.path, fname, printer) as awards_out:
+        awards_out.write(printer.header())
+        for name in ['Overall'] + [div[0] for div in pytimer.divisions]:
+            printer.write_cat_table(awards_out, name, top_results[name])
+        awards_out.write(printer.footer())
+
+def get_standings(pytimer, cols, col_fns):
+    '''Returns the live standings of the race, up to date with the raw
+       times. They are kept in pytimer.standings, and only rebuilt when the
+       setup of the race or the registration changes.'''
+    config = (pytimer.projecttype, pytimer.passid, pytimer.numlaps,
+              pytimer.variablelaps, cols, col_fns, repr(pytimer.divisions),
+              repr(sorted(pytimer.rankings.items())), repr(pytimer.fieldsdic))
+    standings = getattr(pytimer, 'standings', None)
+    if standings is not None:
+        if standings.log is pytimer.rawtimes and standings.config == config:
+            if standings.timing is not pytimer.timing:
+                # The registration was edited: only the tags whose
+                # registration changed are ranked again
+                registrations = registration_values(pytimer.timing,
+                                                    pytimer.fields)
+                missing = (None,) * len(pytimer.fields)
+                changed = [tag for tag in set(registrations) | set(standings.registrations)
+                           if registrations.get(tag, missing) !=
+                           standings.registrations.get(tag, missing)]
+                standings.timing = pytimer.timing
+                standings.registrations = registrations
+                standings.update_registrations(changed)
+            standings.refresh()
+            return standings
+        standings.close()
+        standings.rendered.close()
+    if isinstance(pytimer.rawtimes, TimingLog):
+        log = pytimer.rawtimes
+    else:
+        log = TimingLog.from_dict(pytimer.rawtimes)
+    divisions = pytimer.divisions
+    divindex = DivisionIndex(divisions, pytimer.fieldsdic)
+    # The registrations are read from standings.timing, which follows the
+    # edits of the registration
+    if pytimer.projecttype == 'handicap':
+        handicap_fn = lambda tag: parse_many(
+            [standings.timing[tag]['Handicap']])[0]
+    else:
+        handicap_fn = None
+    standings = Standings(
+        log, pytimer.rankings, [div[0] for div in divisions],
+        {key: cols.index(key) for key in set(pytimer.rankings.values())},
+        lambda tag, time, lap_time: get_result_row(
+            tag, time, {tag: lap_time}, standings.timing, col_fns),
+        lambda tag: divindex.get_divisions(standings.timing[tag]),
+        lambda row: format_result_row(row, cols),
+        handicap_fn, pytimer.passid, pytimer.numlaps, pytimer.variablelaps)
+    standings.timing = pytimer.timing
+    # The field values of each registration, to tell the ones that change
+    standings.registrations = registration_values(pytimer.timing,
+                                                  pytimer.fields)
+    standings.config = config
+    # The rendered tables of the printouts, by printer and ranking
+    standings.rendered = TableCache()
+    standings.refresh()
+    pytimer.standings = standings
+    return standings
+
+def registration_values(timing, fields):
+    '''Returns the values of the fields of each registration'''
+    return {tag: tuple(reg.get(field) for field in fields)
+            for tag, reg in timing.items()}
 
 def print_startsheets(pytimer, use_csv):
     '''print startsheets to files'''
@@ -61,11 +256,9 @@ def print_startsheets(pytimer, use_csv):
     ranking_keys = set(['ID'])
     rankings = defaultdict(lambda: 'ID')
     printer = get_printer(pytimer, cols, use_csv, False)
-    # Build the results
-    ranked_results = {}
-    for ranking_key in ranking_keys:
-        ranked_results[ranking_key] = get_sorted_startsheet(
-                pytimer.timedict, ranking_key, cols, col_fns)
+    # Build the rows once, and sort them for each ranking key
+    ranked_results = rank_results(
+        get_startsheet_rows(pytimer.timedict, col_fns), ranking_keys, cols)
     fname_overall = '_'.join([os.path.basename(pytimer.path),
                               'all_startsheet'])
     fname_cat = '_'.join([os.path.basename(pytimer.path),
@@ -75,65 +268,74 @@ def print_startsheets(pytimer, use_csv):
 
 def gen_printouts(timing_dict, fieldsdic, divisions, rankings, path, printer,
                   ranked_results, fname_overall, fname_cat):
-    scratchresults = printer.scratch_table_header()
-    divresults = {div[0]: printer.cat_table_header(div[0])
-                  for div in divisions}
+    scratch_rows = []
+    div_rows = {div[0]: [] for div in divisions}
+    divindex = DivisionIndex(divisions, fieldsdic)
+    # The divisions of each tag, found once for all of the ranking keys
+    tag_divs = {}
     # Do the ranking for each ranking key
     for ranking_key, results in ranked_results.items():
         for tag, row in results:
             # Add this to the appropriate results
             if rankings['Overall'] == ranking_key:
-                scratchresults += printer.scratch_entry(row)
-            mydivs = get_divisions(timing_dict, tag, divisions, fieldsdic)
+                scratch_rows.append((tag, row))
+            if tag not in tag_divs:
+                tag_divs[tag] = divindex.get_divisions(timing_dict[tag])
+            mydivs = tag_divs[tag]
             for div in mydivs:
                 if rankings[div] == ranking_key:
-                    divresults[div] += printer.scratch_entry(row, div)
-    scratchresults += printer.scratch_table_footer()
-    for div in divresults:
-        divresults[div] += printer.cat_table_footer(div)
-    # now save to files
-    scratch_file = os.path.join(path,
-                                fname_overall + '.' + printer.file_extension())
-    with open(scratch_file, 'w', encoding='utf-8') as scratch_out:
+                    div_rows[div].append((tag, row))
+    write_printouts(divisions, path, printer, scratch_rows, div_rows,
+                    fname_overall, fname_cat)
+
+def write_printouts(divisions, path, printer, scratch_rows, div_rows,
+                    fname_overall, fname_cat):
+    '''Writes the overall and division printouts, given the (tag, row)
+       items of the overall results and of each division. The rows are
+       written to the files as they come, so they can be generated.'''
+    with printout_file(path, fname_overall, printer) as scratch_out:
         scratch_out.write(printer.header())
-        scratch_out.write(scratchresults)
+        printer.write_scratch_table(scratch_out, scratch_rows)
         scratch_out.write(printer.footer())
-    div_file = os.path.join(path,
-                                fname_cat + '.' + printer.file_extension())
-    with open(div_file, 'w', encoding='utf-8') as div_out:
+    with printout_file(path, fname_cat, printer) as div_out:
         div_out.write(printer.header())
         for div in divisions:
-            div_out.write(divresults[div[0]])
+            printer.write_cat_table(div_out, div[0], div_rows[div[0]])
         div_out.write(printer.footer())
 
+def printout_file(path, fname, printer):
+    '''Opens the file of a printout for writing'''
+    filename = os.path.join(path, fname + '.' + printer.file_extension())
+    return open(filename, 'w', encoding='utf-8', buffering=PRINTOUT_BUFFER)
+
 def get_col_fns(pytimer, cols):
-    # Prepare functions for computing each column
+    '''Returns the functions computing each column, compiled from the
+       printfields. A column whose expression is not valid is left empty.'''
     col_fns = []
     for col in cols:
         if col == 'Lap Times':
-            text = 'lap_time'
+            col_fn = lap_times_fn
         else:
-            text = pytimer.printfields[col]
-            # Sub {Time}
-            text = text.replace('{Time}', 'time_parse(time).total_seconds()')
-            # ID
-            text = text.replace('{ID}', "tag")
-            # And the other registration fields
-            for field in pytimer.fields:
-                if field != 'ID':
-                    if pytimer.fieldsdic[field]['type'] == 'entrybox_int':
-                        text = text.replace(
-                            '{' + field + '}',
-                            "int(userdata['{}'])".format(field))
-                    else:
-                        text = text.replace('{' + field + '}',
-                                            "userdata['{}']".format(field))
-        col_fns.append(text)
+            try:
+                col_fn = compile_printfield(pytimer.printfields[col],
+                                            pytimer.fields, pytimer.fieldsdic)
+            except PrintFieldError as e:
+                logging.getLogger('fstimer').error(
+                    'Printfield %s is not valid: %s', col, e)
+                col_fn = empty_fn
+        col_fns.append(col_fn)
     return col_fns
 
-def get_printer(pytimer, cols, use_csv, print_place):
+def empty_fn(tag, time, lap_time, userdata):
+    '''Column function of a column left empty'''
+    return None
+
+def get_printer(pytimer, cols, use_csv, print_place, categories=None,
+                use_json=False):
     # choose the right Printer Class
-    if use_csv:
+    if use_json:
+        printer_class = JSONPrinter
+    elif use_csv:
         if pytimer.numlaps > 1:
             printer_class = CSVPrinterLaps
         else:
@@ -144,8 +346,9 @@ def get_printer(pytimer, cols, use_csv, print_place):
         else:
             printer_class = HTMLPrinter
     # instantiate the printer
-    printer = printer_class(cols, [div[0] for div in pytimer.divisions],
-                            print_place)
+    if categories is None:
+        categories = [div[0] for div in pytimer.divisions]
+    printer = printer_class(cols, categories, print_place)
     return printer
 
 def get_results_columns(pytimer):
@@ -179,31 +382,13 @@ def get_startsheet_columns(pytimer):
             cols.append(field)
     return cols
 
-def get_divisions(timing, tag, divisions, fieldsdic):
-    '''Get the divisions for a given timing entry'''
-    mydivs = []
-    # go through the divisions
-    for div in divisions:
-        # check all fields
-        for field in div[1]:
-            if fieldsdic[field]['type'] == 'entrybox_int':
-                try:
-                    val = int(timing[tag][field])
-                    if val < div[1][field][0] or val > div[1][field][1]:
-                        break
-                except ValueError:
-                    break
-            else:
-                if timing[tag][field] != div[1][field]:
-                    break
-        else:
-            mydivs.append(div[0])
-    return mydivs
-
 def get_sync_times_and_ids(rawtimes):
     '''returns a list of ids and a list of timedeltas that are
         "synced", that is that have the same number of entries.
         Entries without a counterpart are dropped'''
+    if isinstance(rawtimes, TimingLog):
+        # With the live time marks, kept to the millisecond
+        return rawtimes.synced()
     #Note that the newest entries are at the _start_ of the rawtimes lists
     offset = len(rawtimes['times']) - len(rawtimes['ids'])
     if offset < 0:
@@ -217,66 +402,40 @@ def get_sync_times_and_ids(rawtimes):
         adj_times = list(rawtimes['times'])
     return adj_ids, adj_times
 
-def get_sorted_results(projecttype, passid, numlaps, variablelaps, timing,
-                       rawtimes, ranking_key, cols, col_fns):
-    '''returns a sorted list of (id, result) items.
-        The content of result depends on the race type'''
+def get_result_rows(projecttype, passid, numlaps, variablelaps, timing,
+                    rawtimes, col_fns):
+    '''returns the list of (id, result row) items of the results, unsorted.
+        The rows don't depend on the ranking key, so they are computed once
+        and then sorted for each ranking key by rank_results.'''
     # get raw times
-    timeslist = zip(*get_sync_times_and_ids(rawtimes))
-    #Handle blank times, and handicap correction
+    ids, times = get_sync_times_and_ids(rawtimes)
+    #Drop entries with blank tag, blank time, or pass ID
+    timeslist = [(tag, time) for tag, time in zip(ids, times)
+                 if tag and time != '' and tag != passid]
+    # Parse all of the times to milliseconds, once. Times that can't be
+    # parsed become None.
+    tags = [tag for tag, time in timeslist]
+    times_ms = parse_many([time for tag, time in timeslist])
     # Handicap correction
     if projecttype == 'handicap':
-        new_timeslist = []
-        for tag, time in timeslist:
-            if tag and time and tag != passid:
-                try:
-                    new_timeslist.append(
-                        (tag, time_diff(time, timing[tag]['Handicap'])))
-                except AttributeError:
-                    # time or Handicap couldn't be converted to timedelta
-                    new_timeslist.append((tag, '_'))
-            # Else: drop entries with blank tag, blank time, or pass ID
-        timeslist = list(new_timeslist) #replace
-    else:
-        #Drop times that are blank or have the passid
-        timeslist = [(tag, time) for tag, time in timeslist
-                     if tag and time and tag != passid]
+        handicaps = parse_many([timing[tag]['Handicap'] for tag in tags])
+        times_ms = [max(0, t - h) if t is not None and h is not None else None
+                    for t, h in zip(times_ms, handicaps)]
+    timeslist = list(zip(tags, times_ms))
     # Compute lap times, if a lap race
     if numlaps > 1:
-        # multi laps - groups times by tag
-        # Each value of laptimesdic is a list, sorted in order from
-        # earliest time (1st lap) to latest time (last lap).
-        timeslist_sorted = []
-        for (tag, time) in timeslist:
-            try:
-                timeslist_sorted.append((tag, time_parse(time)))
-            except AttributeError:
-                pass
-        timeslist_sorted = sorted(timeslist_sorted, key=lambda x: x[1])
-        laptimesdic = defaultdict(list)
-        for (tag, time) in timeslist_sorted:
-            laptimesdic[tag].append(time_format(time.total_seconds()))
-        # compute the lap times.
+        # multi laps - groups times by tag, sorted in order from earliest
+        # time (1st lap) to latest time (last lap). They are formatted when
+        # printed.
         lap_times = {}
         total_times = {}
-        for tag in laptimesdic:
+        for tag, laps in group_laps(timeslist).items():
             # First put the total race time
-            if len(laptimesdic[tag]) == numlaps or variablelaps:
-                total_times[tag] = laptimesdic[tag][-1]
+            if len(laps) == numlaps or variablelaps:
+                total_times[tag] = laps[-1]
             else:
-                total_times[tag] = '_'
-            # And the first lap
-            lap_times[tag] = ['1 - ' + laptimesdic[tag][0]]
-            # And now the subsequent laps
-            for ii in range(len(laptimesdic[tag])-1):
-                try:
-                    lap_times[tag].append(
-                        '{} - {}'.format(
-                            ii + 2,
-                            time_diff(laptimesdic[tag][ii+1],
-                                      laptimesdic[tag][ii])))
-                except AttributeError:
-                    lap_times[tag].append(str(ii+2) + ' - _')
+                total_times[tag] = None
+            lap_times[tag] = LapTimes(laps)
         # Now correct timeslist to have the new total times
         timeslist = list(total_times.items())
     else:
@@ -286,9 +445,74 @@ def get_sorted_results(projecttype, passid, numlaps, variablelaps, timing,
     for tag, time in timeslist:
         row = get_result_row(tag, time, lap_times, timing, col_fns)
         result_rows.append((tag, row))
-    # sort by column of ranking_key.
-    rank_indx = cols.index(ranking_key)
-    return sort_results(result_rows, rank_indx, cols)
+    return result_rows
+
+def rank_results(result_rows, ranking_keys, cols):
+    '''returns a dictionary of the sorted list of (id, result) items for
+        each ranking key, from the same result rows'''
+    ranked_results = {}
+    for ranking_key in ranking_keys:
+        # sort by column of ranking_key.
+        rank_indx = cols.index(ranking_key)
+        ranked_results[ranking_key] = sort_results(result_rows, rank_indx, cols)
+    return ranked_results
+
+def get_top_results(result_rows, rankings, divisions, divisions_fn, cols,
+                    topn):
+    '''returns a dictionary of the sorted list of the topn (id, result)
+        items overall and for each division. These are the first topn
+        items that sort_results would give, found with one pass over the
+        rows and a bounded heap for each ranking.'''
+    names = ['Overall'] + [div[0] for div in divisions]
+    ranking_keys = set(rankings[name] for name in names)
+    # The best (value, row index) of each tag for each ranking key, as kept
+    # by the dedup of sort_results
+    best = {}
+    for ranking_key in ranking_keys:
+        rank_indx = cols.index(ranking_key)
+        vals = [row[rank_indx] for tag_unused, row in result_rows]
+        # sort_results sorts by number, or by string if that fails
+        if all(isinstance(val, (int, float)) for val in vals if val is not None):
+            blank = 1e20
+        else:
+            blank = ''
+        best_key = {}
+        for i, ((tag, row_unused), val) in enumerate(zip(result_rows, vals)):
+            item = (blank if val is None else val, i)
+            if tag not in best_key or item < best_key[tag]:
+                best_key[tag] = item
+        best[ranking_key] = best_key
+    # One bounded heap per ranking. Items are negated, so that the root of a
+    # heap is the worst item kept.
+    heaps = {name: [] for name in names}
+    def push(name, item):
+        heap = heaps[name]
+        if len(heap) < topn:
+            heapq.heappush(heap, Reversed(item))
+        elif item < heap[0].item:
+            heapq.heapreplace(heap, Reversed(item))
+    for tag in best[rankings['Overall']]:
+        push('Overall', best[rankings['Overall']][tag])
+        for div in set(divisions_fn(tag)):
+            push(div, best[rankings[div]][tag])
+    top_results = {}
+    for name in names:
+        rank_indx = cols.index(rankings[name])
+        top_results[name] = [
+            (result_rows[i][0],
+             format_result_row(result_rows[i][1], cols, rank_indx))
+            for val_unused, i in sorted(entry.item for entry in heaps[name])]
+    return top_results
+
+class Reversed(object):
+    '''Wrapper of an item, that sorts in reverse order'''
+    __slots__ = ('item',)
+
+    def __init__(self, item):
+        self.item = item
+
+    def __lt__(self, other):
+        return other.item < self.item
 
 def get_result_row(tag, time, lap_times, timing, col_fns):
     row = []
@@ -296,8 +520,8 @@ def get_result_row(tag, time, lap_times, timing, col_fns):
     userdata = timing[tag]
     for col_fn in col_fns:
         try:
-            row.append((eval(col_fn)))
-        except (SyntaxError, TypeError, AttributeError, ValueError):
+            row.append(col_fn(tag, time, lap_time, userdata))
+        except ROW_ERRORS:
             row.append(None)
     return row
 
@@ -319,8 +543,7 @@ def sort_results(result_rows, rank_indx, cols):
                 return x[1][rank_indx]
         result_rows = sorted(result_rows, key=stringsort)
     # Remove duplicate entries: If a tag has multiple entries, keep only the
-    # most highly ranked. Also replace total times and pace times with
-    # formatted times, stringify everything but Lap Times, and replace Nones.
+    # most highly ranked.
     taglist = set()
     result_rows_dedup = []
     for tag, row in result_rows:
@@ -328,31 +551,35 @@ def sort_results(result_rows, rank_indx, cols):
             pass  # drop it
         else:
             taglist.add(tag)
-            row_new = []
-            for i, val in enumerate(row):
-                if val is None:
-                    if i == rank_indx:
-                        val = '_'
-                    else:
-                        val = ''
-                elif cols[i] in ['Time', 'Pace']:
-                    val = time_format(val)
-                elif cols[i] == 'Lap Times':
-                    pass  # Leave it as is
-                else:
-                    val = str(val)
-                row_new.append(val)
-            result_rows_dedup.append((tag, row_new))
+            result_rows_dedup.append(
+                (tag, format_result_row(row, cols, rank_indx)))
     return result_rows_dedup
 
-def get_sorted_startsheet(timing, ranking_key, cols, col_fns):
-    '''returns a sorted list of (id, result) items.
-        The content of result depends on the race type'''
-    # Compute each startsheet row
+def format_result_row(row, cols, rank_indx=None):
+    '''Replaces total times and pace times with formatted times, stringifies
+       everything but Lap Times, and replaces Nones: by '_' in the ranking
+       column, by '' elsewhere.'''
+    row_new = []
+    for i, val in enumerate(row):
+        if val is None:
+            if i == rank_indx:
+                val = '_'
+            else:
+                val = ''
+        elif cols[i] in ['Time', 'Pace']:
+            val = time_format(val)
+        elif cols[i] == 'Lap Times':
+            pass  # Leave it as is
+        else:
+            val = str(val)
+        row_new.append(val)
+    return row_new
+
+def get_startsheet_rows(timing, col_fns):
+    '''returns the list of (id, startsheet row) items, unsorted'''
     startsheet_rows = []
+    lap_times = defaultdict(int)
     for tag in timing:
-        row = get_result_row(tag, None, defaultdict(int), timing, col_fns)
+        row = get_result_row(tag, None, lap_times, timing, col_fns)
         startsheet_rows.append((tag, row))
-    # sort by column of ranking_key.
-    rank_indx = cols.index(ranking_key)
-    return sort_results(startsheet_rows, rank_indx, cols)
+    return startsheet_rows
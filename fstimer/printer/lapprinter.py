@@ -25,22 +25,36 @@ from fstimer.printer.printer import Printer
 class LapPrinter(Printer):
     '''Printer class for multi lap races'''
 
+    def __init__(self, fields, categories, print_place):
+        '''constructor
+           @type fields: list
+           @param fields: fields of the output
+           @type categories: list
+           @param categories: existing categories
+           @type print_place: boolean
+           @param print_place: print place'''
+        super(LapPrinter, self).__init__(fields, categories, print_place)
+        # The lines of the laps after the first one are blank, but for the
+        # lap time: they are printed as lap_start + lap time + lap_end
+        self.idx_lap = None
+        if 'Lap Times' in self.fields:
+            self.idx_lap = self.fields.index('Lap Times')
+            # delim for Place
+            self.lap_start = (self.row_end + self.row_start + self.row_delim +
+                              self.row_delim * self.idx_lap)
+            self.lap_end = self.row_delim * (len(self.fields) - 1 - self.idx_lap)
+
     def common_entry(self, row):
         '''Returns the common part of the printout of the entry
            of a given runner for scratch or by category results
            @type bibid: string'''
+        if self.idx_lap is None:
+            return super(LapPrinter, self).common_entry(row)
         # first line, as before
         row_print = list(row)
-        if 'Lap Times' in self.fields:
-            idx_lap = self.fields.index('Lap Times')
-            lap_times = row[idx_lap]  # Take from str back to list
-            row_print[idx_lap] = lap_times[0]
-        entry = self.row_delim.join(row_print)
-        if 'Lap Times' in self.fields:
-            for i in range(1, len(lap_times)):
-                # delim for Place
-                entry += self.row_end + self.row_start + self.row_delim  
-                row_print = ['' for j in range(len(row))]
-                row_print[idx_lap] = str(lap_times[i])
-                entry += self.row_delim.join(row_print)
+        lap_times = row[self.idx_lap]
+        row_print[self.idx_lap] = lap_times[0]
+        entry = super(LapPrinter, self).common_entry(row_print)
+        for lap_time in lap_times[1:]:
+            entry += self.lap_start + self.escape(str(lap_time)) + self.lap_end
         return entry
@@ -20,11 +20,14 @@
 
 '''Printer class for csv files for single lap races'''
 
-import os
+import csv
+import io
 from fstimer.printer.printer import Printer
 
 class CSVPrinter(Printer):
-    '''Printer class for csv files for single lap races'''
+    '''Printer class for csv files for single lap races.
+       Rows go through csv writers, so that cells with commas, quotes or
+       line breaks are quoted.'''
 
     def __init__(self, fields, categories, print_place):
         '''constructor
@@ -37,6 +40,12 @@ class CSVPrinter(Printer):
         self.row_delim = ','
         self.row_end = '\n'
 
+    def csv_lines(self, rows):
+        '''Returns the csv lines of a list of rows'''
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator=self.row_end).writerows(rows)
+        return buf.getvalue()
+
     def file_extension(self):
         '''returns the file extension to be used for files
            containing data from this printer'''
@@ -44,16 +53,47 @@ class CSVPrinter(Printer):
 
     def scratch_table_header(self):
         '''Returns the header of the printout for scratch results'''
-        return 'Place,' + ','.join(self.fields) + '\n'
+        return self.csv_lines([['Place'] + list(self.fields)])
 
     def cat_table_header(self, category):
         '''Returns the header of the printout for results by category.
            @type category: string
            @param category: name of the category handled by the table'''
-        return category + '\n' + self.scratch_table_header()
+        return self.csv_lines([[category]]) + self.scratch_table_header()
 
     def cat_table_footer(self, category):
         '''Returns the footer of the printout for results by category.
            @type category: string
            @param category: name of the category handled by the table'''
         return '\n'
+
+    def scratch_entry(self, row, category=None):
+        '''Returns the printout of the entry of a given runner
+           in the scratch results'''
+        return self.csv_lines(self.entry_cells(row, category))
+
+    def entry_cells(self, row, category):
+        '''Generates the csv rows of the entry of a given runner'''
+        if self.print_place:
+            yield [self.next_place(category)] + list(row)
+        else:
+            yield row
+
+    def write_entries(self, out, rows, category):
+        '''Writes the entries of the (tag, row) items to a file, with a
+           single csv writer'''
+        writer = csv.writer(out, lineterminator=self.row_end)
+        writer.writerows(cells for tag_unused, row in rows
+                         for cells in self.entry_cells(row, category))
+
+    def write_scratch_table(self, out, rows):
+        '''Writes the table of the scratch results to a file'''
+        out.write(self.scratch_table_header())
+        self.write_entries(out, rows, None)
+        out.write(self.scratch_table_footer())
+
+    def write_cat_table(self, out, category, rows):
+        '''Writes the table of the results of a category to a file'''
+        out.write(self.cat_table_header(category))
+        self.write_entries(out, rows, category)
+        out.write(self.cat_table_footer(category))
@@ -25,4 +25,20 @@ from fstimer.printer.lapprinter import LapPrinter
 
 class CSVPrinterLaps(LapPrinter, CSVPrinter):
     '''Printer class for csv files for multi lap races'''
-    pass
+
+    def entry_cells(self, row, category):
+        '''Generates the csv rows of the entry of a given runner: the first
+           lap with the entry, then one row with each next lap time'''
+        if self.idx_lap is None:
+            yield from super(CSVPrinterLaps, self).entry_cells(row, category)
+            return
+        lap_times = row[self.idx_lap]
+        first = list(row)
+        first[self.idx_lap] = lap_times[0]
+        yield from super(CSVPrinterLaps, self).entry_cells(first, category)
+        # The same blank row for each lap: the writer is done with it
+        # before the next one. The first cell is for Place.
+        lap_row = [''] * (len(self.fields) + 1)
+        for lap_time in lap_times[1:]:
+            lap_row[self.idx_lap + 1] = str(lap_time)
+            yield lap_row
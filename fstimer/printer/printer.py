@@ -74,6 +74,10 @@ class Printer(object):
            @param category: name of the category handled by the table'''
         return ''
     
+    def escape(self, text):
+        '''Returns text escaped for the format of the printout'''
+        return text
+
     def common_entry(self, row):
         return self.row_delim.join(row)
 
@@ -83,13 +87,43 @@ class Printer(object):
         return (self.row_start + self.get_place_str(category) +
                 self.common_entry(row) + self.row_end)
 
+    def write_scratch_table(self, out, rows):
+        '''Writes the table of the scratch results to a file, one entry at
+           a time as the rows are produced
+           @type out: file
+           @param out: the printout file
+           @type rows: iterable
+           @param rows: (tag, row) items of the results, in order'''
+        out.write(self.scratch_table_header())
+        for tag_unused, row in rows:
+            out.write(self.scratch_entry(row))
+        out.write(self.scratch_table_footer())
+
+    def write_cat_table(self, out, category, rows):
+        '''Writes the table of the results of a category to a file, one entry
+           at a time as the rows are produced
+           @type out: file
+           @param out: the printout file
+           @type category: string
+           @param category: name of the category handled by the table
+           @type rows: iterable
+           @param rows: (tag, row) items of the results, in order'''
+        out.write(self.cat_table_header(category))
+        for tag_unused, row in rows:
+            out.write(self.scratch_entry(row, category))
+        out.write(self.cat_table_footer(category))
+
     def get_place_str(self, category):
         if not self.print_place:
             return ''
+        return self.next_place(category) + self.row_delim
+
+    def next_place(self, category):
+        '''Returns the place of the next entry, overall or in a category'''
         if category is None:
             place = str(self.place)
             self.place += 1
         else:
             place = str(self.cat_place[category])
             self.cat_place[category] += 1
-        return place + self.row_delim
+        return place
@@ -22,6 +22,9 @@
 
 from fstimer.printer.printer import Printer
 
+# Translation table escaping the characters special in html text
+HTML_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
 class HTMLPrinter(Printer):
     '''Printer class for html files for single lap races'''
 
@@ -35,6 +38,21 @@ class HTMLPrinter(Printer):
         self.row_start = '<tr><td>'
         self.row_delim = '</td><td>'
         self.row_end = '</td></tr>\n'
+        # The table header is the same for every table of the printout
+        header = '<table id="tab"> <thead> <tr>\n'
+        if self.print_place:
+            header += '<th scope="col">Place</th>\n'
+        for field in self.fields:
+            header += '<th scope="col">' + self.escape(field) + '</th>\n'
+        header += '</tr> </thead> <tbody>\n'
+        self.table_header = header
+
+    def escape(self, text):
+        '''Returns text escaped for html'''
+        return text.translate(HTML_ESCAPES)
+
+    def common_entry(self, row):
+        return self.row_delim.join([cell.translate(HTML_ESCAPES) for cell in row])
 
     def file_extension(self):
         '''returns the file extension to be used for files
@@ -79,13 +97,7 @@ class HTMLPrinter(Printer):
 
     def scratch_table_header(self):
         '''Returns the header of the printout for scratch results'''
-        header = '<table id="tab"> <thead> <tr>\n'
-        if self.print_place:
-            header += '<th scope="col">Place</th>\n'
-        for field in self.fields:
-            header += '<th scope="col">' + field + '</th>\n'
-        header += '</tr> </thead> <tbody>\n'
-        return header
+        return self.table_header
 
     def scratch_table_footer(self):
         '''Returns the header of the printout for scratch results'''
@@ -95,8 +107,8 @@ class HTMLPrinter(Printer):
         '''Returns the header of the printout for results by category.
            @type category: string
            @param category: name of the category handled by the table'''
-        return '<span style="font-size:22px">' + category + '</span>\n' + \
-               self.scratch_table_header()
+        return '<span style="font-size:22px">' + self.escape(category) + \
+               '</span>\n' + self.table_header
 
     def cat_table_footer(self, category):
         '''Returns the footer of the printout for results by category.
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Printer class for newline delimited json files, for other software'''
+
+import json
+from fstimer.printer.printer import Printer
+
+class JSONPrinter(Printer):
+    '''Printer class for newline delimited json files.
+       Each entry is a json object on its own line, with the ID, the place,
+       the printed value of each field, and the lap times as a list.
+       If places_fn is set, places_fn(tag) gives the place of the tag in
+       each of its divisions, which go in the object too.'''
+
+    def __init__(self, fields, categories, print_place):
+        '''constructor
+           @type fields: list
+           @param fields: fields of the output
+           @type categories: list
+           @param categories: existing categories
+           @type print_place: boolean
+           @param print_place: print place'''
+        super(JSONPrinter, self).__init__(fields, categories, print_place)
+        self.row_end = '\n'
+        self.places_fn = None
+
+    def file_extension(self):
+        '''returns the file extension to be used for files
+           containing data from this printer'''
+        return 'ndjson'
+
+    def entry(self, tag, row, category=None):
+        '''Returns the json object of the entry of a given runner'''
+        obj = {}
+        if tag is not None:
+            obj['ID'] = tag
+        if category is not None:
+            obj['division'] = category
+        if self.print_place:
+            obj['place'] = int(self.next_place(category))
+        for field, value in zip(self.fields, row):
+            if field == 'Lap Times':
+                obj['laps'] = [str(lap) for lap in value]
+            else:
+                obj[field] = value
+        if self.places_fn is not None and tag is not None:
+            obj['divisions'] = self.places_fn(tag)
+        return obj
+
+    def scratch_entry(self, row, category=None):
+        '''Returns the printout of the entry of a given runner
+           in the scratch results'''
+        return json.dumps(self.entry(None, row, category)) + self.row_end
+
+    def write_scratch_table(self, out, rows):
+        '''Writes the entries of the scratch results to a file, one object
+           per line'''
+        for tag, row in rows:
+            out.write(json.dumps(self.entry(tag, row)) + self.row_end)
+
+    def write_cat_table(self, out, category, rows):
+        '''Writes the entries of the results of a category to a file, one
+           object per line'''
+        for tag, row in rows:
+            out.write(json.dumps(self.entry(tag, row, category)) + self.row_end)
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Handling of registration data: importation of pre-registration csv
+   files, and compilation of the registration files of the stations into
+   the timing dictionary. None of this needs Gtk.'''
+
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fstimer.regdelta import read_raw, decode, read_registrations
+
+# The maximum number of registration files read at once
+MAX_LOADERS = 8
+
+class ComboValueError(Exception):
+    '''Exception launched when decoding reveals an invalid value for a combo field'''
+    pass
+
+def read_csv(filename):
+    '''Returns the rows of a csv file, as dictionaries'''
+    with open(filename, 'r', encoding='utf-8') as fin:
+        return list(csv.DictReader(fin))
+
+def import_prereg(csvreg, fields, fieldsdic, fields_mapping):
+    '''Builds the pre-registration from the rows of a csv file.
+       fields_mapping gives, for each field, a function computing its value
+       from a row. Raises ComboValueError if a value is not one of the
+       options of a combobox field.'''
+    preregdata = []
+    row = 1
+    for reg in csvreg:
+        tmpdict = {}
+        for field in fields:
+            value = fields_mapping[field](reg)
+            if value and fieldsdic[field]['type'] == 'combobox':
+                if value not in fieldsdic[field]['options']:
+                    optstr = '"' + '", "'.join(fieldsdic[field]['options']) + '", and blank'
+                    errstr = """Error in csv row %d!
+Found value "%s" in field "%s". Not a valid value!
+Valid values (case sensitive) are: %s.
+Correct the error and try again.""" % (row+1, value, field, optstr)
+                    raise ComboValueError(errstr)
+            tmpdict[field] = value
+        preregdata.append(tmpdict.copy())
+        row += 1
+    return preregdata
+
+def read_registration_file(fname):
+    '''Returns the registrations of a json file, with the changes of its
+       delta file if it is the file of a station'''
+    return read_registrations(fname)
+
+def content_hash(data):
+    '''Returns the hash of the content of a file, as bytes'''
+    return hashlib.sha256(data).hexdigest()
+
+def file_hash(fname):
+    '''Returns the hash of the content of a file'''
+    with open(fname, 'rb') as fin:
+        return content_hash(fin.read())
+
+def read_changed_registrations(fname, known_hash=None):
+    '''Returns the hash of the content of a json file and of its delta
+       file, and its registrations, or None for them if the hash is
+       known_hash'''
+    base, delta = read_raw(fname)
+    digest = content_hash(base)
+    if delta is not None:
+        digest += content_hash(delta)
+    if digest == known_hash:
+        return digest, None
+    return digest, decode(base, delta)
+
+def load_registrations(regfilelist):
+    '''Loads and concatenates the registrations of the given json files'''
+    regmerge = []
+    for fname in regfilelist:
+        regmerge.extend(read_registration_file(fname))
+    return regmerge
+
+class RegistrationLoader(object):
+    '''Reads and decodes registration files on a pool of worker threads.
+       The files that are done are collected with poll, as they arrive,
+       so that the caller is never blocked. A file whose content has the
+       hash given in known_hashes is not decoded.'''
+
+    def __init__(self, regfilelist, max_workers=MAX_LOADERS, known_hashes=None):
+        '''constructor
+           @type regfilelist: list
+           @param regfilelist: the registration files
+           @type max_workers: int
+           @param max_workers: the maximum number of files read at once
+           @type known_hashes: dict
+           @param known_hashes: filename -> hash of its content when it
+                                was last read'''
+        known_hashes = known_hashes or {}
+        self.nfiles = len(regfilelist)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, self.nfiles)))
+        self.pending = {self.executor.submit(read_changed_registrations, fname,
+                                             known_hashes.get(fname)): fname
+                        for fname in regfilelist}
+        # Nothing else goes to the pool
+        self.executor.shutdown(wait=False)
+
+    def poll(self):
+        '''Returns the (filename, hash, registrations) of the files read since
+           the last call, with None registrations for an unchanged file.
+           Raises the exception of a file that could not be read, in which
+           case the files not started yet are dropped.'''
+        done = [future for future in self.pending if future.done()]
+        loaded = []
+        for future in done:
+            fname = self.pending.pop(future)
+            try:
+                loaded.append((fname,) + future.result())
+            except Exception:
+                self.cancel()
+                raise
+        return loaded
+
+    def cancel(self):
+        '''Drops the files not started yet'''
+        for future in self.pending:
+            future.cancel()
+        self.pending = {}
+
+    def finished(self):
+        '''Whether all of the files were collected'''
+        return not self.pending
+
+    def iter_loaded(self):
+        '''Yields the (filename, hash, registrations) of the files, blocking
+           until each of them is read'''
+        for future in as_completed(list(self.pending)):
+            fname = self.pending.pop(future)
+            yield (fname,) + future.result()
+
+class DuplicateRemover(object):
+    '''Removes the duplicate registrations of lists of registrations.
+       Each list is kept by name, so that it can be replaced or removed
+       without adding the others again.'''
+
+    def __init__(self, fields):
+        '''constructor
+           @type fields: list
+           @param fields: the registration fields'''
+        self.fields = fields
+        # name -> the distinct registrations of the list, as tuples of
+        # (field, value) items, in their order
+        self.lists = {}
+
+    def add(self, reglist, name=None):
+        '''Adds registrations, replacing the list of the same name'''
+        # Now remove trivial dups
+        fields = self.fields
+        self.lists[name] = list(dict.fromkeys(
+            tuple((field, item[field]) for field in fields) for item in reglist))
+
+    def remove(self, name):
+        '''Removes the registrations of a list'''
+        self.lists.pop(name, None)
+
+    def registrations(self, names=None):
+        '''Returns the registrations of the lists, without duplicates, in
+           the order of the lists (by default the order they were added)'''
+        if names is None:
+            names = list(self.lists)
+        keys = {}
+        for name in names:
+            keys.update(dict.fromkeys(self.lists.get(name, ())))
+        # Get rid of entries that differ only by the ID. That is, items that were in the pre-reg and had no changes except an ID was assigned in one reg file.
+        # Entries are grouped by everything but the ID, so that this is linear
+        idx_id = self.fields.index('ID')
+        with_id = set(key[:idx_id] + key[idx_id+1:] for key in keys
+                      if key[idx_id][1])
+        reg_nodups = []
+        for key in keys:
+            # make sure there isn't an entry with everything else the same, but an ID
+            if key[idx_id][1] == '' and key[:idx_id] + key[idx_id+1:] in with_id:
+                continue
+            reg_nodups.append(dict(key))
+        return reg_nodups
+
+def remove_duplicates(regmerge, fields):
+    '''Removes the duplicate registrations'''
+    remover = DuplicateRemover(fields)
+    remover.add(regmerge)
+    return remover.registrations()
+
+class CompileState(object):
+    '''The registrations of each file of the last compilation, with the
+       hash of its content. A compilation again only decodes and merges
+       the files whose content changed.'''
+
+    def __init__(self, fields):
+        '''constructor
+           @type fields: list
+           @param fields: the registration fields'''
+        self.fields = list(fields)
+        self.hashes = {}
+        self.remover = DuplicateRemover(self.fields)
+
+    def update(self, fname, digest, reglist):
+        '''Records the content of a file that was read. reglist is None if
+           the file is unchanged.'''
+        if reglist is not None:
+            self.remover.add(reglist, fname)
+            self.hashes[fname] = digest
+
+    def registrations(self, regfilelist):
+        '''Returns the registrations of the given files, without
+           duplicates. Files of previous compilations that are not in the
+           list are forgotten.'''
+        for fname in set(self.hashes) - set(regfilelist):
+            del self.hashes[fname]
+            self.remover.remove(fname)
+        return self.remover.registrations(regfilelist)
+
+class CompileManifest(object):
+    '''The hash of the content of each output of a compilation, with the
+       modification time and size of its file, so that an output is only
+       written again when its content changes'''
+
+    def __init__(self, filename):
+        '''constructor
+           @type filename: str
+           @param filename: the json file of the manifest'''
+        self.filename = filename
+        try:
+            with open(filename, 'r', encoding='utf-8') as fin:
+                self.outputs = json.load(fin)['outputs']
+        except (OSError, ValueError, KeyError, TypeError):
+            self.outputs = {}
+
+    def stamp(self, digest, filenames):
+        '''Returns the record of an output with the given hash, written to
+           filenames, or None if one of them is missing'''
+        stamp = [digest]
+        for filename in filenames:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                return None
+            stamp.append([stat.st_mtime_ns, stat.st_size])
+        return stamp
+
+    def unchanged(self, name, digest, filenames):
+        '''Whether the output name is already in filenames, with the
+           content of the given hash'''
+        stamp = self.stamp(digest, filenames)
+        return stamp is not None and self.outputs.get(name) == stamp
+
+    def record(self, name, digest, filenames):
+        '''Records that the output name was written to filenames'''
+        self.outputs[name] = self.stamp(digest, filenames)
+
+    def save(self):
+        '''Writes the manifest'''
+        with open(self.filename, 'w', encoding='utf-8') as fout:
+            json.dump({'outputs': self.outputs}, fout)
+
+def write_if_changed(manifest, filename, text):
+    '''Writes text to filename, unless the file already has this content
+       according to the manifest. Returns whether the file was written.'''
+    name = os.path.basename(filename)
+    digest = content_hash(text.encode('utf-8'))
+    if manifest.unchanged(name, digest, [filename]):
+        return False
+    with open(filename, 'w', encoding='utf-8') as fout:
+        fout.write(text)
+    manifest.record(name, digest, [filename])
+    return True
+
+def build_timing_dict(reg_nodups):
+    '''Returns the timing dictionary, whose keys are IDs and values are
+       registration dictionaries, and the errors dictionary, whose keys are
+       IDs and values are the list of the registrations with that ID'''
+    timedict = {}
+    errors = {}
+    for reg in reg_nodups:
+        # Any registration without an ID is left out of the timing dictionary
+        if reg['ID']:
+            # have we already added this ID to the timing dictionary?
+            if reg['ID'] in timedict.keys():
+                # If so, then we need to first add to the list the reg that was already stored in timedict.
+                if reg['ID'] not in errors.keys():
+                    errors[reg['ID']] = [timedict[reg['ID']]]
+                errors[reg['ID']].append(reg)
+            else:
+                timedict[reg['ID']] = reg
+    return timedict, errors
+
+def compile_registrations(regfilelist, fields):
+    '''Loads, merges and checks the given registration files.
+       Returns the registrations without duplicates, the timing dictionary
+       and the errors dictionary.'''
+    remover = DuplicateRemover(fields)
+    for fname, digest_unused, reglist in RegistrationLoader(regfilelist).iter_loaded():
+        remover.add(reglist, fname)
+    reg_nodups = remover.registrations(regfilelist)
+    timedict, errors = build_timing_dict(reg_nodups)
+    return reg_nodups, timedict, errors
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Registration files of the stations, as a base and a log of changes.
+
+   A station used to write all of its registrations, pre-registration
+   included, on every save. Now the _registration_N.json file is the base,
+   and the autosave after each entry only appends the changes made since
+   the last save as lines of json to a _registration_N.delta file:
+   ["add", registration], ["edit", index, registration] or
+   ["remove", index]. The base is written in full when the log is
+   compacted, on an explicit save, and when the registration is closed,
+   so that it is complete on its own when it is copied. The first line of the delta file is a header with
+   the hash of the content of the base it applies to, so that a delta file
+   left over from an older base is ignored.'''
+
+import hashlib
+import json
+import logging
+import os
+
+# The log is compacted once it holds at least this many changes, and at
+# least as many changes as there are registrations, which keeps the
+# amortized cost of writing the base constant per change.
+MIN_COMPACTION = 1000
+
+def delta_filename(filename):
+    '''Returns the name of the delta file going with a registration file'''
+    return os.path.splitext(filename)[0] + '.delta'
+
+def base_hash(data):
+    '''Returns the hash of the content of a base, as bytes'''
+    return hashlib.sha256(data).hexdigest()
+
+def read_raw(filename):
+    '''Returns the content of a registration file and of its delta file,
+       as bytes, with None if there is no delta file'''
+    with open(filename, 'rb') as fin:
+        base = fin.read()
+    try:
+        with open(delta_filename(filename), 'rb') as fin:
+            delta = fin.read()
+    except FileNotFoundError:
+        delta = None
+    return base, delta
+
+def apply_change(reglist, change):
+    '''Applies a change of the delta file to a list of registrations'''
+    op = change[0]
+    if op == 'add':
+        reglist.append(change[1])
+    elif op == 'edit':
+        reglist[change[1]] = change[2]
+    elif op == 'remove':
+        reglist.pop(change[1])
+    else:
+        raise ValueError('Unknown registration change ' + str(op))
+
+def decode(base, delta):
+    '''Returns the registrations of the content of a registration file and
+       of its delta file'''
+    reglist = json.loads(base.decode('utf-8'))
+    if not delta:
+        return reglist
+    logger = logging.getLogger('fstimer')
+    lines = delta.decode('utf-8').splitlines()
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        logger.debug('Ignoring a delta file with a bad header')
+        return reglist
+    if header.get('base') != base_hash(base):
+        # The base was written again after these changes
+        return reglist
+    for line in lines[1:]:
+        try:
+            apply_change(reglist, json.loads(line))
+        except (ValueError, IndexError, TypeError):
+            # The last line can be cut short by a crash
+            logger.debug('Ignoring bad registration change %r', line)
+            break
+    return reglist
+
+def read_registrations(filename):
+    '''Returns the registrations of a registration file, with the changes
+       of its delta file'''
+    return decode(*read_raw(filename))
+
+class RegistrationLog(object):
+    '''Log of the changes made to the registrations of a station.
+       The changes are kept in memory until save is called.'''
+
+    def __init__(self, filename, reglist, min_compaction=MIN_COMPACTION):
+        '''constructor
+           @type filename: string
+           @param filename: path of the registration file
+           @type reglist: RegistrationList
+           @param reglist: the registrations of the station
+           @type min_compaction: int
+           @param min_compaction: minimal number of changes before compaction'''
+        self.filename = filename
+        self.delta_filename = delta_filename(filename)
+        self.reglist = reglist
+        self.min_compaction = min_compaction
+        self.pending = []
+        self.nchanges = 0
+        # The base is written at the first save
+        self.compacted = False
+        reglist.log = self
+
+    def record(self, change):
+        '''Records a change, once it is applied'''
+        if self.pending is not None:
+            self.pending.append(change)
+
+    def record_reset(self):
+        '''Records a change that can't be logged: the base will be written
+           again at the next save'''
+        self.pending = None
+
+    def save(self):
+        '''Writes the changes since the last save'''
+        if (not self.compacted or self.pending is None or
+                self.nchanges + len(self.pending) >=
+                max(self.min_compaction, len(self.reglist))):
+            self.compact()
+            return
+        if not self.pending:
+            return
+        with open(self.delta_filename, 'a', encoding='utf-8') as fout:
+            for change in self.pending:
+                fout.write(json.dumps(change) + '\n')
+            fout.flush()
+            os.fsync(fout.fileno())
+        self.nchanges += len(self.pending)
+        self.pending = []
+
+    def close(self):
+        '''Writes the saved changes to the base, so that the registration
+           file is complete on its own, e.g. to be copied to the computer
+           that compiles. The changes that were not saved are left out.'''
+        if self.nchanges:
+            self.compact(read_registrations(self.filename))
+
+    def compact(self, reglist=None):
+        '''Writes all of the registrations (by default the ones of the
+           list) to the base, and starts a new delta file'''
+        if reglist is None:
+            reglist = self.reglist
+        data = json.dumps(list(reglist)).encode('utf-8')
+        tmpname = self.filename + '.tmp'
+        with open(tmpname, 'wb') as fout:
+            fout.write(data)
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(tmpname, self.filename)
+        # If we crash before the new delta file is in place, the old one
+        # does not match the new base, and is ignored.
+        tmpname = self.delta_filename + '.tmp'
+        with open(tmpname, 'w', encoding='utf-8') as fout:
+            fout.write(json.dumps({'base': base_hash(data)}) + '\n')
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(tmpname, self.delta_filename)
+        self.pending = []
+        self.nchanges = 0
+        self.compacted = True
+
+def logged(method):
+    '''Wraps a list method so that it records a reset in the log'''
+    def wrapper(self, *args, **kwargs):
+        if self.log is not None:
+            self.log.record_reset()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+class RegistrationList(list):
+    '''List of registrations that records its changes in a RegistrationLog.
+       Appending, setting and popping one registration are logged as
+       changes; any other change makes the log write the base again.'''
+
+    def __init__(self, *args):
+        super(RegistrationList, self).__init__(*args)
+        self.log = None
+
+    def append(self, reg):
+        super(RegistrationList, self).append(reg)
+        if self.log is not None:
+            self.log.record(['add', reg])
+
+    def __setitem__(self, index, reg):
+        super(RegistrationList, self).__setitem__(index, reg)
+        if self.log is not None:
+            if isinstance(index, int):
+                self.log.record(['edit', index % len(self), reg])
+            else:
+                self.log.record_reset()
+
+    def pop(self, index=-1):
+        # The index of the registration, before it is removed
+        index = range(len(self))[index]
+        reg = super(RegistrationList, self).pop(index)
+        if self.log is not None:
+            self.log.record(['remove', index])
+        return reg
+
+    __delitem__ = logged(list.__delitem__)
+    __iadd__ = logged(list.__iadd__)
+    __imul__ = logged(list.__imul__)
+    extend = logged(list.extend)
+    insert = logged(list.insert)
+    remove = logged(list.remove)
+    clear = logged(list.clear)
+    sort = logged(list.sort)
+    reverse = logged(list.reverse)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Optional sqlite store of the registrations of a project.
+
+   The json files stay the files exchanged between the computers of a
+   race; a project that uses the store also keeps their registrations in
+   a _registrations.sqlite file, indexed by ID. Each list of registrations
+   is a source: a registration file, the compiled registrations, or the
+   timing dictionary. The store keeps the hash of the content each source
+   was imported from, so an unchanged file is not imported again, and the
+   json of a source that is in sync does not need to be parsed.
+
+   The timing window and the printouts look the registrations of the
+   timing dictionary up by ID as they need them. The compilation and the
+   registration window still work on lists of all of the registrations:
+   the compiled registration is written as json, and the Gtk list store of
+   the window holds every row.'''
+
+import json
+import os
+import sqlite3
+from collections import defaultdict
+from collections.abc import Mapping
+
+STORE_SUFFIX = '_registrations.sqlite'
+# The sources of the compiled registrations, and of the timing dictionary
+COMPILED = 'compiled'
+TIMING = 'timing'
+
+def store_filename(path):
+    '''Returns the name of the store of a project'''
+    return os.path.join(path, os.path.basename(path) + STORE_SUFFIX)
+
+class RegistrationStore(object):
+    '''sqlite store of the registrations of a project.
+       The registrations are in one table, with their source, their
+       position in the source and a column for each field.'''
+
+    def __init__(self, filename, fields):
+        '''constructor
+           @type filename: str
+           @param filename: the sqlite file, or ':memory:'
+           @type fields: list
+           @param fields: the registration fields'''
+        self.filename = filename
+        self.fields = list(fields)
+        # The columns are named by position, as fields can be any text
+        self.cols = ['c%d' % i for i in range(len(self.fields))]
+        self.idcol = self.cols[self.fields.index('ID')]
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta '
+                              '(key TEXT PRIMARY KEY, value TEXT)')
+            if self.get_meta('fields') != json.dumps(self.fields):
+                # The fields changed: the store is built again from the files
+                self.conn.execute('DROP TABLE IF EXISTS registrations')
+                self.conn.execute('DELETE FROM meta')
+                self.set_meta('fields', json.dumps(self.fields))
+            # The columns have no type, so values are kept as they are
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS registrations '
+                '(source TEXT NOT NULL, pos INTEGER NOT NULL, {}, '
+                'PRIMARY KEY (source, pos))'.format(', '.join(self.cols)))
+            self.conn.execute('CREATE INDEX IF NOT EXISTS reg_id ON '
+                              'registrations (source, {})'.format(self.idcol))
+
+    def close(self):
+        '''Closes the store'''
+        self.conn.close()
+
+    def get_meta(self, key):
+        '''Returns a value of the metadata, or None'''
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?',
+                                (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        '''Sets a value of the metadata'''
+        self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                          (key, value))
+
+    def source_hash(self, source):
+        '''Returns the hash of the content a source was imported from'''
+        return self.get_meta('hash:' + source)
+
+    def hashes(self, sources):
+        '''Returns the hashes of the content the sources were imported from,
+           for the ones that are in the store'''
+        hashes = {}
+        for source in sources:
+            digest = self.source_hash(source)
+            if digest is not None:
+                hashes[source] = digest
+        return hashes
+
+    def replace(self, source, reglist, digest=None):
+        '''Replaces the registrations of a source, imported from content of
+           the given hash'''
+        fields = self.fields
+        with self.conn:
+            self.conn.execute('DELETE FROM registrations WHERE source = ?',
+                              (source,))
+            self.conn.executemany(
+                'INSERT INTO registrations VALUES (?, ?, {})'.format(
+                    ', '.join('?' * len(fields))),
+                ((source, pos) + tuple(reg[field] for field in fields)
+                 for pos, reg in enumerate(reglist)))
+            if digest is None:
+                self.conn.execute('DELETE FROM meta WHERE key = ?',
+                                  ('hash:' + source,))
+            else:
+                self.set_meta('hash:' + source, digest)
+
+    def remove(self, source):
+        '''Removes the registrations of a source'''
+        with self.conn:
+            self.conn.execute('DELETE FROM registrations WHERE source = ?',
+                              (source,))
+            self.conn.execute('DELETE FROM meta WHERE key = ?',
+                              ('hash:' + source,))
+
+    def rows_to_regs(self, rows):
+        '''Yields the registrations of rows of field values'''
+        fields = self.fields
+        for row in rows:
+            yield dict(zip(fields, row))
+
+    def registrations(self, source):
+        '''Yields the registrations of a source, in order'''
+        return self.rows_to_regs(self.conn.execute(
+            'SELECT {} FROM registrations WHERE source = ? ORDER BY pos'.format(
+                ', '.join(self.cols)), (source,)))
+
+    def lookup(self, source, regid):
+        '''Returns the registrations of a source with a given ID'''
+        return list(self.rows_to_regs(self.conn.execute(
+            'SELECT {} FROM registrations WHERE source = ? AND {} = ? '
+            'ORDER BY pos'.format(', '.join(self.cols), self.idcol),
+            (source, regid))))
+
+    def ids(self, source):
+        '''Returns the IDs of the registrations of a source'''
+        return [row[0] for row in self.conn.execute(
+            'SELECT {0} FROM registrations WHERE source = ? ORDER BY pos'.format(
+                self.idcol), (source,))]
+
+    def merge(self, sources):
+        '''Returns the registrations of the sources, without duplicates, as
+           reg_ops.DuplicateRemover does: the same registrations are kept
+           once, and a registration without an ID is dropped if there is
+           one with everything else the same, but an ID. They are in the
+           order of their first appearance in the sources.'''
+        if not sources:
+            return []
+        cols = ', '.join(self.cols)
+        others = ', '.join(col for col in self.cols if col != self.idcol)
+        idcol = self.idcol
+        # The order of each registration: its source, then its position
+        order = 'CASE source {} END * 4294967296 + pos'.format(
+            ' '.join('WHEN ? THEN %d' % i for i in range(len(sources))))
+        query = (
+            'WITH regs AS (SELECT {cols}, MIN({order}) AS k FROM registrations '
+            'WHERE source IN ({marks}) GROUP BY {cols}), '
+            'flagged AS (SELECT *, MAX({idcol} IS NOT NULL AND {idcol} != \'\' '
+            'AND {idcol} != 0) OVER ({partition}) AS has_id FROM regs) '
+            'SELECT {cols} FROM flagged WHERE NOT ({idcol} IS \'\' AND has_id) '
+            'ORDER BY k').format(
+                cols=cols, order=order, marks=', '.join('?' * len(sources)),
+                idcol=idcol,
+                partition='PARTITION BY ' + others if others else '')
+        return list(self.rows_to_regs(self.conn.execute(
+            query, list(sources) + list(sources))))
+
+    def mapping(self, source):
+        '''Returns a read-only mapping of the IDs of a source to their
+           registration, looked up in the store'''
+        return RegistrationMapping(self, source)
+
+    def in_sync(self, source, digest):
+        '''Whether a source was imported from the content of a given hash'''
+        return digest is not None and self.source_hash(source) == digest
+
+class RegistrationMapping(Mapping):
+    '''The registrations of a source by ID, as a timing dictionary.
+       Registrations are looked up when they are first needed, and kept.
+       A missing ID gives an empty registration, as in the defaultdict
+       used for the timing dictionary.'''
+
+    def __init__(self, store, source):
+        '''constructor
+           @type store: RegistrationStore
+           @param store: the store
+           @type source: str
+           @param source: the source of the registrations'''
+        self.store = store
+        self.source = source
+        self.cache = {}
+        self.all_ids = None
+
+    def __getitem__(self, regid):
+        reg = self.cache.get(regid)
+        if reg is None:
+            regs = self.store.lookup(self.source, regid)
+            # As in the timing dictionary, the first one of an ID wins
+            reg = defaultdict(str, regs[0]) if regs else defaultdict(str)
+            self.cache[regid] = reg
+        return reg
+
+    def __contains__(self, regid):
+        return regid in self.keys_set()
+
+    def keys_set(self):
+        '''Returns the set of the IDs'''
+        if self.all_ids is None:
+            self.all_ids = set(regid for regid in self.store.ids(self.source)
+                               if regid)
+        return self.all_ids
+
+    def __iter__(self):
+        return iter(self.keys_set())
+
+    def __len__(self):
+        return len(self.keys_set())
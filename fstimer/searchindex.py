@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''In-memory search index of registrations, for search as you type.
+
+   A query is split into words, and a registration matches if each of
+   them is in one of its fields, ignoring case. The fields are indexed by
+   their n-grams of one, two and three characters. Only the registrations
+   that have the word, if it is that short, or else all of its trigrams,
+   are checked, so a search does not look at every registration.'''
+
+from collections import defaultdict
+
+# Field values are joined with this, so no query word spans two of them
+SEPARATOR = '\0'
+# The longest n-grams of the index
+MAX_GRAM = 3
+
+def ngrams(text):
+    '''Returns the n-grams of one to MAX_GRAM characters of a text'''
+    return set(text[i:i+n] for n in range(1, MAX_GRAM + 1)
+               for i in range(len(text) - n + 1))
+
+class SearchIndex(object):
+    '''Index of the registrations of the registration window, by key'''
+
+    def __init__(self, fields):
+        '''constructor
+           @type fields: list
+           @param fields: the registration fields'''
+        self.fields = fields
+        # key -> lowercase values of the fields
+        self.docs = {}
+        # n-gram -> keys
+        self.grams = defaultdict(set)
+        # The words, field and result of the last search
+        self.last = None
+
+    def add(self, key, reg):
+        '''Adds a registration'''
+        values = tuple('' if reg[field] is None else str(reg[field]).lower()
+                       for field in self.fields)
+        self.docs[key] = values
+        for gram in ngrams(SEPARATOR.join(values)):
+            self.grams[gram].add(key)
+        self.last = None
+
+    def remove(self, key):
+        '''Removes a registration'''
+        values = self.docs.pop(key)
+        for gram in ngrams(SEPARATOR.join(values)):
+            self.drop(gram, key)
+        self.last = None
+
+    def drop(self, gram, key):
+        '''Removes a key from the postings of an n-gram'''
+        keys = self.grams[gram]
+        keys.discard(key)
+        if not keys:
+            del self.grams[gram]
+
+    def update(self, key, reg):
+        '''Replaces a registration'''
+        self.remove(key)
+        self.add(key, reg)
+
+    def candidates(self, token):
+        '''Returns the keys that have all of the trigrams of a query word,
+           or the word itself if it is shorter'''
+        if len(token) <= MAX_GRAM:
+            return self.grams.get(token, set())
+        postings = []
+        for gram in set(token[i:i+MAX_GRAM]
+                        for i in range(len(token) - MAX_GRAM + 1)):
+            keys = self.grams.get(gram)
+            if not keys:
+                return set()
+            postings.append(keys)
+        postings.sort(key=len)
+        return postings[0].intersection(*postings[1:])
+
+    def search(self, query, field=None):
+        '''Returns the keys of the registrations matching a query, in all of
+           the fields or in the given one'''
+        tokens = query.lower().split()
+        if not tokens:
+            return set(self.docs)
+        idx = None if field is None else self.fields.index(field)
+        if self.narrows(tokens, field):
+            # Typing on: only the last matches can still match
+            found = self.last[2]
+        else:
+            found = None
+            for token in sorted(set(tokens), key=len, reverse=True):
+                keys = self.candidates(token)
+                found = keys if found is None else found & keys
+                if not found:
+                    break
+            found = set(found)
+        docs = self.docs
+        if idx is None:
+            result = set(key for key in found if all(
+                any(token in value for value in docs[key])
+                for token in tokens))
+        else:
+            result = set(key for key in found if all(
+                token in docs[key][idx] for token in tokens))
+        self.last = (tokens, field, result)
+        return result
+
+    def matches(self, key, query, field=None):
+        '''Whether the registration of a key matches a query, in all of the
+           fields or in the given one'''
+        values = self.docs[key]
+        if field is not None:
+            values = (values[self.fields.index(field)],)
+        return all(any(token in value for value in values)
+                   for token in query.lower().split())
+
+    def narrows(self, tokens, field):
+        '''Whether a query can only match registrations that matched the
+           last one: same field, and each word of the last query is still
+           in the word at its place'''
+        if self.last is None or self.last[1] != field:
+            return False
+        last_tokens = self.last[0]
+        if len(tokens) < len(last_tokens):
+            return False
+        return all(last in token for token, last in zip(tokens, last_tokens))
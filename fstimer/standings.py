@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Live standings of a race.
+
+   A Standings object watches a TimingLog and keeps the results, overall
+   and for each division, sorted in RankList objects. Only the pairings of
+   IDs and times that changed since the last refresh are recomputed, so
+   adding a finisher, correcting a time or looking up the place of an ID
+   are O(log n). Printing the results is a traversal of the lists.'''
+
+from bisect import bisect_left, insort
+from itertools import chain
+from fstimer.laps import LapTracker
+from fstimer.timinglog import TimeMark
+from fstimer.time_ops import parse_many
+
+class RankList(object):
+    '''Sorted list with O(log n) insertion, removal and rank lookup.
+       The items are kept in sorted buckets of about load items, and the
+       sizes of the buckets are indexed in a Fenwick tree.'''
+
+    def __init__(self, load=256):
+        self.load = load
+        self.buckets = []
+        self.maxes = []
+        self.tree = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return chain.from_iterable(self.buckets)
+
+    def clear(self):
+        '''Removes all of the items'''
+        self.buckets = []
+        self.maxes = []
+        self.tree = []
+        self.size = 0
+
+    def _rebuild_tree(self):
+        '''Rebuilds the Fenwick tree, after buckets were added or removed'''
+        tree = [len(bucket) for bucket in self.buckets]
+        for i in range(len(tree)):
+            j = i | (i + 1)
+            if j < len(tree):
+                tree[j] += tree[i]
+        self.tree = tree
+
+    def _tree_add(self, i, delta):
+        tree = self.tree
+        while i < len(tree):
+            tree[i] += delta
+            i |= i + 1
+
+    def _tree_prefix(self, i):
+        '''Number of items in the buckets before bucket i'''
+        tree = self.tree
+        total = 0
+        i -= 1
+        while i >= 0:
+            total += tree[i]
+            i = (i & (i + 1)) - 1
+        return total
+
+    def add(self, item):
+        '''Inserts an item'''
+        self.size += 1
+        if not self.buckets:
+            self.buckets.append([item])
+            self.maxes.append(item)
+            self.tree = [1]
+            return
+        i = bisect_left(self.maxes, item)
+        if i == len(self.maxes):
+            i -= 1
+            self.buckets[i].append(item)
+            self.maxes[i] = item
+        else:
+            insort(self.buckets[i], item)
+        bucket = self.buckets[i]
+        if len(bucket) > 2 * self.load:
+            # Split the bucket in two
+            self.buckets.insert(i + 1, bucket[self.load:])
+            del bucket[self.load:]
+            self.maxes.insert(i, bucket[-1])
+            self._rebuild_tree()
+        else:
+            self._tree_add(i, 1)
+
+    def _locate(self, item):
+        '''Returns the bucket and the position in the bucket of an item.
+           Raises ValueError if it is not in the list.'''
+        i = bisect_left(self.maxes, item)
+        if i < len(self.buckets):
+            bucket = self.buckets[i]
+            j = bisect_left(bucket, item)
+            if j < len(bucket) and bucket[j] == item:
+                return i, j
+        raise ValueError('{} is not in the list'.format(item))
+
+    def remove(self, item):
+        '''Removes an item. Raises ValueError if it is not in the list.'''
+        i, j = self._locate(item)
+        bucket = self.buckets[i]
+        del bucket[j]
+        self.size -= 1
+        if bucket:
+            self.maxes[i] = bucket[-1]
+            self._tree_add(i, -1)
+        else:
+            del self.buckets[i]
+            del self.maxes[i]
+            self._rebuild_tree()
+
+    def index(self, item):
+        '''Returns the rank of an item (0 for the first one).
+           Raises ValueError if it is not in the list.'''
+        i, j = self._locate(item)
+        return self._tree_prefix(i) + j
+
+    def count_before(self, item):
+        '''Returns the number of items strictly lower than item'''
+        i = bisect_left(self.maxes, item)
+        if i == len(self.buckets):
+            return self.size
+        return self._tree_prefix(i) + bisect_left(self.buckets[i], item)
+
+    def __getitem__(self, k):
+        '''Returns the item of rank k'''
+        if k < 0:
+            k += self.size
+        if not 0 <= k < self.size:
+            raise IndexError('RankList index out of range')
+        # Descend the Fenwick tree to the bucket holding rank k
+        tree = self.tree
+        i = -1
+        step = 1 << len(tree).bit_length()
+        while step:
+            j = i + step
+            if j < len(tree) and tree[j] <= k:
+                k -= tree[j]
+                i = j
+            step >>= 1
+        return self.buckets[i + 1][k]
+
+class Entry(object):
+    '''A row of the results'''
+    __slots__ = ('tag', 'time', 'order', 'row', 'cells')
+
+    def __init__(self, tag, time, order, row, cells):
+        self.tag = tag
+        self.time = time
+        self.order = order
+        self.row = row
+        self.cells = cells
+
+class Standings(object):
+    '''Incrementally maintained results of a race.
+       The content of the rows and the divisions are given as functions, so
+       that they are computed the same way as in the other printouts.
+       Results are sorted as in the printouts: by the value in the ranking
+       column, Nones last, numerically unless some values are strings, and
+       for ties in the order the results are listed in by the timing window
+       (most recent first). IDs with several results are only ranked with
+       the best one.'''
+
+    def __init__(self, log, rankings, divisions, rank_cols, row_fn,
+                 divisions_fn, cells_fn, handicap_fn=None, passid='',
+                 numlaps=1, variablelaps=False):
+        '''constructor
+           @type log: TimingLog
+           @param log: raw IDs and times of the race
+           @type rankings: dict
+           @param rankings: ranking key for 'Overall' and for each division
+           @type divisions: list
+           @param divisions: names of the divisions
+           @type rank_cols: dict
+           @param rank_cols: index in the rows of each ranking key
+           @type row_fn: function
+           @param row_fn: row_fn(tag, time, lap_time) gives the raw row
+           @type divisions_fn: function
+           @param divisions_fn: divisions_fn(tag) gives the divisions of a tag
+           @type cells_fn: function
+           @param cells_fn: cells_fn(row) gives the printed strings of a row
+           @type handicap_fn: function
+           @param handicap_fn: handicap_fn(tag) gives the handicap of a tag
+           in ms (None if unknown). None for a race without handicaps.
+           @type passid: string
+           @param passid: ID used to mark passes, not results
+           @type numlaps: int
+           @param numlaps: number of laps
+           @type variablelaps: boolean
+           @param variablelaps: whether the number of laps can vary'''
+        self.log = log
+        self.row_fn = row_fn
+        self.divisions_fn = divisions_fn
+        self.cells_fn = cells_fn
+        self.handicap_fn = handicap_fn
+        self.passid = passid
+        self.numlaps = numlaps
+        self.variablelaps = variablelaps
+        self.rank_cols = rank_cols
+        names = ['Overall'] + list(divisions)
+        self.listkey = {name: rankings[name] for name in names}
+        self.lists = {name: RankList() for name in names}
+        # Counter of the changes to each list, for the printouts to tell
+        # which lists changed since they were last rendered
+        self.versions = {name: 0 for name in names}
+        # Whether each ranking key is sorted as strings, and how many of
+        # the values of the key are strings
+        self.stringsort = {key: False for key in rank_cols}
+        self.nstrings = {key: 0 for key in rank_cols}
+        # The (tag, time) of each pairing of the log, oldest first
+        self.pairs = []
+        # The results of each tag, by pairing: entries for a single lap
+        # race, lap times for a lap race, with the entries in lap_entries
+        # and the sorted laps in the lap tracker
+        self.results = {}
+        self.lap_entries = {}
+        self.laps = LapTracker()
+        # The sort item of the best entry of each tag, for each ranking key
+        self.best = {}
+        # The lists each tag is in
+        self.tag_lists = {}
+        self.dirty = (0, None)
+        log.watchers.append(self.changed)
+
+    def close(self):
+        '''Stops watching the log'''
+        if self.changed in self.log.watchers:
+            self.log.watchers.remove(self.changed)
+
+    def changed(self, first, last=None):
+        '''Log watcher: marks pairings first to last as needing a refresh'''
+        if self.dirty is not None:
+            dfirst, dlast = self.dirty
+            first = min(first, dfirst)
+            last = max(last, dlast) if last is not None and dlast is not None else None
+        self.dirty = (first, last)
+
+    def refresh(self):
+        '''Brings the standings up to date with the log'''
+        if self.dirty is None:
+            return
+        first, last = self.dirty
+        self.dirty = None
+        ids, times = self.log.idlist, self.log.timelist
+        n = min(len(ids), len(times))
+        # Pairings that no longer exist
+        for i in range(len(self.pairs) - 1, n - 1, -1):
+            self.set_pair(i, None)
+        del self.pairs[n:]
+        self.pairs.extend([None] * (n - len(self.pairs)))
+        last = n if last is None else min(last, n)
+        if first >= last:
+            return
+        # Parse the string times of the range at once
+        marks = times[first:last]
+        parsed = iter(parse_many([t for t in marks
+                                  if not isinstance(t, TimeMark) and t != '']))
+        for i, t in zip(range(first, last), marks):
+            if isinstance(t, TimeMark):
+                t = t.ms
+            elif t != '':
+                t = next(parsed)
+            else:
+                self.set_pair(i, None)
+                continue
+            tag = ids[i]
+            if not tag or tag == self.passid:
+                self.set_pair(i, None)
+            else:
+                self.set_pair(i, (tag, t))
+
+    def set_pair(self, i, pair):
+        '''Updates the (tag, time in ms) of pairing i. None for a pairing
+           that doesn't give a result.'''
+        old = self.pairs[i]
+        if old == pair:
+            return
+        self.pairs[i] = pair
+        tags = []
+        if old is not None:
+            tags.append(old[0])
+            removed = self.results[old[0]].pop(i)
+            if isinstance(removed, Entry):
+                self.count_strings(removed.row, -1)
+            elif removed is not None:
+                self.laps.remove(old[0], removed, -i)
+        if pair is not None:
+            tag, t = pair
+            tags.append(tag)
+            if self.handicap_fn is not None and t is not None:
+                h = self.handicap_fn(tag)
+                t = max(0, t - h) if h is not None else None
+            if self.numlaps > 1:
+                self.results.setdefault(tag, {})[i] = t
+                if t is not None:
+                    self.laps.add(tag, t, -i)
+            else:
+                row = self.row_fn(tag, t, 0)
+                self.count_strings(row, 1)
+                self.results.setdefault(tag, {})[i] = Entry(
+                    tag, t, (-i,), row, self.cells_fn(row))
+        # The old tag goes first, so that its entry of pairing i is out of
+        # the lists before the new one gets in
+        for tag in sorted(set(tags), key=tags.index):
+            self.update_tag(tag)
+
+    def lap_entry(self, tag):
+        '''Returns the entry of a tag in a lap race'''
+        # Laps in order of time, and most recent first for ties
+        laps = self.laps.get(tag)
+        if not laps:
+            return None
+        if len(laps) == self.numlaps or self.variablelaps:
+            total = laps[-1][0]
+        else:
+            total = None
+        row = self.row_fn(tag, total, self.laps.lap_times(tag))
+        self.count_strings(row, 1)
+        return Entry(tag, total, laps[0], row, self.cells_fn(row))
+
+    def count_strings(self, row, delta):
+        '''Counts the string values of the ranking keys of a row, and
+           switches the ranking keys between string and numeric sorting'''
+        for key, col in self.rank_cols.items():
+            if isinstance(row[col], str):
+                self.nstrings[key] += delta
+                if (self.nstrings[key] > 0) != self.stringsort[key]:
+                    self.stringsort[key] = not self.stringsort[key]
+                    self.resort(key)
+
+    def item(self, key, entry):
+        '''Returns the sort item of an entry for a ranking key'''
+        val = entry.row[self.rank_cols[key]]
+        if val is None:
+            val = '' if self.stringsort[key] else 1e20
+        # The order is unique, so entries are never compared
+        return (val, entry.order, entry)
+
+    def tag_entries(self, tag):
+        '''Returns the entries of a tag'''
+        if self.numlaps > 1:
+            return [self.lap_entries[tag]] if tag in self.lap_entries else []
+        return list(self.results.get(tag, {}).values())
+
+    def best_item(self, key, tag):
+        '''Returns the sort item of the best entry of a tag'''
+        return min((self.item(key, e) for e in self.tag_entries(tag)),
+                   default=None)
+
+    def update_tag(self, tag):
+        '''Puts the best entry of a tag in the lists'''
+        if self.numlaps > 1:
+            old = self.lap_entries.pop(tag, None)
+            if old is not None:
+                self.count_strings(old.row, -1)
+            entry = self.lap_entry(tag) if self.results.get(tag) else None
+            if entry is not None:
+                self.lap_entries[tag] = entry
+        if not self.results.get(tag):
+            self.results.pop(tag, None)
+        if tag not in self.tag_lists:
+            self.tag_lists[tag] = ['Overall'] + list(self.divisions_fn(tag))
+        best = self.best.setdefault(tag, {})
+        for key in self.rank_cols:
+            old = best.get(key)
+            new = self.best_item(key, tag)
+            if old == new:
+                continue
+            for name in self.tag_lists[tag]:
+                if self.listkey[name] == key:
+                    if old is not None:
+                        self.lists[name].remove(old)
+                    if new is not None:
+                        self.lists[name].add(new)
+                    self.versions[name] += 1
+            best[key] = new
+
+    def update_registrations(self, tags):
+        '''Recomputes the results of tags whose registration changed: their
+           rows, handicaps and divisions. Only the lists they were in or go
+           in change.'''
+        self.refresh()
+        tags = set(tags)
+        pairs = [(i, pair) for i, pair in enumerate(self.pairs)
+                 if pair is not None and pair[0] in tags]
+        # Out of the lists with their old registration...
+        for i, pair_unused in pairs:
+            self.set_pair(i, None)
+        for tag in tags:
+            self.tag_lists.pop(tag, None)
+            self.best.pop(tag, None)
+        # ...and back in with the new one
+        for i, pair in pairs:
+            self.set_pair(i, pair)
+
+    def resort(self, key):
+        '''Rebuilds the lists of a ranking key, after a change of the
+           sorting of its values'''
+        for name, listkey in self.listkey.items():
+            if listkey == key:
+                self.lists[name].clear()
+                self.versions[name] += 1
+        for tag, best in self.best.items():
+            best[key] = new = self.best_item(key, tag)
+            if new is None:
+                continue
+            for name in self.tag_lists[tag]:
+                if self.listkey[name] == key:
+                    self.lists[name].add(new)
+
+    def place(self, tag, name='Overall'):
+        '''Returns the place of a tag overall or in a division,
+           or None if it has no result there'''
+        self.refresh()
+        item = self.best.get(tag, {}).get(self.listkey[name])
+        if item is None or name not in self.tag_lists[tag]:
+            return None
+        return self.lists[name].index(item) + 1
+
+    def count(self, name='Overall'):
+        '''Returns the number of results overall or in a division'''
+        self.refresh()
+        return len(self.lists[name])
+
+    def version(self, name='Overall'):
+        '''Returns the version of the results overall or in a division,
+           which changes whenever they change'''
+        self.refresh()
+        return self.versions[name]
+
+    def ranked(self, name='Overall'):
+        '''Generates the (tag, printed row) of the results overall or in a
+           division, in order'''
+        self.refresh()
+        col = self.rank_cols[self.listkey[name]]
+        for val_unused, order_unused, entry in self.lists[name]:
+            cells = entry.cells
+            if entry.row[col] is None:
+                cells = list(cells)
+                cells[col] = '_'
+            yield entry.tag, cells
@@ -18,37 +18,134 @@
 
 #The author/copyright holder can be contacted at bletham@gmail.com
 
+'''Parsing, formatting and arithmetic of race times.
+
+   Times are handled as integer numbers of milliseconds. The string based
+   functions time_format, time_parse, time_diff and time_sum are kept as
+   thin wrappers for the code that works with displayed times.'''
+
 import datetime
-import re
+
+class RaceTime(int):
+    '''A race time, as an integer number of milliseconds.
+       It can be used where a datetime.timedelta was expected.'''
+    __slots__ = ()
+
+    def total_seconds(self):
+        '''Returns the time in seconds, as a float'''
+        return self / 1000.
+
+    def __str__(self):
+        return format_ms(self)
+
+def format_ms(ms):
+    '''formats a time in milliseconds for display, e.g. 1:02:03.4'''
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    if minutes >= 60:
+        hours, minutes = divmod(minutes, 60)
+        return '%d:%02d:%02d.%01d' % (hours, minutes, seconds, ms // 100)
+    return '%d:%02d.%01d' % (minutes, seconds, ms // 100)
+
+def _scan_ms(dt):
+    '''Slow path of parse_ms, for strings with trailing characters.
+       Reads [h:]m:s[.f] at the start of dt, like the regular expression
+       that time_parse used to use.'''
+    n = len(dt)
+    parts = []
+    ends = []
+    i = 0
+    while len(parts) < 3:
+        j = i
+        while j < n and dt[j].isdecimal():
+            j += 1
+        if j == i:
+            break
+        parts.append(int(dt[i:j]))
+        ends.append(j)
+        if j < n and dt[j] == ':':
+            i = j + 1
+        else:
+            break
+    if len(parts) < 2:
+        raise ValueError('Invalid time: ' + repr(dt))
+    if len(parts) == 2:
+        ms = (parts[0] * 60 + parts[1]) * 1000
+    else:
+        ms = ((parts[0] * 60 + parts[1]) * 60 + parts[2]) * 1000
+    i = ends[-1]
+    if i + 1 < n and dt[i] == '.' and dt[i+1].isdecimal():
+        j = i + 1
+        while j < n and dt[j].isdecimal():
+            j += 1
+        ms += int(dt[i+1:j]) * 100
+    return ms
+
+def parse_ms(dt):
+    '''converts a string time [h:]m:s[.f] to integer milliseconds.
+       The digits after the dot are tenths, as written by format_ms.
+       Negative times are read as 0. Integers are returned as they are.
+       Raises ValueError if dt is not a valid time.'''
+    if isinstance(dt, int):
+        return int(dt)
+    if dt and dt[0] == '-':
+        return 0 #we don't allow negative times
+    head, dot, frac = dt.partition('.')
+    fields = head.split(':')
+    if len(fields) == 2:
+        m, s = fields
+        if m.isdecimal() and s.isdecimal():
+            ms = (int(m) * 60 + int(s)) * 1000
+        else:
+            return _scan_ms(dt)
+    elif len(fields) == 3:
+        h, m, s = fields
+        if h.isdecimal() and m.isdecimal() and s.isdecimal():
+            ms = ((int(h) * 60 + int(m)) * 60 + int(s)) * 1000
+        else:
+            return _scan_ms(dt)
+    else:
+        return _scan_ms(dt)
+    if dot:
+        if frac.isdecimal():
+            ms += int(frac) * 100
+        else:
+            return _scan_ms(dt)
+    return ms
+
+def parse_many(times, default=None):
+    '''converts a list of string times to a list of milliseconds.
+       Times that cannot be parsed are replaced by default.'''
+    try:
+        return [parse_ms(dt) for dt in times]
+    except (ValueError, TypeError):
+        pass
+    # Some times are not valid. Go through them one by one.
+    result = []
+    for dt in times:
+        try:
+            result.append(parse_ms(dt))
+        except (ValueError, TypeError):
+            result.append(default)
+    return result
+
+def format_many(times_ms, default='_'):
+    '''formats a list of times in milliseconds. None is replaced by default.'''
+    return [default if ms is None else format_ms(ms) for ms in times_ms]
 
 def time_format(t):
     '''formats time for display in the timing window'''
-    milli = int((t - int(t)) * 10)
-    hours, rem = divmod(int(t), 3600)
-    minutes, seconds = divmod(rem, 60)
-    if hours > 0:
-        s = '%d:%02d:%02d.%01d' % (hours, minutes, seconds, milli)
-    else:
-        s = '%d:%02d.%01d' % (minutes, seconds, milli)
-    return s
+    # Rounded, since the seconds of e.g. 32.3 are 32.29999... as a float
+    return format_ms(int(round(t * 1000)))
 
 def time_parse(dt):
     '''converts string time to datetime.timedelta'''
-    if dt and dt[0] == '-':
-        return datetime.timedelta(0) #we don't allow negative times
-    d = re.match(r'((?P<hours>\d+):)?(?P<minutes>\d+):(?P<seconds>\d+)(\.(?P<milliseconds>\d+))?', dt).groupdict(0)
-    d['milliseconds'] = int(d['milliseconds'])*100  # they are actually centiseconds in the string
-    return datetime.timedelta(**dict(((key, int(value)) for key, value in d.items())))
+    return datetime.timedelta(milliseconds=parse_ms(dt))
 
 def time_diff(t1, t2):
     '''takes the diff of two string times and returns it as a time, rectified to 0. t1-t2.'''
-    delta_t = time_parse(t1) - time_parse(t2)
-    if delta_t < datetime.timedelta(0):
-        return '0:00.0'
-    else:
-        return time_format(delta_t.total_seconds())
+    return format_ms(max(0, parse_ms(t1) - parse_ms(t2)))
 
 def time_sum(t1, t2):
     '''takes the sum of two string times and returns it as a time, t1+t2.'''
-    timesum = time_parse(t1) + time_parse(t2)
-    return time_format(timesum.total_seconds())
+    return format_ms(parse_ms(t1) + parse_ms(t2))
@@ -23,8 +23,8 @@
 import logging
 import gi
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk
-import os, json, csv, re, datetime
+from gi.repository import Gtk, GLib
+import os, json, csv, re, datetime, io
 from os.path import normpath, join, dirname, abspath, basename
 import fstimer.gui.intro
 import fstimer.gui.newproject
@@ -43,6 +43,11 @@ import fstimer.gui.compileerrors
 import fstimer.gui.pretime
 import fstimer.gui.timing
 from fstimer.printer.formatter import print_startsheets
+from fstimer.reg_ops import RegistrationLoader, CompileState, CompileManifest
+from fstimer.reg_ops import build_timing_dict, content_hash, write_if_changed
+from fstimer.regdelta import RegistrationList, RegistrationLog, read_registrations
+from fstimer.regstore import RegistrationStore, store_filename, COMPILED, TIMING
+from fstimer.timinglog import TimingLog
 from collections import defaultdict
 from fstimer.gui.util_classes import MsgDialog
 
@@ -52,6 +57,12 @@ class PyTimer(object):
 
     def __init__(self):
         '''constructor method. Displays top level window'''
+        # The registration files being read by a compilation, and the
+        # registrations of the last compilation
+        self.regloader = None
+        self.compile_state = None
+        # The registration store of the project, if it uses one
+        self.store = None
         self.introwin = fstimer.gui.intro.IntroWin(self.load_project,
                                                    self.create_project)
 
@@ -95,6 +106,11 @@ class PyTimer(object):
         except KeyError:
             # fill with default
             self.printfields = {'Time': '{time}', 'ID': '{ID}'}
+        try:
+            self.regstore = regdata['regstore']
+        except KeyError:
+            # old project, with registrations in json files only
+            self.regstore = False
         
         #Move on to the main window
         self.introwin.hide()
@@ -154,16 +170,21 @@ class PyTimer(object):
             self.printfields = regdata['printfields']
         except KeyError:
             self.printfields = {}
+        try:
+            self.regstore = regdata['regstore']
+        except KeyError:
+            self.regstore = False
         self.path = normpath(join(dirname(dirname(abspath(__file__))), projectname))
         self.projecttypewin = fstimer.gui.projecttype.ProjectTypeWin(self.project_types,
                                                                      self.projecttype,
                                                                      self.numlaps,
                                                                      self.variablelaps,
+                                                                     self.regstore,
                                                                      self.back_to_new_project,
                                                                      self.define_fields,
                                                                      self.introwin)
 
-    def define_fields(self, jnk_unused, rbs, check_button, check_button2, numlapsbtn):
+    def define_fields(self, jnk_unused, rbs, check_button, check_button2, numlapsbtn, check_button3):
         '''Handled the definition of fields when creating a new project'''
         self.projecttypewin.hide()
         #First take care of the race settings from the previous window
@@ -178,6 +199,7 @@ class PyTimer(object):
         else:
             self.numlaps = 1
             self.variablelaps = False
+        self.regstore = check_button3.get_active()
         #We will use self.fields and self.fieldsdic as already loaded, but add/remove Handicap field according projecttype.
         if self.projecttype == 'handicap':
             if 'Handicap' not in self.fields:
@@ -343,6 +365,7 @@ class PyTimer(object):
         regdata['printfields'] = self.printfields
         regdata['divisions'] = self.divisions
         regdata['rankings'] = self.rankings
+        regdata['regstore'] = self.regstore
         logger.debug(regdata)
         os.makedirs(self.path, exist_ok=True)
         with open(join(self.path, basename(self.path)+'.reg'), 'w', encoding='utf-8') as fout:
@@ -378,8 +401,7 @@ class PyTimer(object):
 
     def set_registration_file(self, filename):
         '''set a preregistration file'''
-        with open(filename, 'r', encoding='utf-8') as fin:
-            self.prereg = json.load(fin)
+        self.prereg = read_registrations(filename)
 
     def handle_registration(self, regid):
         '''handles registration'''
@@ -387,14 +409,25 @@ class PyTimer(object):
         self.regid = regid
         if not hasattr(self, 'prereg'):
             self.prereg = [] #No pre-registration was selected
-        self.registrationwin = fstimer.gui.register.RegistrationWin(self.path, self.fields, self.fieldsdic, self.prereg, self.projecttype, self.save_registration)
-
-    def save_registration(self):
-        '''saves registration'''
+        # The registrations are written in full at the first save, and
+        # then only their changes, to a delta file
+        self.prereg = RegistrationList(self.prereg)
         filename = os.path.join(self.path, basename(self.path)+'_registration_'+str(self.regid)+'.json')
-        with open(filename, 'w', encoding='utf-8') as fout:
-            json.dump(self.prereg, fout)
-        return filename, True
+        self.reglog = RegistrationLog(filename, self.prereg)
+        self.registrationwin = fstimer.gui.register.RegistrationWin(self.path, self.fields, self.fieldsdic, self.prereg, self.projecttype, self.save_registration, close_registration_cb=self.close_registration)
+
+    def save_registration(self, full=True):
+        '''saves registration. Autosaves only append the changes to the
+           delta file, other saves write the registration file in full.'''
+        if full:
+            self.reglog.compact()
+        else:
+            self.reglog.save()
+        return self.reglog.filename, True
+
+    def close_registration(self):
+        '''closes registration, leaving a complete registration file'''
+        self.reglog.close()
 
     def compreg_window(self, jnk_unused):
         '''Merges registration files and create the timing dictionary.'''
@@ -408,55 +441,73 @@ class PyTimer(object):
         if not regfilelist:
             # case of an empty list : nothing to be done
             return
+        if self.regloader is not None:
+            # already compiling
+            return
         # Use labels to keep track of the status.
         self.compilewin.resetLabels()
         self.compilewin.setLabel(0, '<span color="blue">Combining registrations...</span>')
-        # This will be a list of the merged registrations
-        # each registration is a list of dictionaries
-        self.regmerge = []
-        for fname in regfilelist:
-            with open(fname, 'r', encoding='utf-8') as fin:
-                reglist = json.load(fin)
-            self.regmerge.extend(reglist)
-        # Now remove trivial dups
-        self.reg_nodups0 = [dict(tupleized) for tupleized in set(
-            tuple((field, item[field]) for field in self.fields) for item in self.regmerge)]
-        # Get rid of entries that differ only by the ID. That is, items that were in the pre-reg and had no changes except an ID was assigned in one reg file.
-        # we'll do this in O(n^2) time:-(
-        self.reg_nodups = []
-        for reg in self.reg_nodups0:
-            if reg['ID']:
-                self.reg_nodups.append(reg)
-            else:
-                # make sure there isn't an entry with everything else the same, but an ID
-                dupcheck = False
-                for i in range(len(self.reg_nodups0)):
-                    dicttmp = self.reg_nodups0[i].copy()
-                    if dicttmp['ID']:
-                        #lets make sure we aren't a dup of this one
-                        dicttmp['ID'] = ''
-                        if reg == dicttmp:
-                            dupcheck = True
-                            break
-                if not dupcheck:
-                    self.reg_nodups.append(reg)
+        # The files are read on worker threads, and their registrations
+        # merged as they arrive, so that the window stays responsive
+        # Only the files that changed since the last compilation are
+        # decoded and merged again
+        store = self.open_store()
+        if store is not None:
+            known_hashes = store.hashes(regfilelist)
+        else:
+            if self.compile_state is None or self.compile_state.fields != self.fields:
+                self.compile_state = CompileState(self.fields)
+            known_hashes = self.compile_state.hashes
+        self.regfilelist = regfilelist
+        self.regloader = RegistrationLoader(regfilelist, known_hashes=known_hashes)
+        self.nregfiles = 0
+        GLib.timeout_add(50, self.merge_compreg_poll)
+
+    def merge_compreg_poll(self):
+        '''Merges the registration files that were read since the last call.
+           Once all of them are, removes the duplicates and checks for
+           errors. Returns whether to be called again.'''
+        again = False
+        try:
+            again = self.merge_loaded()
+        except Exception as e:
+            # e.g. a file that is not a list of registrations
+            logging.getLogger('fstimer').exception('Could not combine the registrations')
+            self.compilewin.setLabel(0, '<span color="blue">Combining registrations...</span> <span color="red">Could not combine the registrations: ' + GLib.markup_escape_text(str(e)) + '</span>')
+        finally:
+            if not again and self.regloader is not None:
+                # So that the next Compile click starts over
+                self.regloader.cancel()
+                self.regloader = None
+        return again
+
+    def merge_loaded(self):
+        '''Merges the registration files that were read, and once all of
+           them are, finishes the compilation. Returns whether more files
+           are to come.'''
+        loaded = self.regloader.poll()
+        store = self.open_store()
+        for fname, digest, reglist in loaded:
+            if store is None:
+                self.compile_state.update(fname, digest, reglist)
+            elif reglist is not None:
+                store.replace(fname, reglist, digest)
+            self.nregfiles += 1
+            status = 'unchanged' if reglist is None else 'read'
+            self.compilewin.setLabel(0, '<span color="blue">Combining registrations... ' + str(self.nregfiles) + '/' + str(self.regloader.nfiles) + ' files (' + GLib.markup_escape_text(basename(fname)) + ' ' + status + ')</span>')
+        if not self.regloader.finished():
+            return True
+        self.regloader = None
+        # Now remove the duplicates
+        if store is None:
+            self.reg_nodups = self.compile_state.registrations(self.regfilelist)
+        else:
+            self.reg_nodups = store.merge(self.regfilelist)
         # Now form the Timing dictionary, and check for errors.
         self.compilewin.setLabel(1, '<span color="blue">Checking for errors...</span>')
         # the timing dictionary. keys are IDs, values are registration dictionaries
-        self.timedict = {}
         # the errors dictionary. keys are IDs, values are a list registration dictionaries with that ID
-        self.errors = {}
-        for reg in self.reg_nodups:
-            # Any registration without an ID is left out of the timing dictionary
-            if reg['ID']:
-                # have we already added this ID to the timing dictionary?
-                if reg['ID'] in self.timedict.keys():
-                    # If so, then we need to first add to the list the reg that was already stored in timedict.
-                    if reg['ID'] not in self.errors.keys():
-                        self.errors[reg['ID']] = [self.timedict[reg['ID']]]
-                    self.errors[reg['ID']].append(reg)
-                else:
-                    self.timedict[reg['ID']] = reg
+        self.timedict, self.errors = build_timing_dict(self.reg_nodups)
         # If there are errors, we must correct them
         if self.errors:
             self.compilewin.setLabel(1, '<span color="blue">Checking for errors...</span> <span color="red">Errors found!</span>')
@@ -465,6 +516,7 @@ class PyTimer(object):
         else:
             # If no errors, continue on
             self.compreg_noerrors()
+        return False
 
     def compreg_noerrors(self, errs=False):
         '''Writes registration and timing disctionnaries to the disk.
@@ -473,46 +525,112 @@ class PyTimer(object):
             self.compilewin.setLabel(1, '<span color="blue">Checking for errors... errors corrected.</span>')
         else:
             self.compilewin.setLabel(1, '<span color="blue">Checking for errors... no errors found!</span>')
-        #Now save things
+        #Now save things. Only the outputs whose content changed since the
+        #last compilation are written again.
+        manifest = CompileManifest(join(self.path, basename(self.path) + '_compile_manifest.json'))
         regfn = join(self.path, basename(self.path) + '_registration_compiled.json')
         timefn = join(self.path, basename(self.path) + '_timing_dict.json')
-        with open(regfn, 'w', encoding='utf-8') as fout:
-            json.dump(self.reg_nodups, fout)
-        with open(timefn, 'w', encoding='utf-8') as fout:
-            json.dump(self.timedict, fout)
-        print_startsheets(self, use_csv=False)
+        written = []
+        unchanged = []
+        regtext = json.dumps(self.reg_nodups)
+        if write_if_changed(manifest, regfn, regtext):
+            written.append(regfn)
+        else:
+            unchanged.append(regfn)
+        timetext = json.dumps(self.timedict)
+        timehash = content_hash(timetext.encode('utf-8'))
+        self.update_store(self.reg_nodups, content_hash(regtext.encode('utf-8')),
+                          self.timedict, timehash)
+        if write_if_changed(manifest, timefn, timetext):
+            written.append(timefn)
+        else:
+            unchanged.append(timefn)
+        # The start sheets depend on the timing dictionary and the settings
+        startsheets = [join(self.path, basename(self.path) + '_' + name + '_startsheet.html')
+                       for name in ('all', 'divisions')]
+        startsheet_hash = content_hash(json.dumps(
+            [timehash, self.fields,
+             self.fieldsdic, self.divisions, self.printfields]).encode('utf-8'))
+        if manifest.unchanged('startsheets', startsheet_hash, startsheets):
+            startsheet_msg = 'Start sheets unchanged.'
+        else:
+            print_startsheets(self, use_csv=False)
+            manifest.record('startsheets', startsheet_hash, startsheets)
+            startsheet_msg = 'Start sheets written to html.'
+        #And write the compiled registration to csv
+        csvfn = join(self.path, basename(self.path)+'_registration.csv')
+        csvout = io.StringIO()
+        dict_writer = csv.DictWriter(csvout, self.fields)
+        dict_writer.writer.writerow(self.fields)
+        dict_writer.writerows(self.reg_nodups)
+        if write_if_changed(manifest, csvfn, csvout.getvalue()):
+            written.append(csvfn)
+        else:
+            unchanged.append(csvfn)
+        manifest.save()
+        msg = ''
+        if written:
+            msg += 'Successfully wrote files:\n' + '\n'.join(written) + '\n'
+        if unchanged:
+            msg += 'Unchanged files:\n' + '\n'.join(unchanged) + '\n'
         self.compilewin.setLabel(
             2,
-            '<span color="blue">Successfully wrote files:\n' + regfn + '\n' +
-            timefn + '\n\nStart sheets written to html.\n </span>')
-        #And write the compiled registration to csv
-        with open(join(self.path, basename(self.path)+'_registration.csv'), 'w', encoding='utf-8') as fout:
-            dict_writer = csv.DictWriter(fout, self.fields)
-            dict_writer.writer.writerow(self.fields)
-            dict_writer.writerows(self.reg_nodups)
+            '<span color="blue">' + GLib.markup_escape_text(msg) + '\n' +
+            startsheet_msg + '\n </span>')
         return
 
+    def open_store(self):
+        '''Returns the registration store of the project, or None if the
+           project does not use one'''
+        if not self.regstore:
+            return None
+        filename = store_filename(self.path)
+        if (self.store is None or self.store.filename != filename or
+                self.store.fields != self.fields):
+            if self.store is not None:
+                self.store.close()
+            self.store = RegistrationStore(filename, self.fields)
+        return self.store
+
+    def update_store(self, reg, reghash, timedict, timehash):
+        '''Puts the compiled registrations and the timing dictionary in the
+           registration store, with the hashes of their json'''
+        store = self.open_store()
+        if store is None:
+            return
+        if not store.in_sync(COMPILED, reghash):
+            store.replace(COMPILED, reg, reghash)
+        if not store.in_sync(TIMING, timehash):
+            store.replace(TIMING, list(timedict.values()), timehash)
+
     def gen_pretimewin(self, jnk_unused):
         '''Selects a timing dictionary to use'''
         self.timing = defaultdict(lambda: defaultdict(str))
-        self.pretimewin = fstimer.gui.pretime.PreTimeWin(self.path, self.timing, self.gen_timewin)
+        self.pretimewin = fstimer.gui.pretime.PreTimeWin(self.path, self.timing, self.gen_timewin, self.open_store())
 
     def gen_timewin(self, passid, timebtn):
         '''The actual timing'''
         self.passid = passid
+        # The timing dictionary that was selected
+        self.timing = self.pretimewin.timing
         # we're done with pretiming
         self.pretimewin.hide()
         # We will store 'raw' data, lists of times and IDs.
-        self.rawtimes = {'times':[], 'ids':[]}
+        self.rawtimes = TimingLog()
         # create Timing window
         self.timewin = fstimer.gui.timing.TimingWin(self, timebtn)
 
     def write_updated_timing(self, reg, timedict):
         filename = os.path.join(self.path, os.path.basename(self.path)+'_registration_compiled.json')
+        regtext = json.dumps(reg)
         with open(filename, 'w', encoding='utf-8') as fout:
-            json.dump(reg, fout)
-        with open(join(self.path, basename(self.path)+'_timing_dict.json'), 'w', encoding='utf-8') as fout:
-            json.dump(timedict, fout)
+            fout.write(regtext)
+        timefn = join(self.path, basename(self.path)+'_timing_dict.json')
+        timetext = json.dumps(timedict)
+        with open(timefn, 'w', encoding='utf-8') as fout:
+            fout.write(timetext)
+        self.update_store(reg, content_hash(regtext.encode('utf-8')),
+                          timedict, content_hash(timetext.encode('utf-8')))
         with open(join(self.path, basename(self.path)+'_registration.csv'), 'w', encoding='utf-8') as fout:
             dict_writer = csv.DictWriter(fout, self.fields)
             dict_writer.writer.writerow(self.fields)
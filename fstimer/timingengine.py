@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Timing session, independent of the user interface.
+
+   TimingEngine has all of the operations of the timing window: recording
+   IDs, marking times, editing and dropping entries, merging and resuming
+   saved sessions. The window is a view over it, and it can be driven
+   without Gtk, e.g. to replay a session or to load-test it.'''
+
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from fstimer.journal import TimingJournal, replay
+from fstimer.time_ops import parse_ms, time_diff
+from fstimer.timinglog import RaceClock, TimeMark
+
+class MergeError(Exception):
+    '''Exception used in case of merging error'''
+    pass
+
+class TimingEngine(object):
+    '''A timing session: the raw IDs and times, the race clock, the count
+       of the racers checked in, and the journal of the changes'''
+
+    def __init__(self, path, rawtimes, timing, numlaps, timebtn,
+                 projecttype='standard', timestr=None, journal=True):
+        '''constructor
+           @type path: string
+           @param path: path of the project
+           @type rawtimes: TimingLog
+           @param rawtimes: raw IDs and times of the session
+           @type timing: dict
+           @param timing: registration of each ID
+           @type numlaps: int
+           @param numlaps: number of laps
+           @type timebtn: string
+           @param timebtn: the key used to mark times
+           @type projecttype: string
+           @param projecttype: 'standard' or 'handicap'
+           @type timestr: string
+           @param timestr: time string identifying the session in the file
+           names, by default the current time
+           @type journal: boolean
+           @param journal: whether to journal the changes to disk'''
+        self.path = path
+        self.rawtimes = rawtimes
+        self.timing = timing
+        self.numlaps = numlaps
+        self.timebtn = timebtn
+        self.projecttype = projecttype
+        if timestr is None:
+            #we save with the current time in the filename so no chance of being overwritten accidentally
+            timestr = re.sub(' +', '_', time.ctime()).replace(':', '')
+        self.timestr = timestr
+        # Times are marked against self.clock, which holds t0 both as a
+        # wall-clock time and as a monotonic clock reading.
+        self.t0 = 0.
+        self.clock = RaceClock.from_wall(self.t0)
+        # Every change to the raw times goes to a journal, so that the session
+        # can be recovered even if it was never saved.
+        self.journal = None
+        if journal:
+            self.journal = TimingJournal(self.filename('_times.journal'),
+                                         self.timestr, self.t0)
+            self.journal.attach(self.rawtimes)
+        self.count_racers()
+
+    def filename(self, suffix):
+        '''Returns the path of a file of this session'''
+        return os.path.join(self.path, os.path.basename(self.path) + '_' +
+                            self.timestr + suffix)
+
+    def set_clock(self, clock):
+        '''Changes the race clock'''
+        self.clock = clock
+        self.t0 = clock.wall
+        if self.journal is not None:
+            self.journal.record_t0(self.t0)
+
+    def start_clock(self):
+        '''Starts (or restarts) the race clock now'''
+        self.set_clock(RaceClock.start())
+
+    def set_t0(self, t0):
+        '''Moves the start of the race clock.
+           Times already marked keep the clock they were marked with.'''
+        self.set_clock(self.clock.moved_to(t0))
+
+    def elapsed_ms(self):
+        '''Returns the current race time, in milliseconds'''
+        return self.clock.elapsed_ms()
+
+    def count_racers(self):
+        '''Recounts the racers checked in from the IDs'''
+        # we will keep track of how many racers are still out.
+        self.racers_reg = []
+        for i_unused in range(self.numlaps):
+            self.racers_reg.append(set(self.timing.keys()))
+        self.racers_total = len(self.racers_reg[0])
+        self.racers_in = [0] * self.numlaps
+        self.lapcounter = defaultdict(int)
+        for ID in self.rawtimes.idlist:
+            self.update_racers(ID)
+
+    def update_racers(self, ID):
+        '''Updates racers_reg and racers_in after arrival of user ID'''
+        self.lapcounter[ID] += 1
+        for i in range(self.numlaps):
+            if ID in self.racers_reg[i]:
+                self.racers_reg[i].remove(ID)
+                self.racers_in[i] += 1
+                break
+
+    def enter(self, txt, mono_ns=None, skew_ns=0):
+        '''Records an entry of the entry box.
+           An ID with times in the buffer gives the oldest (that is, fastest)
+           time in the buffer to the ID
+           An ID with no times in the buffer is added to a buffer of IDs
+           An ID with the marktime symbol in it will first apply the ID
+           and then mark the time, at the given monotonic reading.
+           Returns the number of times marked.'''
+        timemarks = txt.count(self.timebtn)
+        bibid = txt.replace(self.timebtn, '')
+        self.rawtimes.add_id(bibid)
+        for jnk_unused in range(timemarks):
+            self.mark_time(mono_ns, skew_ns)
+        self.update_racers(bibid)
+        return timemarks
+
+    def mark_time(self, mono_ns=None, skew_ns=0):
+        '''Records a new time, taken now or at the given monotonic reading'''
+        mark = TimeMark.now(self.clock, mono_ns, skew_ns)
+        self.rawtimes.add_time(mark)
+        return mark
+
+    def edit_row(self, row, new_id, new_time):
+        '''Applies the edition of a row of the timing window.
+           Returns False if the row was cleared, True if it must show
+           (new_id, new_time). Raises ValueError for an invalid time.'''
+        if not re.match('^[0-9:.]*$', new_time):
+            raise ValueError('Time is not valid format.')
+        keep = self.rawtimes.edit_row(row, new_id, new_time)
+        #reset lapcounter, if used..
+        if self.numlaps > 1:
+            self.lapcounter = defaultdict(int)
+            self.lapcounter.update(self.rawtimes.id_counts())
+        return keep
+
+    def shift_times(self, rows, operation, timestr):
+        '''Adds (operation 'ADD') or subtracts (operation 'SUBTRACT') timestr
+           to the times of the given rows.
+           Returns the list of (row, new time) of the rows changed.'''
+        try:
+            delta = parse_ms(timestr)
+        except ValueError:
+            return []
+        if operation == 'SUBTRACT':
+            delta = -delta
+        changed = []
+        for row in rows:
+            timeidx = self.rawtimes.time_index(row)
+            if timeidx is None:
+                # There is no time in this row
+                continue
+            try:
+                changed.append((row, str(self.rawtimes.shift_time(timeidx, delta))))
+            except ValueError:
+                # This will happen for instance if the row has a blank time
+                pass
+        return changed
+
+    def drop_id(self, row):
+        '''Drops the ID of a row, shifting all later IDs down earlier in
+           the list. Returns its index in the IDs, None if the row has none.'''
+        ididx = self.rawtimes.id_index(row)
+        if ididx is not None:
+            self.rawtimes.pop_id(ididx)
+        return ididx
+
+    def drop_time(self, row):
+        '''Drops the time of a row, shifting all later times down earlier in
+           the list. Returns its index in the times, None if the row has none.'''
+        timeidx = self.rawtimes.time_index(row)
+        if timeidx is not None:
+            self.rawtimes.pop_time(timeidx)
+        return timeidx
+
+    def merge(self, newrawtimes):
+        '''Merges saved IDs into the times, or saved times into the IDs'''
+        if self.rawtimes.idlist and not self.rawtimes.timelist:
+            if newrawtimes['times'] and not newrawtimes['ids']:
+                #Merge! We have IDs, merge in times.
+                self.rawtimes.set_times(newrawtimes['times'], newrawtimes.get('marks'))
+            else:
+                raise MergeError('Must be pure IDs merged into pure times, or vice versa')
+        elif self.rawtimes.timelist and not self.rawtimes.idlist:
+            if newrawtimes['ids'] and not newrawtimes['times']:
+                #Merge! We have times, merge in IDS.
+                self.rawtimes.set_ids(newrawtimes['ids'])
+            else:
+                raise MergeError('Must be pure IDs merged into pure times, or vice versa')
+        else:
+            raise MergeError('Must be pure IDs merged into pure times, or vice versa')
+        self.count_racers()
+
+    def resume(self, saveresults):
+        '''Resumes a saved session'''
+        self.rawtimes.load(saveresults['rawtimes'])
+        #self.timestr = saveresults['timestr'] #We will _not_ overwrite when resuming.
+        self.set_clock(RaceClock.from_wall(saveresults['t0']))
+        self.count_racers()
+
+    def load(self, filename, merge):
+        '''Resumes, or merges in, a session saved to a _times.json file or
+           recorded in a _times.journal file'''
+        if filename.endswith('.journal'):
+            # Recover a session from its journal
+            saveresults = replay(filename)
+        else:
+            with open(filename, 'r', encoding='utf-8') as fin:
+                saveresults = json.load(fin)
+        if merge:
+            self.merge(saveresults['rawtimes'])
+        else:
+            self.resume(saveresults)
+
+    def save(self):
+        '''Saves the session to its _times.json file, and returns its name'''
+        saveresults = {}
+        saveresults['rawtimes'] = self.rawtimes.as_dict()
+        saveresults['timestr'] = self.timestr
+        saveresults['t0'] = self.t0
+        filename = self.filename('_times.json')
+        with open(filename, 'w', encoding='utf-8') as fout:
+            json.dump(saveresults, fout)
+        return filename
+
+    def close(self):
+        '''Closes the journal'''
+        if self.journal is not None:
+            self.journal.close()
+
+    def corrected_time(self, bibid, st):
+        '''Returns the handicap corrected time of an entry, '' if unknown'''
+        if st and self.timing[bibid]['Handicap']:
+            try:
+                return time_diff(st, self.timing[bibid]['Handicap'])
+            except ValueError:
+                #Handicap is present but is not formatted correctly.
+                return ''
+        return ''
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Storage of the raw IDs and times recorded during a timing session'''
+
+import time
+from collections import Counter
+from fstimer.time_ops import RaceTime, format_ms, parse_ms
+
+class RaceClock(object):
+    '''The start of the race clock, both as a wall-clock epoch (t0, as
+       shown to the user) and as a time.monotonic_ns() reading, which is
+       what the time marks are measured against.'''
+
+    def __init__(self, wall, mono_ns):
+        '''constructor
+           @type wall: float
+           @param wall: start time, in seconds since the epoch
+           @type mono_ns: int
+           @param mono_ns: start time, as a time.monotonic_ns() reading'''
+        self.wall = wall
+        self.mono_ns = mono_ns
+
+    @classmethod
+    def start(cls):
+        '''Returns a clock starting now'''
+        return cls(time.time(), time.monotonic_ns())
+
+    @classmethod
+    def from_wall(cls, wall):
+        '''Returns a clock that started at a given wall-clock time'''
+        return cls(wall, time.monotonic_ns() - int((time.time() - wall) * 1e9))
+
+    def moved_to(self, wall):
+        '''Returns a new clock starting at another wall-clock time'''
+        return RaceClock(wall, self.mono_ns + int((wall - self.wall) * 1e9))
+
+    def elapsed_ms(self, mono_ns=None):
+        '''Returns the milliseconds elapsed since the start, until now
+           or until the given time.monotonic_ns() reading'''
+        if mono_ns is None:
+            mono_ns = time.monotonic_ns()
+        return (mono_ns - self.mono_ns) // 1000000
+
+class TimeMark(object):
+    '''A time marked during the race.
+       It keeps the raw monotonic and wall-clock readings, and the clock it
+       was measured against, so that the displayed string is only derived
+       when needed and sub-tenth precision is kept for ranking.
+       offset_ms accumulates the block edits made to the mark.
+       skew_ns is the time between the key press and the moment it was
+       handled by the timing window, for marks taken from input events.'''
+    __slots__ = ('mono_ns', 'wall', 'clock', 'offset_ms', 'skew_ns')
+
+    def __init__(self, mono_ns, wall, clock, offset_ms=0, skew_ns=0):
+        self.mono_ns = mono_ns
+        self.wall = wall
+        self.clock = clock
+        self.offset_ms = offset_ms
+        self.skew_ns = skew_ns
+
+    @classmethod
+    def now(cls, clock, mono_ns=None, skew_ns=0):
+        '''Returns a mark taken now, or at the given monotonic reading'''
+        if mono_ns is None:
+            mono_ns = time.monotonic_ns()
+        return cls(mono_ns, time.time() - (time.monotonic_ns() - mono_ns) / 1e9,
+                   clock, skew_ns=skew_ns)
+
+    @property
+    def ms(self):
+        '''Race time of the mark, in milliseconds'''
+        return max(0, self.clock.elapsed_ms(self.mono_ns) + self.offset_ms)
+
+    def shift(self, delta_ms):
+        '''Adds delta_ms to the mark. The result is rectified to 0.'''
+        ms = self.ms
+        self.offset_ms += max(0, ms + delta_ms) - ms
+
+    def __str__(self):
+        return format_ms(self.ms)
+
+    def to_json(self):
+        '''Returns a json-serializable form of the mark'''
+        return [self.mono_ns, self.wall, self.clock.mono_ns, self.clock.wall,
+                self.offset_ms, self.skew_ns]
+
+    @classmethod
+    def from_json(cls, data, clocks=None):
+        '''Builds a mark from its to_json() form. clocks is a dictionary used
+           to share the RaceClock objects between marks.'''
+        mono_ns, wall, clock_mono_ns, clock_wall, offset_ms = data[:5]
+        skew_ns = data[5] if len(data) > 5 else 0
+        if clocks is None:
+            clocks = {}
+        key = (clock_mono_ns, clock_wall)
+        if key not in clocks:
+            clocks[key] = RaceClock(clock_wall, clock_mono_ns)
+        return cls(mono_ns, wall, clocks[key], offset_ms, skew_ns)
+
+class EventClock(object):
+    '''Converts the timestamps of input events, which are milliseconds on
+       the clock of the windowing system, to time.monotonic_ns() readings.
+       The offset between the two clocks is estimated from the event that
+       was handled the fastest, so the other events show how late they were
+       handled. That latency (the skew) is kept in a few statistics.
+       It is measured from the fastest event, which is itself a little late,
+       so the skews are lower bounds. The clock can be seeded with an event
+       seen before the timing starts, so that the first key presses are not
+       their own reference.'''
+
+    def __init__(self):
+        self.offset_ns = None
+        self.last_event_ms = None
+        self.count = 0
+        self.total_skew_ns = 0
+        self.max_skew_ns = 0
+
+    def seed(self, event_ms, handled_ns=None):
+        '''Estimates the offset from an event that is not timed, given its
+           timestamp and when it was handled (default now)'''
+        if handled_ns is None:
+            handled_ns = time.monotonic_ns()
+        self.last_event_ms = event_ms
+        self.offset_ns = handled_ns - event_ms * 1000000
+
+    def to_monotonic(self, event_ms, handled_ns=None):
+        '''Returns the monotonic reading at which an event happened, and its
+           skew, given its timestamp and when it was handled (default now).'''
+        if handled_ns is None:
+            handled_ns = time.monotonic_ns()
+        if self.last_event_ms is not None and event_ms < self.last_event_ms:
+            # The 32 bits event clock wrapped around
+            self.offset_ns = None
+        self.last_event_ms = event_ms
+        offset_ns = handled_ns - event_ms * 1000000
+        if self.offset_ns is None or offset_ns < self.offset_ns:
+            self.offset_ns = offset_ns
+        mono_ns = event_ms * 1000000 + self.offset_ns
+        skew_ns = handled_ns - mono_ns
+        self.count += 1
+        self.total_skew_ns += skew_ns
+        self.max_skew_ns = max(self.max_skew_ns, skew_ns)
+        return mono_ns, skew_ns
+
+    def summary(self):
+        '''Returns a one line description of the skew statistics.
+           The skews are relative to the fastest handled event (or the seed),
+           whose own latency is unknown: they are biased low by it.'''
+        if not self.count:
+            return 'no input events'
+        return ('%d input events, skew mean %.1f ms, max %.1f ms '
+                '(relative to the fastest event)') % (
+            self.count, self.total_skew_ns / self.count / 1e6, self.max_skew_ns / 1e6)
+
+def time_to_json(t):
+    '''json form of an entry of the times: a string, or a TimeMark'''
+    return t.to_json() if isinstance(t, TimeMark) else t
+
+def time_from_json(data, clocks=None):
+    '''Inverse of time_to_json'''
+    return TimeMark.from_json(data, clocks) if isinstance(data, list) else data
+
+class TimingLog(object):
+    '''The raw IDs and times of a timing session.
+       IDs and times are kept in the order they were entered, so that
+       recording a new one is an O(1) append. Rows are addressed as in the
+       timing window, where row 0 is the most recent entry.
+       The times are either TimeMark objects, for times marked live, or
+       strings, for times that were typed in or loaded from an old file.
+       log['ids'] and log['times'] still give the historical newest-first
+       lists of strings, which is what gets saved to the _times.json files.
+       If a journal is attached, every change is written to it, and the
+       watchers are told which (ID, time) pairings may have changed.'''
+
+    def __init__(self, ids=None, times=None):
+        '''constructor
+           @type ids: list
+           @param ids: IDs, oldest first
+           @type times: list
+           @param times: times, oldest first'''
+        self.idlist = list(ids) if ids else []
+        self.timelist = list(times) if times else []
+        self.journal = None
+        self.watchers = []
+
+    @classmethod
+    def from_dict(cls, rawtimes):
+        '''Builds a log from a {'times': [...], 'ids': [...]} dictionary,
+           in which the newest entries are at the start of the lists'''
+        log = cls()
+        log.load(rawtimes)
+        return log
+
+    def record(self, op, *args):
+        '''Writes a change to the journal, if there is one'''
+        if self.journal is not None:
+            self.journal.record(op, *args)
+
+    def snapshot(self):
+        '''Writes the whole log to the snapshot of the journal, if there is
+           one. Used after the changes that replace a whole list, rather
+           than journaling all of its entries.'''
+        if self.journal is not None:
+            self.journal.compact()
+
+    def changed(self, first, last=None):
+        '''Tells the watchers that the pairings of IDs and times from the
+           oldest-first index first, up to last (excluded, None for all of
+           the following ones) may have changed.'''
+        for watcher in self.watchers:
+            watcher(first, last)
+
+    def load(self, rawtimes):
+        '''Replaces the content of the log by the one of a newest-first
+           {'times': [...], 'ids': [...]} dictionary.
+           If it has 'marks', the raw readings of the times are restored.'''
+        self.idlist = list(reversed(rawtimes['ids']))
+        self.timelist = self.restore_marks(rawtimes['times'], rawtimes.get('marks'))
+        self.snapshot()
+        self.changed(0)
+
+    @staticmethod
+    def restore_marks(times, marks):
+        '''Returns the oldest-first list of times, given the newest-first
+           strings and their (optional) json marks'''
+        if not marks or len(marks) != len(times):
+            return list(reversed(times))
+        clocks = {}
+        return [TimeMark.from_json(mark, clocks) if mark else t
+                for t, mark in zip(reversed(times), reversed(marks))]
+
+    def as_dict(self):
+        '''Returns the newest-first {'times': [...], 'ids': [...]} view,
+           with the raw readings of the times in 'marks'.'''
+        return {'times': self['times'], 'ids': self['ids'],
+                'marks': [t.to_json() if isinstance(t, TimeMark) else None
+                          for t in reversed(self.timelist)]}
+
+    def __getitem__(self, key):
+        if key == 'ids':
+            return self.idlist[::-1]
+        elif key == 'times':
+            return [str(t) for t in reversed(self.timelist)]
+        raise KeyError(key)
+
+    def synced(self):
+        '''Returns the newest-first lists of IDs and times that have a
+           counterpart. Times are in milliseconds (RaceTime) when they
+           were marked live, and strings otherwise.'''
+        # IDs and times are paired from the oldest, so the most recent
+        # entries of the longer list are the ones without a counterpart.
+        n = min(len(self.idlist), len(self.timelist))
+        ids = self.idlist[n-1::-1] if n else []
+        times = [RaceTime(t.ms) if isinstance(t, TimeMark) else t
+                 for t in (self.timelist[n-1::-1] if n else [])]
+        return ids, times
+
+    def __len__(self):
+        '''Number of rows in the timing window'''
+        return max(len(self.idlist), len(self.timelist))
+
+    @property
+    def offset(self):
+        '''Number of times waiting for an ID (negative when
+           IDs are waiting for a time): len(times) - len(ids)'''
+        return len(self.timelist) - len(self.idlist)
+
+    def id_counts(self):
+        '''Returns a Counter of how many times each ID was entered'''
+        return Counter(self.idlist)
+
+    def get_id(self, i):
+        '''Returns the i-th most recent ID'''
+        return self.idlist[-1-i]
+
+    def get_time(self, i):
+        '''Returns the i-th most recent time, as displayed'''
+        return str(self.timelist[-1-i])
+
+    def get_mark(self, i):
+        '''Returns the i-th most recent time, as stored'''
+        return self.timelist[-1-i]
+
+    def id_index(self, row):
+        '''Returns the newest-first index of the ID shown in a row,
+           or None if the row has no ID'''
+        i = row - max(0, self.offset)
+        if 0 <= i < len(self.idlist):
+            return i
+        return None
+
+    def time_index(self, row):
+        '''Returns the newest-first index of the time shown in a row,
+           or None if the row has no time'''
+        i = row - max(0, -self.offset)
+        if 0 <= i < len(self.timelist):
+            return i
+        return None
+
+    def get_row(self, row):
+        '''Returns the (ID, time) pair shown in a row, with blanks
+           where the row has no ID or no time'''
+        ididx = self.id_index(row)
+        timeidx = self.time_index(row)
+        return (self.get_id(ididx) if ididx is not None else '',
+                self.get_time(timeidx) if timeidx is not None else '')
+
+    def rows(self):
+        '''Generates the (ID, time) pairs of all rows, newest first'''
+        for row in range(len(self)):
+            yield self.get_row(row)
+
+    def add_id(self, bibid):
+        '''Records a new ID'''
+        self.record('id', bibid)
+        self.idlist.append(bibid)
+        self.changed(len(self.idlist) - 1, len(self.idlist))
+
+    def add_time(self, t):
+        '''Records a new time, a TimeMark or a string'''
+        self.record('time', time_to_json(t))
+        self.timelist.append(t)
+        self.changed(len(self.timelist) - 1, len(self.timelist))
+
+    def set_id(self, i, bibid):
+        '''Replaces the i-th most recent ID'''
+        self.record('setid', i, bibid)
+        self.idlist[-1-i] = bibid
+        self.changed(len(self.idlist) - 1 - i, len(self.idlist) - i)
+
+    def set_time(self, i, t):
+        '''Replaces the i-th most recent time'''
+        self.record('settime', i, time_to_json(t))
+        self.timelist[-1-i] = t
+        self.changed(len(self.timelist) - 1 - i, len(self.timelist) - i)
+
+    def shift_time(self, i, delta_ms):
+        '''Adds delta_ms to the i-th most recent time, rectified to 0.
+           Raises ValueError if it is not a valid time.'''
+        t = self.timelist[-1-i]
+        if not isinstance(t, TimeMark):
+            t = format_ms(max(0, parse_ms(t) + delta_ms))
+            self.set_time(i, t)
+            return t
+        self.record('shift', i, delta_ms)
+        t.shift(delta_ms)
+        self.changed(len(self.timelist) - 1 - i, len(self.timelist) - i)
+        return t
+
+    def pop_id(self, i):
+        '''Removes the i-th most recent ID, shifting the more recent ones'''
+        self.record('popid', i)
+        bibid = self.idlist.pop(-1-i)
+        self.changed(len(self.idlist) - i)
+        return bibid
+
+    def pop_time(self, i):
+        '''Removes the i-th most recent time, shifting the more recent ones'''
+        self.record('poptime', i)
+        t = self.timelist.pop(-1-i)
+        self.changed(len(self.timelist) - i)
+        return t
+
+    def set_ids(self, ids):
+        '''Replaces all of the IDs by a newest-first list'''
+        self.idlist = list(reversed(ids))
+        self.snapshot()
+        self.changed(0)
+
+    def set_times(self, times, marks=None):
+        '''Replaces all of the times by a newest-first list,
+           with their optional json marks'''
+        self.timelist = self.restore_marks(times, marks)
+        self.snapshot()
+        self.changed(0)
+
+    def edit_row(self, row, new_id, new_time):
+        '''Applies the edition of a row of the timing window.
+           Returns False if the row was cleared and must be removed from
+           the window, True if it must show (new_id, new_time).'''
+        self.record('edit', row, new_id, new_time)
+        # The row is at the same oldest-first index in both lists
+        k = len(self) - 1 - row
+        npaired = min(len(self.idlist), len(self.timelist))
+        nentries = len(self.idlist) + len(self.timelist)
+        keep = self._edit_row(row, new_id, new_time)
+        if len(self.idlist) + len(self.timelist) < nentries:
+            # Something was removed, the following pairings are shifted
+            self.changed(min(k, npaired))
+        else:
+            self.changed(min(k, npaired), k + 1)
+        return keep
+
+    def _edit_row(self, row, new_id, new_time):
+        '''edit_row, without the journal and the watchers'''
+        offset = self.offset
+        # Keep the raw mark if the time string was left as it was
+        timeidx = self.time_index(row)
+        if timeidx is not None and new_time == self.get_time(timeidx):
+            new_time = self.get_mark(timeidx)
+        if row < offset:
+            if new_id:
+                # we are putting an ID in a slot that we hadn't reached yet
+                # Fill in any other missing ones up to this point with ''.
+                self.idlist.extend(['' for i_unused in range(offset-row-1)])
+                self.idlist.append(new_id)
+                self.timelist[-1-row] = new_time
+            elif new_time:
+                # we are adjusting the time only.
+                self.timelist[-1-row] = new_time
+            else:
+                # we are clearing this entry.
+                self.timelist.pop(-1-row)
+                return False
+        elif row == offset and new_time and not new_id:
+            # then we are clearing the most recent ID, and adjusting the time.
+            self.idlist.pop()
+            self.timelist[-1-row] = new_time
+        elif row < -offset:
+            # Here we are making edits to a slot where there is an ID, but no time.
+            if new_time:
+                #we are putting a time in a slot that we hadn't reached yet. Fill in any other missing ones up to this point with blanks.
+                self.timelist.extend(['' for i_unused in range(-offset-row-1)])
+                self.timelist.append(new_time)
+                self.idlist[-1-row] = new_id
+            elif new_id:
+                #we are adjusting the id only.
+                self.idlist[-1-row] = new_id
+            else:
+                #we are clearing this entry.
+                self.idlist.pop(-1-row)
+                return False
+        else:
+            ididx = row - max(0, offset)
+            timeidx = row - max(0, -offset)
+            if not new_time and not new_id:
+                # we are clearing the entry
+                self.idlist.pop(-1-ididx)
+                self.timelist.pop(-1-timeidx)
+                return False
+            else:
+                # adjust the entry; no changes to the alignment otherwise.
+                self.idlist[-1-ididx] = new_id
+                self.timelist[-1-timeidx] = new_time
+        return True
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+
+'''Tests of the timing journal: a session must be rebuilt from its journal
+   and snapshot after a crash, whenever it happens.'''
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from fstimer.journal import TimingJournal, replay, snapshot_filename
+from fstimer.timinglog import TimingLog, TimeMark, RaceClock
+
+# Number of random sessions
+NSEEDS = 100
+
+def random_edit(log, rnd, clock):
+    '''Applies a random change of the timing window to a log'''
+    r = rnd.random()
+    if r < 0.3 or not len(log):
+        log.add_id(str(rnd.randint(1, 50)))
+    elif r < 0.5:
+        log.add_time(TimeMark(rnd.randint(0, 10**12), 0., clock))
+    elif r < 0.6:
+        log.add_time('0:%02d.%d' % (rnd.randint(0, 59), rnd.randint(0, 9)))
+    elif r < 0.7:
+        log.edit_row(rnd.randrange(len(log)), rnd.choice(['', '3']),
+                     rnd.choice(['', '1:00.0']))
+    elif r < 0.8 and log.timelist:
+        try:
+            log.shift_time(rnd.randrange(len(log.timelist)),
+                           rnd.randint(-5000, 5000))
+        except ValueError:
+            pass  # a blank time left by edit_row
+    elif r < 0.85 and log.idlist:
+        log.pop_id(rnd.randrange(len(log.idlist)))
+    elif r < 0.9 and log.timelist:
+        log.pop_time(rnd.randrange(len(log.timelist)))
+    elif log.idlist:
+        log.set_id(rnd.randrange(len(log.idlist)), str(rnd.randint(1, 50)))
+
+class TimingJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'race_1_times.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def new_journal(self, log, min_compaction=1000):
+        '''Returns a journal attached to log, which is closed at the end
+           of the test'''
+        journal = TimingJournal(self.filename, 'ts', 0.,
+                                min_compaction=min_compaction)
+        journal.attach(log)
+        self.addCleanup(journal.close)
+        return journal
+
+    def test_replay_after_crash(self):
+        for seed in range(NSEEDS):
+            rnd = random.Random(seed)
+            clock = RaceClock.from_wall(0.)
+            log = TimingLog()
+            journal = self.new_journal(log, rnd.choice([3, 10, 1000]))
+            for step in range(rnd.randint(0, 200)):
+                random_edit(log, rnd, clock)
+                if rnd.random() < 0.02:
+                    journal.record_t0(float(step))
+            # The journal is not closed: only what was flushed is on disk
+            saveresults = replay(self.filename)
+            self.assertEqual(saveresults['rawtimes'], log.as_dict(), seed)
+            self.assertEqual(saveresults['t0'], journal.t0, seed)
+            journal.close()
+
+    def test_cut_last_line(self):
+        log = TimingLog()
+        journal = self.new_journal(log)
+        log.add_id('1')
+        expected = log.as_dict()
+        log.add_id('2')
+        journal.fout.close()
+        # The crash happened in the middle of the last line
+        with open(self.filename, 'r+', encoding='utf-8') as fout:
+            fout.truncate(os.path.getsize(self.filename) - 5)
+        self.assertEqual(replay(self.filename)['rawtimes'], expected)
+
+    def test_crash_before_truncation(self):
+        log = TimingLog()
+        journal = self.new_journal(log, min_compaction=5)
+        for i in range(5):
+            log.add_id(str(i))
+        with open(self.filename, 'r', encoding='utf-8') as fin:
+            events = fin.read()
+        log.add_id('5')  # compacts the 5 previous events
+        self.assertEqual(journal.nevents, 1)
+        with open(snapshot_filename(self.filename), 'r',
+                  encoding='utf-8') as fin:
+            self.assertEqual(json.load(fin)['seq'], 5)
+        # The crash happened after the snapshot was written, and before
+        # the journal was truncated: its events must not be replayed twice
+        journal.fout.close()
+        with open(self.filename, 'r+', encoding='utf-8') as fout:
+            tail = fout.read()
+            fout.seek(0)
+            fout.write(events + tail)
+        self.assertEqual(replay(self.filename)['rawtimes'], log.as_dict())
+
+    def test_load_goes_to_snapshot(self):
+        log = TimingLog()
+        journal = self.new_journal(log)
+        log.add_id('1')
+        log.load({'ids': [str(i) for i in range(1000)], 'times': []})
+        log.set_times(['0:%02d.0' % (i % 60) for i in range(1000)])
+        # The loaded lists are in the snapshot, not in the journal
+        self.assertEqual(os.path.getsize(self.filename), 0)
+        self.assertEqual(journal.nevents, 0)
+        log.add_time('1:00.0')
+        self.assertEqual(replay(self.filename)['rawtimes'], log.as_dict())
+
+    def test_sync_skips_clean_ticks(self):
+        log = TimingLog()
+        journal = self.new_journal(log)
+        with mock.patch('fstimer.journal.os.fsync') as fsync:
+            for i_unused in range(3):
+                self.assertTrue(journal.sync())
+            self.assertEqual(fsync.call_count, 0)
+            log.add_id('1')
+            journal.sync()
+            journal.sync()
+            self.assertEqual(fsync.call_count, 1)
+        journal.close()
+        self.assertFalse(journal.sync())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+
+'''Tests of the removal of duplicate registrations'''
+
+import random
+import unittest
+from fstimer.reg_ops import DuplicateRemover, remove_duplicates
+
+# Number of random sets of registrations
+NSEEDS = 300
+
+FIELDS = ['Last name', 'First name', 'Age', 'ID']
+
+def quadratic_remove_duplicates(regmerge, fields):
+    '''The removal of duplicates as it used to be done, in O(n^2) time.
+       The order of the registrations is not defined.'''
+    reg_nodups0 = [dict(tupleized) for tupleized in set(
+        tuple((field, item[field]) for field in fields) for item in regmerge)]
+    reg_nodups = []
+    for reg in reg_nodups0:
+        if reg['ID']:
+            reg_nodups.append(reg)
+        else:
+            dupcheck = False
+            for i in range(len(reg_nodups0)):
+                dicttmp = reg_nodups0[i].copy()
+                if dicttmp['ID']:
+                    dicttmp['ID'] = ''
+                    if reg == dicttmp:
+                        dupcheck = True
+                        break
+            if not dupcheck:
+                reg_nodups.append(reg)
+    return reg_nodups
+
+def random_registrations(rnd, nregs):
+    '''Returns registrations with few distinct values, so that there are
+       many duplicates, with and without IDs'''
+    return [{'Last name': rnd.choice(['Smith', 'Lee']),
+             'First name': rnd.choice(['Ann', 'Bob', '']),
+             'Age': str(rnd.randint(30, 32)),
+             'ID': rnd.choice(['', '', '1', '2'])}
+            for i_unused in range(nregs)]
+
+def sort_key(reg):
+    return tuple(reg[field] for field in FIELDS)
+
+class DuplicateRemoverTest(unittest.TestCase):
+
+    def test_as_quadratic(self):
+        for seed in range(NSEEDS):
+            rnd = random.Random(seed)
+            regmerge = random_registrations(rnd, rnd.randint(0, 60))
+            nodups = remove_duplicates(regmerge, FIELDS)
+            self.assertEqual(sorted(nodups, key=sort_key),
+                             sorted(quadratic_remove_duplicates(regmerge, FIELDS),
+                                    key=sort_key), seed)
+            # The registrations are kept in the order they first appear
+            order = {}
+            for reg in regmerge:
+                order.setdefault(sort_key(reg), len(order))
+            self.assertEqual([order[sort_key(reg)] for reg in nodups],
+                             sorted(order[sort_key(reg)] for reg in nodups))
+
+    def test_named_lists(self):
+        for seed in range(NSEEDS):
+            rnd = random.Random(seed)
+            remover = DuplicateRemover(FIELDS)
+            lists = {}
+            for step_unused in range(rnd.randint(1, 10)):
+                name = rnd.choice(['a', 'b', 'c', 'd'])
+                if rnd.random() < 0.2:
+                    remover.remove(name)
+                    lists.pop(name, None)
+                else:
+                    lists[name] = random_registrations(rnd, rnd.randint(0, 20))
+                    remover.add(lists[name], name)
+                names = rnd.sample(['a', 'b', 'c', 'd'], rnd.randint(0, 4))
+                regmerge = [reg for name in names for reg in lists.get(name, [])]
+                self.assertEqual(remover.registrations(names),
+                                 remove_duplicates(regmerge, FIELDS), seed)
+
+    def test_id_assigned(self):
+        prereg = {'Last name': 'Smith', 'First name': 'Ann', 'Age': '31',
+                  'ID': ''}
+        assigned = dict(prereg, ID='12')
+        other = dict(prereg, Age='32')
+        self.assertEqual(remove_duplicates([prereg, other, assigned, prereg],
+                                           FIELDS), [other, assigned])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Tests of the registration files saved as a base and a log of changes'''
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from fstimer.regdelta import (RegistrationList, RegistrationLog,
+                              read_registrations, delta_filename)
+
+# Number of random sequences of edits
+NSEEDS = 200
+
+def random_edit(reglist, rnd, step):
+    '''Applies a random edit of the registration window to a list, with
+       now and then a list operation that forces a compaction'''
+    r = rnd.random()
+    reg = {'ID': str(rnd.randint(0, 99)), 'Name': 'name %d' % step}
+    if r < 0.35 or not reglist:
+        reglist.append(reg)
+    elif r < 0.6:
+        reglist[rnd.randrange(-len(reglist), len(reglist))] = reg
+    elif r < 0.8:
+        reglist.pop(rnd.randrange(-len(reglist), len(reglist)))
+    elif r < 0.85:
+        del reglist[rnd.randrange(len(reglist))]
+    elif r < 0.9:
+        reglist.sort(key=lambda reg: reg['ID'])
+    elif r < 0.95:
+        reglist[:2] = [reg]
+    else:
+        reglist.insert(rnd.randrange(len(reglist) + 1), reg)
+
+class RegistrationLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'race_registration_1.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def new_log(self, nregs, min_compaction=5):
+        '''Returns a RegistrationList of nregs registrations and its log'''
+        reglist = RegistrationList({'ID': str(i), 'Name': 'prereg %d' % i}
+                                   for i in range(nregs))
+        return reglist, RegistrationLog(self.filename, reglist, min_compaction)
+
+    def delta_lines(self):
+        '''Returns the lines of the delta file'''
+        with open(delta_filename(self.filename), 'r', encoding='utf-8') as fin:
+            return fin.read().splitlines()
+
+    def test_random_edits(self):
+        for seed in range(NSEEDS):
+            rnd = random.Random(seed)
+            reglist, log = self.new_log(rnd.randint(0, 30),
+                                        rnd.choice([5, 50]))
+            for step in range(rnd.randint(1, 100)):
+                if rnd.random() < 0.25:
+                    log.save()
+                    self.assertEqual(read_registrations(self.filename),
+                                     list(reglist), 'seed %d, step %d' % (seed, step))
+                else:
+                    random_edit(reglist, rnd, step)
+            log.save()
+            self.assertEqual(read_registrations(self.filename), list(reglist))
+
+    def test_changes_are_appended(self):
+        reglist, log = self.new_log(10, min_compaction=100)
+        log.save()
+        reglist.append({'ID': '11', 'Name': 'new'})
+        reglist[0] = {'ID': '0', 'Name': 'edited'}
+        reglist.pop(-2)
+        log.save()
+        self.assertEqual(len(self.delta_lines()), 4)
+        self.assertEqual(read_registrations(self.filename), list(reglist))
+
+    def test_list_operations_compact(self):
+        for operation in (lambda reglist: reglist.sort(key=lambda reg: reg['Name']),
+                          lambda reglist: reglist.__delitem__(3),
+                          lambda reglist: reglist.reverse()):
+            reglist, log = self.new_log(10, min_compaction=100)
+            log.save()
+            reglist.append({'ID': '11', 'Name': 'new'})
+            operation(reglist)
+            log.save()
+            # Only the header is left in the delta file
+            self.assertEqual(len(self.delta_lines()), 1)
+            with open(self.filename, 'r', encoding='utf-8') as fin:
+                self.assertEqual(json.load(fin), list(reglist))
+            self.assertEqual(read_registrations(self.filename), list(reglist))
+
+    def test_cut_off_last_line(self):
+        reglist, log = self.new_log(10, min_compaction=100)
+        log.save()
+        reglist.append({'ID': '11', 'Name': 'new'})
+        log.save()
+        saved = list(reglist)
+        # A crash in the middle of writing a change
+        with open(delta_filename(self.filename), 'a', encoding='utf-8') as fout:
+            fout.write('["edit", 3, {"ID": "3", "Na')
+        self.assertEqual(read_registrations(self.filename), saved)
+
+    def test_stale_delta(self):
+        reglist, log = self.new_log(10, min_compaction=100)
+        log.save()
+        reglist.append({'ID': '11', 'Name': 'new'})
+        log.save()
+        with open(delta_filename(self.filename), 'rb') as fin:
+            stale = fin.read()
+        # A crash after the base was written again, before its new delta
+        # file replaced the old one
+        reglist.sort(key=lambda reg: reg['Name'])
+        log.save()
+        with open(delta_filename(self.filename), 'wb') as fout:
+            fout.write(stale)
+        self.assertEqual(read_registrations(self.filename), list(reglist))
+
+    def test_close(self):
+        reglist, log = self.new_log(10, min_compaction=100)
+        log.save()
+        # Entries of the day, autosaved to the delta file
+        reglist.append({'ID': '11', 'Name': 'new'})
+        reglist[2] = {'ID': '2', 'Name': 'edited'}
+        log.save()
+        saved = list(reglist)
+        # Not saved
+        reglist.pop(0)
+        log.close()
+        # The registration file is copied without its delta file
+        os.remove(delta_filename(self.filename))
+        with open(self.filename, 'r', encoding='utf-8') as fin:
+            self.assertEqual(json.load(fin), saved)
+        self.assertEqual(read_registrations(self.filename), saved)
+
+    def test_explicit_save(self):
+        reglist, log = self.new_log(10, min_compaction=100)
+        log.save()
+        reglist.append({'ID': '11', 'Name': 'new'})
+        log.compact()
+        self.assertEqual(len(self.delta_lines()), 1)
+        with open(self.filename, 'r', encoding='utf-8') as fin:
+            self.assertEqual(json.load(fin), list(reglist))
+
+    def test_bad_header(self):
+        reglist, log = self.new_log(3)
+        log.save()
+        with open(delta_filename(self.filename), 'w', encoding='utf-8') as fout:
+            fout.write('{"ba\n["remove", 0]\n')
+        self.assertEqual(read_registrations(self.filename), list(reglist))
+
+if __name__ == '__main__':
+    unittest.main()
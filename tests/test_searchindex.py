@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+
+'''Tests of the search index of the registration window'''
+
+import random
+import unittest
+from fstimer.searchindex import SearchIndex
+
+# Number of random sets of registrations
+NSEEDS = 100
+
+FIELDS = ['Last name', 'First name', 'Email', 'ID']
+
+NAMES = ['Sean', 'Ann', 'Anne', 'Lee', 'Leary', 'Ng', 'O', 'McKean', 'Éa']
+
+def random_registration(rnd):
+    first = rnd.choice(NAMES)
+    last = rnd.choice(NAMES)
+    return {'Last name': last, 'First name': first,
+            'Email': rnd.choice(['', '%s.%s@example.org' % (first, last)]),
+            'ID': rnd.choice([None, '', str(rnd.randint(1, 200))])}
+
+def brute_search(index, query, field=None):
+    '''The keys of all of the registrations matching a query'''
+    return set(key for key in index.docs if index.matches(key, query, field))
+
+class SearchIndexTest(unittest.TestCase):
+
+    def test_short_words(self):
+        index = SearchIndex(FIELDS)
+        index.add(1, {'Last name': 'Connery', 'First name': 'Sean',
+                      'Email': 'sean@c.uk', 'ID': '7'})
+        index.add(2, {'Last name': 'Ng', 'First name': 'Ann',
+                      'Email': '', 'ID': '17'})
+        self.assertEqual(index.search('ea'), {1})
+        self.assertEqual(index.search('@'), {1})
+        self.assertEqual(index.search('.'), {1})
+        self.assertEqual(index.search('n'), {1, 2})
+        self.assertEqual(index.search('NG'), {2})
+        self.assertEqual(index.search('7'), {1, 2})
+        self.assertEqual(index.search('7', 'ID'), {1, 2})
+        self.assertEqual(index.search('17', 'ID'), {2})
+        self.assertEqual(index.search('sean ann'), set())
+        self.assertEqual(index.search('  '), {1, 2})
+        # A word does not span two fields
+        self.assertEqual(index.search('nsean'), set())
+
+    def test_random_queries(self):
+        for seed in range(NSEEDS):
+            rnd = random.Random(seed)
+            index = SearchIndex(FIELDS)
+            keys = list(range(rnd.randint(0, 50)))
+            for key in keys:
+                index.add(key, random_registration(rnd))
+            for step_unused in range(20):
+                r = rnd.random()
+                if r < 0.2 and keys:
+                    index.update(rnd.choice(keys), random_registration(rnd))
+                elif r < 0.3 and keys:
+                    index.remove(keys.pop(rnd.randrange(len(keys))))
+                field = rnd.choice([None, None, 'First name', 'Email'])
+                words = [rnd.choice(NAMES + ['@', '.', 'org']).lower()
+                         for i_unused in range(rnd.randint(1, 2))]
+                # Type the query one character at a time
+                query = ''
+                for c in ' '.join(words):
+                    query += c
+                    self.assertEqual(index.search(query, field),
+                                     brute_search(index, query, field),
+                                     (seed, query, field))
+                # And erase it again
+                while query:
+                    query = query[:-1]
+                    self.assertEqual(index.search(query, field),
+                                     brute_search(index, query, field),
+                                     (seed, query, field))
+
+if __name__ == '__main__':
+    unittest.main()
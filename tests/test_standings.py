@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+'''Tests of the live standings: after any edit of the raw times, the
+   printouts from the standings kept up to date must be the same as the
+   ones from standings built from scratch.'''
+
+import os
+import random
+import shutil
+import tempfile
+import types
+import unittest
+from collections import defaultdict
+from benchmarks.generate import (project_settings, gen_runners, gen_rawtimes,
+                                 PASSID)
+from bisect import bisect_left
+from fstimer.printer import formatter
+from fstimer.standings import RankList
+from fstimer.timinglog import TimingLog
+
+# Number of races, and of random edits of each
+NSEEDS = 6
+NEDITS = 120
+
+def make_pytimer(path, seed, numlaps=1, handicap=False, variablelaps=False):
+    '''Returns the settings, registrations and raw times of a small race,
+       as the printouts find them in the PyTimer'''
+    rnd = random.Random(seed)
+    pytimer = types.SimpleNamespace(**project_settings(numlaps, handicap))
+    pytimer.variablelaps = variablelaps
+    pytimer.path = path
+    pytimer.passid = PASSID
+    pytimer.timewin = types.SimpleNamespace(timestr='test')
+    pytimer.standings = None
+    runners = gen_runners(rnd.randint(0, 40), handicap, rnd)
+    pytimer.timing = defaultdict(lambda: defaultdict(str))
+    for runner in runners:
+        if handicap and rnd.random() < 0.1:
+            runner['Handicap'] = rnd.choice(['', 'bad'])
+        pytimer.timing[runner['ID']].update(runner)
+    pytimer.rawtimes = TimingLog.from_dict(gen_rawtimes(runners, numlaps, rnd))
+    return pytimer
+
+def random_edit(log, rnd, nrunners):
+    '''Applies a random edit of the timing window to a TimingLog'''
+    def bibid():
+        return rnd.choice([str(rnd.randint(1, nrunners + 2)), '', PASSID])
+    def rawtime():
+        return rnd.choice(['%d:%02d.%d' % (rnd.randint(0, 70), rnd.randint(0, 59),
+                                           rnd.randint(0, 9)), '', 'bad'])
+    op = rnd.randrange(9)
+    try:
+        if op == 0:
+            log.add_id(bibid())
+        elif op == 1:
+            log.add_time(rawtime())
+        elif op == 2 and log.idlist:
+            log.set_id(rnd.randrange(len(log.idlist)), bibid())
+        elif op == 3 and log.timelist:
+            log.set_time(rnd.randrange(len(log.timelist)), rawtime())
+        elif op == 4 and log.timelist:
+            log.shift_time(rnd.randrange(len(log.timelist)),
+                           rnd.randint(-90000, 90000))
+        elif op == 5 and log.idlist:
+            log.pop_id(rnd.randrange(len(log.idlist)))
+        elif op == 6 and log.timelist:
+            log.pop_time(rnd.randrange(len(log.timelist)))
+        elif op == 7 and len(log):
+            log.edit_row(rnd.randrange(len(log)), bibid(), rawtime())
+        elif op == 8 and rnd.random() < 0.1:
+            ids = log.idlist[::-1]
+            rnd.shuffle(ids)
+            log.set_ids(ids)
+    except ValueError:
+        pass  # e.g. shifting a time that is not valid
+
+def edit_registrations(pytimer, rnd):
+    '''Replaces the timing dictionary by one with a few registrations
+       edited, added or removed, as the registration window does'''
+    timing = defaultdict(lambda: defaultdict(str))
+    for tag, reg in pytimer.timing.items():
+        # Left out if it is only there from lookups of an unknown tag
+        if reg.get('ID'):
+            timing[tag] = dict(reg)
+    for edit_unused in range(rnd.randint(1, 3)):
+        tags = list(timing)
+        r = rnd.random()
+        if tags and r < 0.6:
+            reg = timing[rnd.choice(tags)]
+            field = rnd.choice(['Age', 'Gender', 'Club', 'First name'] +
+                               (['Handicap'] if 'Handicap' in reg else []))
+            reg[field] = rnd.choice(['', 'male', 'female', '30', '75', 'Harriers',
+                                     '1:00', 'x'])
+        elif tags and r < 0.8:
+            del timing[rnd.choice(tags)]
+        elif tags:
+            tag = str(len(tags) + rnd.randint(1, 3))
+            timing[tag] = dict(timing[rnd.choice(tags)], ID=tag)
+    pytimer.timing = timing
+
+def read_printouts(path):
+    '''Returns the content of the printouts in a directory, by file name'''
+    printouts = {}
+    for fname in os.listdir(path):
+        with open(os.path.join(path, fname), 'r', encoding='utf-8') as fin:
+            printouts[fname] = fin.read()
+    return printouts
+
+class RankListTest(unittest.TestCase):
+
+    def test_against_sorted_list(self):
+        rnd = random.Random(0)
+        # A small load, so that buckets are split and emptied often
+        ranks = RankList(load=4)
+        expected = []
+        for step in range(3000):
+            if expected and rnd.random() < 0.45:
+                item = rnd.choice(expected)
+                expected.remove(item)
+                ranks.remove(item)
+            else:
+                item = (rnd.randint(0, 200), step)
+                expected.insert(bisect_left(expected, item), item)
+                ranks.add(item)
+            self.assertEqual(len(ranks), len(expected))
+            if step % 50 == 0:
+                self.assertEqual(list(ranks), expected)
+                for k, item in enumerate(expected):
+                    self.assertEqual(ranks[k], item)
+                    self.assertEqual(ranks.index(item), k)
+                probe = (rnd.randint(0, 200), -1)
+                self.assertEqual(ranks.count_before(probe),
+                                 bisect_left(expected, probe))
+        with self.assertRaises(ValueError):
+            ranks.remove((-1, -1))
+
+class StandingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def printouts(self, pytimer, path):
+        '''Prints the results of pytimer to path and returns them. The
+           names of the printouts start with the name of the directory.'''
+        os.makedirs(path, exist_ok=True)
+        pytimer.path = path
+        for use_csv in (False, True):
+            formatter.print_times(pytimer, use_csv)
+        return read_printouts(path)
+
+    def check_edits(self, numlaps=1, handicap=False, variablelaps=False):
+        for seed in range(NSEEDS):
+            live = make_pytimer(self.path, seed, numlaps, handicap, variablelaps)
+            rnd = random.Random(seed)
+            for edit in range(NEDITS):
+                if rnd.random() < 0.1:
+                    edit_registrations(live, rnd)
+                else:
+                    random_edit(live.rawtimes, rnd, len(live.timing))
+                if rnd.random() > 0.2:
+                    continue
+                got = self.printouts(live, os.path.join(self.path, 'live', 'race'))
+                fresh = types.SimpleNamespace(**vars(live))
+                fresh.standings = None
+                expected = self.printouts(fresh, os.path.join(self.path, 'fresh', 'race'))
+                fresh.standings.close()
+                self.assertEqual(got, expected, 'seed %d, edit %d' % (seed, edit))
+            live.standings.close()
+
+    def test_edits(self):
+        self.check_edits()
+
+    def test_edits_laps(self):
+        self.check_edits(numlaps=3)
+
+    def test_edits_handicap(self):
+        self.check_edits(handicap=True)
+
+    def test_edits_variable_laps(self):
+        self.check_edits(numlaps=3, handicap=True, variablelaps=True)
+
+if __name__ == '__main__':
+    unittest.main()
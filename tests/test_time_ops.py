@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+
+'''Tests of the parsing and formatting of race times'''
+
+import datetime
+import random
+import re
+import unittest
+from fstimer.time_ops import (RaceTime, format_ms, parse_ms, parse_many,
+                              format_many, time_format, time_parse, time_diff,
+                              time_sum)
+
+def regex_parse(dt):
+    '''time_parse as it used to be, with a regular expression.
+       Returns None where it failed.'''
+    if dt and dt[0] == '-':
+        return datetime.timedelta(0)
+    match = re.match(r'((?P<hours>\d+):)?(?P<minutes>\d+):(?P<seconds>\d+)(\.(?P<milliseconds>\d+))?', dt)
+    if match is None:
+        return None
+    d = match.groupdict(0)
+    d['milliseconds'] = int(d['milliseconds'])*100
+    return datetime.timedelta(**dict(((key, int(value)) for key, value in d.items())))
+
+class TimeOpsTest(unittest.TestCase):
+
+    def test_format(self):
+        self.assertEqual(format_ms(0), '0:00.0')
+        self.assertEqual(format_ms(62399), '1:02.3')
+        self.assertEqual(format_ms(3723400), '1:02:03.4')
+        self.assertEqual(str(RaceTime(59999)), '0:59.9')
+        self.assertEqual(RaceTime(1500).total_seconds(), 1.5)
+
+    def test_round_trip(self):
+        rnd = random.Random(0)
+        for i_unused in range(10000):
+            ms = rnd.randrange(10 * 3600 * 1000)
+            # Formatting keeps the tenths
+            self.assertEqual(parse_ms(format_ms(ms)), ms - ms % 100)
+            s = format_ms(ms)
+            self.assertEqual(format_ms(parse_ms(s)), s)
+
+    def test_parse_as_regex(self):
+        rnd = random.Random(0)
+        chars = '0123456789::.-a '
+        for i_unused in range(20000):
+            dt = ''.join(rnd.choice(chars) for i in range(rnd.randint(0, 10)))
+            expected = regex_parse(dt)
+            if expected is None:
+                with self.assertRaises(ValueError, msg=dt):
+                    parse_ms(dt)
+            else:
+                self.assertEqual(time_parse(dt), expected, dt)
+
+    def test_time_format_rounds(self):
+        # 32.3 is 32.29999... as a float
+        self.assertEqual(time_format(32.3), '0:32.3')
+        for tenths in range(100000):
+            self.assertEqual(time_format(tenths / 10.), format_ms(tenths * 100))
+        # The digit shown is still the tenths, not rounded tenths
+        self.assertEqual(time_format(1.26), '0:01.2')
+        self.assertEqual(time_format(3599.99), '59:59.9')
+
+    def test_arithmetic(self):
+        self.assertEqual(time_sum('0:59.5', '0:00.7'), '1:00.2')
+        self.assertEqual(time_sum('59:59.9', '0:00.1'), '1:00:00.0')
+        self.assertEqual(time_diff('1:00.2', '0:00.7'), '0:59.5')
+        # Rectified to 0
+        self.assertEqual(time_diff('0:01.0', '0:02.0'), '0:00.0')
+        self.assertEqual(parse_ms('-0:01.0'), 0)
+
+    def test_many(self):
+        self.assertEqual(parse_many(['0:01.0', '', 'x', '1:00:00']),
+                         [1000, None, None, 3600000])
+        self.assertEqual(format_many([1000, None]), ['0:01.0', '_'])
+
+if __name__ == '__main__':
+    unittest.main()
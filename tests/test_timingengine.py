@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+
+'''Tests of the timing engine against the list operations the timing
+   window used to make on the newest-first lists of IDs and times.'''
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from fstimer.time_ops import format_ms, time_sum, time_diff
+from fstimer.timingengine import TimingEngine, MergeError
+from fstimer.timinglog import TimingLog, RaceClock
+
+# Number of random sessions
+NSEEDS = 100
+
+class ListTiming(object):
+    '''The timing window as it was, on newest-first lists of strings, and
+       the offset between the number of times and of IDs'''
+
+    def __init__(self):
+        self.ids = []
+        self.times = []
+        self.offset = 0
+
+    def enter(self, txt, times):
+        self.ids.insert(0, txt)
+        self.offset -= 1
+        for t in times:
+            self.times.insert(0, t)
+            self.offset += 1
+
+    def edit_row(self, row, new_id, new_time):
+        if row < self.offset:
+            if new_id:
+                self.ids = [new_id] + [''] * (self.offset-row-1) + self.ids
+                self.offset = row
+                self.times[row] = new_time
+            elif new_time:
+                self.times[row] = new_time
+            else:
+                self.times.pop(row)
+                self.offset -= 1
+        elif row == self.offset and new_time and not new_id:
+            self.ids.pop(0)
+            self.times[row] = new_time
+            self.offset += 1
+        elif row < -self.offset:
+            if new_time:
+                self.times = [new_time] + [''] * (-self.offset-row-1) + self.times
+                self.offset = -row
+                self.ids[row] = new_id
+            elif new_id:
+                self.ids[row] = new_id
+            else:
+                self.ids.pop(row)
+                self.offset += 1
+        elif not new_time and not new_id:
+            if self.offset > 0:
+                self.ids.pop(row-self.offset)
+                self.times.pop(row)
+            else:
+                self.ids.pop(row)
+                self.times.pop(row+self.offset)
+        elif self.offset > 0:
+            self.ids[row-self.offset] = new_id
+            self.times[row] = new_time
+        else:
+            self.ids[row] = new_id
+            self.times[row+self.offset] = new_time
+
+    def shift_times(self, rows, operation, timestr):
+        for row in rows:
+            timeidx = row - max(0, -self.offset)
+            if not 0 <= timeidx < len(self.times) or not self.times[timeidx]:
+                continue
+            if operation == 'ADD':
+                self.times[timeidx] = time_sum(self.times[timeidx], timestr)
+            else:
+                self.times[timeidx] = time_diff(self.times[timeidx], timestr)
+
+    def drop_id(self, row):
+        ididx = row - max(0, self.offset)
+        if 0 <= ididx < len(self.ids):
+            self.ids.pop(ididx)
+            self.offset += 1
+
+    def drop_time(self, row):
+        timeidx = row - max(0, -self.offset)
+        if 0 <= timeidx < len(self.times):
+            self.times.pop(timeidx)
+            self.offset -= 1
+
+class TimingEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def new_engine(self, numlaps=1, rawtimes=None, journal=False):
+        '''Returns an engine for registered IDs 1 to 30, with a clock
+           started at the monotonic reading 0'''
+        timing = {str(i): {} for i in range(1, 31)}
+        engine = TimingEngine(self.path, rawtimes or TimingLog(), timing,
+                              numlaps, '*', timestr='ts', journal=journal)
+        self.addCleanup(engine.close)
+        engine.set_clock(RaceClock(0., 0))
+        return engine
+
+    def check_same(self, engine, lists, msg):
+        self.assertEqual(engine.rawtimes['ids'], lists.ids, msg)
+        self.assertEqual(engine.rawtimes['times'], lists.times, msg)
+        self.assertEqual(engine.rawtimes.offset, lists.offset, msg)
+
+    def test_random_session(self):
+        for seed in range(NSEEDS):
+            rnd = random.Random(seed)
+            numlaps = rnd.choice([1, 3])
+            engine = self.new_engine(numlaps)
+            lists = ListTiming()
+            mono_ns = 0
+            for step in range(rnd.randint(1, 150)):
+                msg = (seed, step)
+                r = rnd.random()
+                nrows = len(engine.rawtimes)
+                if r < 0.45 or not nrows:
+                    txt = str(rnd.randint(1, 40)) + '*' * rnd.choice([0, 0, 1, 2])
+                    mono_ns += rnd.randint(1, 50) * 100000000
+                    ntimes = engine.enter(txt, mono_ns)
+                    self.assertEqual(ntimes, txt.count('*'), msg)
+                    lists.enter(txt.replace('*', ''),
+                                [format_ms(mono_ns // 1000000)] * ntimes)
+                elif r < 0.7:
+                    row = rnd.randrange(nrows)
+                    new_id = rnd.choice(['', '7', engine.rawtimes.get_row(row)[0]])
+                    new_time = rnd.choice(['', '1:02.3',
+                                           engine.rawtimes.get_row(row)[1]])
+                    engine.edit_row(row, new_id, new_time)
+                    lists.edit_row(row, new_id, new_time)
+                    if numlaps > 1:
+                        # The laps are recounted after an edit
+                        self.assertEqual(Counter(engine.lapcounter), Counter(lists.ids),
+                                         msg)
+                elif r < 0.8:
+                    rows = rnd.sample(range(nrows), rnd.randint(1, min(nrows, 5)))
+                    operation = rnd.choice(['ADD', 'SUBTRACT'])
+                    timestr = '0:%02d.%d' % (rnd.randint(0, 59), rnd.randint(0, 9))
+                    changed = engine.shift_times(rows, operation, timestr)
+                    lists.shift_times(rows, operation, timestr)
+                    for row, t in changed:
+                        self.assertEqual(engine.rawtimes.get_row(row)[1], t, msg)
+                elif r < 0.9:
+                    row = rnd.randrange(nrows)
+                    engine.drop_id(row)
+                    lists.drop_id(row)
+                else:
+                    row = rnd.randrange(nrows)
+                    engine.drop_time(row)
+                    lists.drop_time(row)
+                self.check_same(engine, lists, msg)
+
+    def test_enter_counts_racers(self):
+        engine = self.new_engine(numlaps=2)
+        for txt in ['1', '2*', '1*', '99']:
+            engine.enter(txt, 0)
+        self.assertEqual(engine.racers_in, [2, 1])
+        self.assertEqual(engine.racers_total, 30)
+        self.assertEqual(len(engine.racers_reg[0]), 28)
+        self.assertEqual(engine.lapcounter['1'], 2)
+
+    def test_invalid_time(self):
+        engine = self.new_engine()
+        engine.enter('1*', 0)
+        with self.assertRaises(ValueError):
+            engine.edit_row(0, '1', '1:0x.0')
+        self.assertEqual(engine.shift_times([0], 'ADD', 'x'), [])
+        self.assertEqual(engine.rawtimes['times'], ['0:00.0'])
+
+    def test_merge(self):
+        engine = self.new_engine()
+        for bibid in ['3', '1', '2']:
+            engine.enter(bibid)
+        engine.merge({'ids': [], 'times': ['0:12.0', '0:11.0', '0:10.0']})
+        self.assertEqual(list(engine.rawtimes.rows()),
+                         [('2', '0:12.0'), ('1', '0:11.0'), ('3', '0:10.0')])
+        self.assertEqual(engine.racers_in, [3])
+        # Once there are both IDs and times, nothing can be merged in
+        with self.assertRaises(MergeError):
+            engine.merge({'ids': ['4'], 'times': []})
+        # Times can only be merged into IDs, and IDs into times
+        engine = self.new_engine()
+        engine.enter('1')
+        with self.assertRaises(MergeError):
+            engine.merge({'ids': ['2'], 'times': []})
+
+    def test_save_and_merge_file(self):
+        engine = self.new_engine(journal=True)
+        for mono_ns in [10**9, 2*10**9]:
+            engine.mark_time(mono_ns)
+        filename = engine.save()
+        with open(filename, 'r', encoding='utf-8') as fin:
+            self.assertEqual(json.load(fin)['rawtimes']['times'],
+                             ['0:02.0', '0:01.0'])
+        engine.close()
+        shutil.move(filename, os.path.join(self.path, 'times.json'))
+        other = self.new_engine()
+        other.enter('5')
+        other.enter('6')
+        other.load(os.path.join(self.path, 'times.json'), True)
+        self.assertEqual(list(other.rawtimes.rows()),
+                         [('6', '0:02.0'), ('5', '0:01.0')])
+        # The journal has the session too
+        journal = os.path.join(self.path, os.path.basename(self.path) +
+                               '_ts_times.journal')
+        resumed = self.new_engine()
+        resumed.load(journal, False)
+        self.assertEqual(resumed.rawtimes['times'], ['0:02.0', '0:01.0'])
+
+if __name__ == '__main__':
+    unittest.main()
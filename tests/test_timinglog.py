@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+#fsTimer - free, open source software for race timing.
+#Copyright 2012-17 Ben Letham
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#The author/copyright holder can be contacted at bletham@gmail.com
+
+
+'''Tests of the conversion of input event timestamps to monotonic readings'''
+
+import unittest
+from fstimer.timinglog import EventClock
+
+MS = 1000000
+
+class EventClockTest(unittest.TestCase):
+
+    def test_fastest_event(self):
+        clock = EventClock()
+        # Handled 5 ms late: it is its own reference
+        self.assertEqual(clock.to_monotonic(1000, 1005 * MS), (1005 * MS, 0))
+        # Handled 1 ms late: the new reference, the first one was 4 ms late
+        self.assertEqual(clock.to_monotonic(2000, 2001 * MS), (2001 * MS, 0))
+        self.assertEqual(clock.to_monotonic(3000, 3011 * MS), (3001 * MS, 10 * MS))
+        self.assertEqual(clock.summary(), '3 input events, skew mean 3.3 ms, '
+                         'max 10.0 ms (relative to the fastest event)')
+
+    def test_seed(self):
+        clock = EventClock()
+        clock.seed(500, 501 * MS)
+        self.assertEqual(clock.to_monotonic(1000, 1005 * MS), (1001 * MS, 4 * MS))
+        self.assertEqual(clock.count, 1)
+        # A slower seed is replaced by the first event
+        clock = EventClock()
+        clock.seed(500, 520 * MS)
+        self.assertEqual(clock.to_monotonic(1000, 1005 * MS), (1005 * MS, 0))
+
+    def test_wrap_around(self):
+        clock = EventClock()
+        clock.to_monotonic(2**32 - 10, 10 * MS)
+        # The event clock wrapped around: the offset is estimated again
+        self.assertEqual(clock.to_monotonic(5, 30 * MS), (30 * MS, 0))
+
+    def test_no_events(self):
+        self.assertEqual(EventClock().summary(), 'no input events')
+
+if __name__ == '__main__':
+    unittest.main()